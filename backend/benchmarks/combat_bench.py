@@ -0,0 +1,158 @@
+"""
+Cost of the combat engine (backend/src/combat.py): the exact distributions of a few attack profiles,
+their vectorized Monte Carlo simulation, and the same simulation rolling one die at a time in Python.
+
+    python -m backend.benchmarks.combat_bench --trials 1000000 --python-trials 20000
+
+Also rolls 10^6 D6 at once against a Python loop. The simulations are checked against the exact distributions
+(largest difference of a probability) and for reproducibility (same seed, same result).
+The Python loop runs fewer trials, its time is scaled to --trials. Results are printed as JSON.
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from typing import Callable, Dict
+
+import numpy as np
+
+from backend.src import combat
+
+PROFILES = {
+    # 10 bolt rifles at Intercessors, models slain
+    "bolt_rifles": {"attacks": "2", "models": 10, "skill": 3, "strength": 4, "ap": 1, "damage": "1",
+                    "toughness": 4, "save": 3, "wounds_per_model": 2, "target_models": 10},
+    # Heavy weapons with random attacks and damage, Sustained and Lethal Hits, Feel No Pain
+    "heavy_weapons": {"attacks": "D6", "models": 3, "skill": 4, "strength": 9, "ap": 2, "damage": "D3+1",
+                      "sustained_hits": 1, "lethal_hits": True, "reroll_hits": "ones", "toughness": 6, "save": 3,
+                      "feel_no_pain": 5, "wounds_per_model": 3, "target_models": 6},
+    # Melee into a vehicle with Devastating Wounds and Twin-linked
+    "anti_vehicle_melee": {"attacks": "4", "models": 5, "skill": 3, "strength": 5, "ap": 1, "damage": "2",
+                           "devastating_wounds": True, "reroll_wounds": "failed", "critical_wound": 4,
+                           "toughness": 10, "save": 3, "invulnerable_save": 5, "wounds_per_model": 12,
+                           "target_models": 1},
+}
+
+
+def timed(function: Callable, repeat: int) -> float:
+    """
+    Median seconds of a call.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def d6(rng: random.Random, target: int, modifier: int, critical: int, reroll: str):
+    """
+    (critical, success) of one hit or wound roll, the rules of combat.roll_outcomes.
+    """
+    for attempt in range(2):
+        face = rng.randint(1, 6)
+        crit = face >= critical
+        success = crit or (face != 1 and face + max(-1, min(1, modifier)) >= target)
+        if attempt or not (reroll == combat.REROLL_ONES and face == 1 or reroll == combat.REROLL_FAILED and not success):
+            return crit, success
+
+
+def python_simulate(profile: combat.AttackProfile, trials: int, seed: int) -> Dict[str, np.ndarray]:
+    """
+    combat.simulate one die at a time, the way it would be written without NumPy.
+    """
+    rng = random.Random(seed)
+    roll = lambda dice: sum(rng.randint(1, dice.sides) for _ in range(dice.count)) + dice.bonus
+    totals = {name: [] for name in ("hits", "wounds", "unsaved", "damage", "models_slain")}
+    for _ in range(trials):
+        hits = wounds = unsaved = damage = slain = 0
+        left = profile.wounds_per_model
+        for _ in range(sum(roll(profile.attacks) for _ in range(profile.models))):
+            crit, hit = (False, True) if profile.torrent else d6(
+                rng, profile.skill, profile.hit_modifier, profile.critical_hit, profile.reroll_hits)
+            rolls = hit + crit * profile.sustained_hits
+            hits += rolls
+            for index in range(rolls):
+                automatic = profile.lethal_hits and crit and index == 0
+                crit_wound, wound = (False, True) if automatic else d6(
+                    rng, profile.wound_target, profile.wound_modifier, profile.critical_wound, profile.reroll_wounds)
+                if not wound:
+                    continue
+                wounds += 1
+                if not (profile.devastating_wounds and crit_wound):
+                    face = rng.randint(1, 6)
+                    if face != 1 and face >= profile.save_target:
+                        continue
+                unsaved += 1
+                points = roll(profile.damage)
+                if profile.feel_no_pain:
+                    points -= sum(rng.randint(1, 6) >= profile.feel_no_pain for _ in range(points))
+                damage += points
+                left -= points
+                if left <= 0:
+                    slain += 1
+                    left = profile.wounds_per_model
+        for name, value in zip(totals, (hits, wounds, unsaved, damage, min(slain, profile.target_models))):
+            totals[name].append(value)
+    return {name: np.bincount(values) / trials for name, values in totals.items()}
+
+
+def max_difference(first: np.ndarray, second: np.ndarray) -> float:
+    size = max(len(first), len(second))
+    return float(np.abs(np.pad(first, (0, size - len(first))) - np.pad(second, (0, size - len(second)))).max())
+
+
+def bench_profile(values: Dict, trials: int, python_trials: int, repeat: int, seed: int) -> Dict:
+    profile = combat.AttackProfile.from_dict(values)
+    exact = combat.distribution(profile)
+    simulated = combat.simulate(profile, trials, seed=seed)
+    again = combat.simulate(profile, trials, seed=seed)
+    python_seconds = timed(lambda: python_simulate(profile, python_trials, seed), 1)
+    python_result = python_simulate(profile, python_trials, seed)
+    simulate_seconds = timed(lambda: combat.simulate(profile, trials, seed=seed), repeat)
+    return {
+        "profile": profile.describe(),
+        "expected": exact.to_dict()["expected"],
+        "exact_us": round(timed(lambda: combat.distribution(profile), repeat * 20) * 1e6, 1),
+        "simulate_ms": round(simulate_seconds * 1000, 1),
+        "simulated_trials_per_s": round(trials / simulate_seconds),
+        "python_ms_scaled": round(python_seconds * trials / python_trials * 1000, 1),
+        "speedup_vs_python": round(python_seconds * trials / python_trials / simulate_seconds, 1),
+        "simulate_max_error": round(max(max_difference(exact.distributions[name], simulated.distributions[name])
+                                        for name in exact.distributions), 5),
+        "python_max_error": round(max(max_difference(exact.distributions[name], python_result[name])
+                                      for name in exact.distributions), 5),
+        "reproducible": all(np.array_equal(simulated.distributions[name], again.distributions[name])
+                            for name in simulated.distributions),
+    }
+
+
+def bench_dice(rolls: int, repeat: int, seed: int) -> Dict:
+    rng = np.random.default_rng(seed)
+    python_rng = random.Random(seed)
+    vectorized = timed(lambda: combat.Dice(count=1).roll(rng, rolls), repeat)
+    python = timed(lambda: [python_rng.randint(1, 6) for _ in range(rolls)], 1)
+    return {"rolls": rolls, "numpy_ms": round(vectorized * 1000, 2), "python_ms": round(python * 1000, 1),
+            "speedup": round(python / vectorized, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=1000000)
+    parser.add_argument("--python-trials", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=40000)
+    parser.add_argument("--profiles", nargs="+", choices=sorted(PROFILES), default=list(PROFILES))
+    args = parser.parse_args()
+    results = {
+        "dice": bench_dice(1000000, args.repeat, args.seed),
+        "profiles": {name: bench_profile(PROFILES[name], args.trials, args.python_trials, args.repeat, args.seed)
+                     for name in args.profiles},
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Compares two harness result files (see harness.py) and flags regressions.
+
+    python -m backend.benchmarks.compare results/base.json results/new.json --threshold 10
+
+Exits with status 1 when a route's p50/p95/p99 latency grew, or its throughput dropped,
+by more than the threshold (in percent).
+"""
+import argparse
+import json
+import sys
+from typing import Dict, List, Optional
+
+LATENCY_KEYS = ("p50", "p95", "p99")
+
+
+def change(old: Optional[float], new: Optional[float]) -> Optional[float]:
+    if not old or new is None:
+        return None
+    return (new - old) / old * 100
+
+
+def compare(base: Dict, new: Dict, threshold: float) -> List[str]:
+    """
+    Prints the comparison table and returns the regressions found.
+    """
+    regressions = []
+    print(f"{'route':<12}{'metric':<16}{'base':>12}{'new':>12}{'change':>10}")
+    for route in sorted(set(base["routes"]) | set(new["routes"])):
+        old_route, new_route = base["routes"].get(route), new["routes"].get(route)
+        if not old_route or not new_route:
+            print(f"{route:<12}only in {'new' if new_route else 'base'}")
+            continue
+        rows = [(f"{key} ms", old_route["latency"][key], new_route["latency"][key], True) for key in LATENCY_KEYS]
+        rows.append(("throughput rps", old_route["throughput_rps"], new_route["throughput_rps"], False))
+        rows.append(("errors", old_route["errors"], new_route["errors"], True))
+        for metric, old, new_value, lower_is_better in rows:
+            scale = 1000 if metric.endswith("ms") else 1
+            delta = change(old, new_value)
+            flag = ""
+            if delta is not None and metric != "errors":
+                if (delta > threshold) if lower_is_better else (delta < -threshold):
+                    flag = " !"
+                    regressions.append(f"{route} {metric}: {delta:+.1f}%")
+            old_text = f"{old * scale:.2f}" if old is not None else "-"
+            new_text = f"{new_value * scale:.2f}" if new_value is not None else "-"
+            delta_text = f"{delta:+.1f}%" if delta is not None else "-"
+            print(f"{route:<12}{metric:<16}{old_text:>12}{new_text:>12}{delta_text:>10}{flag}")
+    old_memory, new_memory = base.get("server_memory_mb"), new.get("server_memory_mb")
+    if old_memory and new_memory:
+        delta = change(old_memory["peak"], new_memory["peak"])
+        print(f"{'server':<12}{'peak MB':<16}{old_memory['peak']:>12.1f}{new_memory['peak']:>12.1f}{delta:>+9.1f}%")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10, help="Allowed change in percent")
+    args = parser.parse_args()
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f"base {base['meta'].get('commit')}  new {new['meta'].get('commit')}")
+    regressions = compare(base, new, args.threshold)
+    if regressions:
+        print("\nRegressions:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
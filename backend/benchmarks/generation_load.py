@@ -0,0 +1,116 @@
+"""
+Load test for chat turns against a running server that uses the stubbed Gemini client.
+
+Start the server with the stub, e.g.
+    BENCHMARK_STUB_LATENCY=2 gunicorn -c backend/gunicorn.conf.py backend.wsgi:app
+(compare GUNICORN_WORKER_CLASS=sync / gthread / gevent, or GENERATION_MODE=celery with a worker running)
+then, with the same DATABASE_URL and JWT_SECRET:
+    python -m backend.benchmarks.generation_load --base-url http://localhost:5000 --concurrency 32
+
+While the chat turns run, a probe requests the cheap battle listing route to show whether
+other routes are starved. Results are printed as JSON.
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from backend.benchmarks.stats import mint_token, summarize
+
+
+def seed_user_and_battle():
+    from backend.src.app import app
+    from backend.models.User import User
+    from backend.models.Battle import Battle
+
+    with app.flask.app_context():
+        user = User(id=uuid.uuid4(), username=f"load-{uuid.uuid4().hex[:8]}", email=None, created_at=datetime.now())
+        battle = Battle(id=uuid.uuid4(), user_id=user.id, battle_name="Load test", width="44", height="60",
+                        player_army="Tau", opponent_army="Necrons", battle_round="0", army_turn="0",
+                        player_score="0", opponent_score="0", timestamp=datetime.now(), battle_log={},
+                        message_seq=0, archived=False)
+        app.db.session.add(user)
+        app.db.session.flush()
+        app.db.session.add(battle)
+        app.db.session.commit()
+        return str(user.id), str(battle.id)
+
+
+def chat_turn(session, base_url, headers, user_id, battle_id, mode, index):
+    body = {"user_id": user_id, "battle_id": battle_id, "text": f"Load test message {index}"}
+    start = time.perf_counter()
+    if mode == "async":
+        response = session.post(f"{base_url}/api/interactions/text/stream", json=body,
+                                headers={**headers, "Prefer": "respond-async"})
+        if response.status_code == 202:
+            status_url = response.json()["status_url"]
+            while response.status_code == 202:
+                time.sleep(0.2)
+                response = session.get(f"{base_url}{status_url}", headers=headers)
+    else:
+        response = session.post(f"{base_url}/api/interactions/text/stream", json=body, headers=headers)
+    return response.status_code, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:5000")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=128)
+    parser.add_argument("--mode", choices=("inline", "async"), default="inline")
+    parser.add_argument("--probe-interval", type=float, default=0.25)
+    args = parser.parse_args()
+
+    user_id, battle_id = seed_user_and_battle()
+    headers = {"Authorization": f"Bearer {mint_token(user_id)}"}
+
+    probe_latencies = []
+    done = threading.Event()
+
+    def probe():
+        with requests.Session() as session:
+            while not done.is_set():
+                start = time.perf_counter()
+                session.get(f"{args.base_url}/api/battles", params={"user_id": user_id}, headers=headers)
+                probe_latencies.append(time.perf_counter() - start)
+                time.sleep(args.probe_interval)
+
+    probe_thread = threading.Thread(target=probe, daemon=True)
+    probe_thread.start()
+
+    local = threading.local()
+
+    def run(index):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return chat_turn(local.session, args.base_url, headers, user_id, battle_id, args.mode, index)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(run, range(args.requests)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    probe_thread.join()
+
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    print(json.dumps({
+        "mode": args.mode,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "elapsed_seconds": elapsed,
+        "chat_turns_per_second": args.requests / elapsed,
+        "statuses": statuses,
+        "chat_latency": summarize([latency for status, latency in results if status == 200]),
+        "probe_latency": summarize(probe_latencies),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
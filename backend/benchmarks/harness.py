@@ -0,0 +1,352 @@
+"""
+Reproducible load test of the API with scripted scenarios and a local Gemini stand-in.
+
+By default the harness creates and seeds the database, starts Gunicorn with the stubbed
+GenClient (see stubs.py and gunicorn.conf.py), runs the scenario mix and stops the server:
+
+    python -m backend.benchmarks.harness --sqlite /tmp/bench.db --output results/$(git rev-parse --short HEAD).json
+    python -m backend.benchmarks.harness --postgres-container --users 50 --battles 5 --messages 200
+    DATABASE_URL=... python -m backend.benchmarks.harness --worker-class gevent --concurrency 64
+    DATABASE_URL=... python -m backend.benchmarks.harness --server asgi --concurrency 256
+
+--server asgi runs the asynchronous entry point (backend/src/asgi.py) under Uvicorn instead of
+the Flask app under Gunicorn, with the same number of worker processes.
+
+Use --base-url to test an already running server instead (it has to share DATABASE_URL and
+JWT_SECRET with the harness and run with BENCHMARK_STUB_LATENCY set). Redis has to be reachable
+at REDIS_URL, chat turns queue interaction logging through Celery.
+
+Scenarios (weights with --scenarios, e.g. 'list=4,chat=2'):
+    login   a freshly minted token (what /api/authorization returns) used for PUT /api/users,
+            i.e. the first authenticated request of a session
+    list    GET /api/battles, the battle listing
+    get     GET /api/battles/<id>, one battle with its log
+    chat    POST /api/interactions/text/stream, a chat turn (--stream for Server-Sent Events,
+            which also reports time to first chunk as 'chat_ttfb')
+    create  POST /api/battles
+
+Latency percentiles and throughput are reported per scenario and saved as JSON when --output
+is given; compare two result files with backend.benchmarks.compare. The memory of the server
+(proportional set size of the server process and its workers, Linux only) is sampled during the
+run and reported as 'server_memory_mb', to compare server setups at equal memory.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from backend.benchmarks.stats import mint_token, summarize
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+DEFAULT_SCENARIOS = "login=1,list=4,get=2,chat=2,create=1"
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+
+    def record(self, name: str, status: int, seconds: float):
+        with self._lock:
+            self.statuses.setdefault(name, {})
+            self.statuses[name][str(status)] = self.statuses[name].get(str(status), 0) + 1
+            if 200 <= status < 300:
+                self.latencies.setdefault(name, []).append(seconds)
+
+    def report(self, elapsed: float) -> Dict:
+        routes = {}
+        for name, statuses in sorted(self.statuses.items()):
+            latencies = self.latencies.get(name, [])
+            total = sum(statuses.values())
+            routes[name] = {
+                "requests": total,
+                "errors": total - len(latencies),
+                "statuses": statuses,
+                "throughput_rps": len(latencies) / elapsed if elapsed else None,
+                "latency": summarize(latencies),
+            }
+        return routes
+
+
+class VirtualUser:
+    """
+    One client thread: a seeded user with its token, battles and HTTP session.
+    """
+
+    def __init__(self, base_url: str, user: Dict, stream: bool, recorder: Recorder, rng: random.Random):
+        self.base_url = base_url
+        self.user = user
+        self.stream = stream
+        self.recorder = recorder
+        self.rng = rng
+        self.session = requests.Session()
+        self.headers = {"Authorization": f"Bearer {mint_token(user['user_id'], user['email'])}"}
+
+    def timed(self, name: str, method: str, path: str, **kwargs) -> requests.Response:
+        start = time.perf_counter()
+        response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+        self.recorder.record(name, response.status_code, time.perf_counter() - start)
+        return response
+
+    def login(self):
+        headers = {"Authorization": f"Bearer {mint_token(self.user['user_id'], self.user['email'])}"}
+        self.timed("login", "PUT", "/api/users", json={"user_id": self.user["user_id"]}, headers=headers)
+
+    def list(self):
+        self.timed("list", "GET", "/api/battles", params={"user_id": self.user["user_id"], "limit": 20}, headers=self.headers)
+
+    def get(self):
+        battle_id = self.rng.choice(self.user["battle_ids"])
+        self.timed("get", "GET", f"/api/battles/{battle_id}", headers=self.headers)
+
+    def chat(self):
+        body = {"user_id": self.user["user_id"], "battle_id": self.user["battle_ids"][0],
+                "text": f"I advance my Crisis suits {self.rng.randint(1, 12)} inches towards the objective."}
+        if not self.stream:
+            self.timed("chat", "POST", "/api/interactions/text/stream", json=body, headers=self.headers)
+            return
+        start = time.perf_counter()
+        with self.session.post(f"{self.base_url}/api/interactions/text/stream", json=body, stream=True,
+                               headers={**self.headers, "Accept": "text/event-stream"}) as response:
+            first_chunk = None
+            for _ in response.iter_content(chunk_size=None):
+                if first_chunk is None:
+                    first_chunk = time.perf_counter() - start
+        self.recorder.record("chat", response.status_code, time.perf_counter() - start)
+        if first_chunk is not None:
+            self.recorder.record("chat_ttfb", response.status_code, first_chunk)
+
+    def create(self):
+        from backend.benchmarks.seed import ARMIES
+        player, opponent = self.rng.sample(ARMIES, 2)
+        self.timed("create", "POST", "/api/battles", headers=self.headers, json={
+            "playArea": {"width": 44, "height": 60}, "userId": self.user["user_id"], "battleName": "Benchmark",
+            "playerArmy": player, "opponentArmy": opponent,
+        })
+
+
+def parse_scenarios(spec: str) -> Dict[str, int]:
+    weights = {}
+    for part in filter(None, spec.split(",")):
+        name, _, weight = part.partition("=")
+        if name not in ("login", "list", "get", "chat", "create"):
+            raise ValueError(f"Unknown scenario {name}")
+        weights[name] = int(weight or 1)
+    return weights
+
+
+def run_load(base_url: str, users: List[Dict], scenarios: Dict[str, int], concurrency: int,
+             duration: float, stream: bool, random_seed: int) -> Dict:
+    recorder = Recorder()
+    names = list(scenarios)
+    weights = [scenarios[name] for name in names]
+    deadline = time.perf_counter() + duration
+    failures = []
+
+    def worker(index: int):
+        rng = random.Random(random_seed + index)
+        client = VirtualUser(base_url, users[index % len(users)], stream, recorder, rng)
+        while time.perf_counter() < deadline:
+            scenario: Callable = getattr(client, rng.choices(names, weights)[0])
+            try:
+                scenario()
+            except requests.RequestException as e:
+                failures.append(str(e))
+
+    threads = [threading.Thread(target=worker, args=(index,), daemon=True) for index in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    total = sum(sum(statuses.values()) for statuses in recorder.statuses.values())
+    return {
+        "elapsed_seconds": elapsed,
+        "throughput_rps": total / elapsed,
+        "connection_errors": len(failures),
+        "routes": recorder.report(elapsed),
+    }
+
+
+def start_server(args) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "GUNICORN_BIND": args.bind,
+        "GUNICORN_WORKERS": str(args.workers),
+        "GUNICORN_WORKER_CLASS": args.worker_class,
+        "BENCHMARK_STUB_LATENCY": str(args.stub_latency),
+        "BENCHMARK_STUB_REPLY_CHARS": str(args.stub_reply_chars),
+    }
+    if args.stub_chunk_size:
+        env["BENCHMARK_STUB_CHUNK_SIZE"] = str(args.stub_chunk_size)
+    if args.server == "asgi":
+        host, _, port = args.bind.rpartition(":")
+        command = [sys.executable, "-m", "uvicorn", "backend.src.asgi:app", "--host", host, "--port", port,
+                   "--workers", str(args.workers), "--no-access-log"]
+    else:
+        command = [sys.executable, "-m", "gunicorn", "-c", "backend/gunicorn.conf.py", "backend.wsgi:app"]
+    server = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL,
+                              stderr=open(args.server_log, "w"))
+    base_url = f"http://{args.bind}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"The server exited with {server.returncode}, see {args.server_log}")
+        try:
+            requests.get(f"{base_url}/api/battles", timeout=1)
+            return server
+        except requests.RequestException:
+            time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError(f"The server did not start, see {args.server_log}")
+
+
+def process_tree_memory(pid: int) -> Optional[float]:
+    """
+    Proportional set size in MB of a process and its descendants (shared pages counted once
+    across them), falling back to the resident set size. None where /proc is not available.
+    """
+    parents = {}
+    for entry in os.listdir("/proc") if os.path.isdir("/proc") else ():
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces, the parent pid follows its closing parenthesis
+                parents[int(entry)] = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+    if pid not in parents:
+        return None
+    tree, frontier = {pid}, [pid]
+    while frontier:
+        children = [child for child, parent in parents.items() if parent in frontier]
+        tree.update(children)
+        frontier = children
+    total_kb = 0
+    for member in tree:
+        for path, key in ((f"/proc/{member}/smaps_rollup", "Pss:"), (f"/proc/{member}/status", "VmRSS:")):
+            try:
+                with open(path) as f:
+                    line = next((line for line in f if line.startswith(key)), None)
+            except OSError:
+                continue
+            if line:
+                total_kb += int(line.split()[1])
+                break
+    return total_kb / 1024
+
+
+class MemorySampler(threading.Thread):
+    def __init__(self, pid: int, interval: float = 1.0):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples: List[float] = []
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            memory = process_tree_memory(self.pid)
+            if memory is not None:
+                self.samples.append(memory)
+            self._stopped.wait(self.interval)
+
+    def stop(self) -> Optional[Dict]:
+        self._stopped.set()
+        self.join()
+        if not self.samples:
+            return None
+        return {"peak": max(self.samples), "mean": sum(self.samples) / len(self.samples)}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    database = parser.add_mutually_exclusive_group()
+    database.add_argument("--sqlite", metavar="PATH", help="SQLite file to create and seed")
+    database.add_argument("--postgres-container", action="store_true", help="Start a Postgres test container (testcontainers)")
+    parser.add_argument("--base-url", help="Test a running server instead of starting one")
+    parser.add_argument("--server", choices=("gunicorn", "asgi"), default="gunicorn",
+                        help="Flask under Gunicorn, or the ASGI app under Uvicorn")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--battles", type=int, default=5, help="Battles per user")
+    parser.add_argument("--messages", type=int, default=100, help="Messages per battle")
+    parser.add_argument("--scenarios", default=DEFAULT_SCENARIOS)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds of load before measuring")
+    parser.add_argument("--stream", action="store_true", help="Chat turns use Server-Sent Events")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the data and the scenario sequence")
+    parser.add_argument("--stub-latency", type=float, default=1.0, help="Seconds per fake Gemini call")
+    parser.add_argument("--stub-chunk-size", type=int, help="Characters per streamed chunk")
+    parser.add_argument("--stub-reply-chars", type=int, default=600, help="Length of the fake replies")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--worker-class", default="gthread", help="Gunicorn worker class")
+    parser.add_argument("--bind", default="127.0.0.1:5099")
+    parser.add_argument("--server-log", default="benchmark-server.log")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    from backend.benchmarks.seed import configure_database, create_schema, seed, to_fixture
+
+    container = configure_database(args.sqlite, args.postgres_container)
+    server = None
+    try:
+        create_schema(reset=bool(args.sqlite or args.postgres_container))
+        users = to_fixture(seed(args.users, args.battles, args.messages, args.seed))
+        if args.base_url:
+            base_url = args.base_url.rstrip("/")
+        else:
+            server = start_server(args)
+            base_url = f"http://{args.bind}"
+        scenarios = parse_scenarios(args.scenarios)
+        if args.warmup:
+            run_load(base_url, users, scenarios, args.concurrency, args.warmup, args.stream, args.seed + 10_000)
+        sampler = MemorySampler(server.pid) if server else None
+        if sampler:
+            sampler.start()
+        results = run_load(base_url, users, scenarios, args.concurrency, args.duration, args.stream, args.seed)
+        results["server_memory_mb"] = sampler.stop() if sampler else None
+    finally:
+        if server:
+            server.terminate()
+            server.wait(30)
+        if container:
+            container.stop()
+
+    results["meta"] = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "database": os.environ["DATABASE_URL"].split(":", 1)[0],
+        "args": {key: value for key, value in vars(args).items() if key not in ("output", "server_log")},
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
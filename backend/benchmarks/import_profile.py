@@ -0,0 +1,89 @@
+"""
+Import time of the entry points, from `python -X importtime` reports: the cold start a new worker or
+an autoscaled container pays before it serves its first request.
+
+    python -m backend.benchmarks.import_profile --repeat 5 --top 15
+    python -m backend.benchmarks.import_profile --targets backend.wsgi --raw /tmp/wsgi.importtime
+
+Each import runs in a fresh interpreter. Reports the median wall time of the import, the slowest
+modules and the time per top-level package (google, celery, sqlalchemy, ...) of the run
+with the median time. --raw keeps that run's report, e.g. for `tuna`. Results are printed as JSON.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+# The WSGI app, its lazily imported clients and the other process types
+TARGETS = ["backend.wsgi", "backend.src.gen_client", "backend.tasks.tasks", "backend.src.asgi"]
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+# Loading the app needs these set, nothing is connected to
+ENV = {"DATABASE_URL": "postgresql+psycopg2://localhost/import_profile", "GOOGLEAI_API_KEY": "import-profile",
+       "JWT_SECRET": "import-profile", "LOG_FILE": ""}
+
+
+def parse_report(report: str) -> List[Tuple[str, int, int, int]]:
+    """
+    (module, self µs, cumulative µs, nesting level) of each line of an -X importtime report.
+    """
+    modules = []
+    for line in report.splitlines():
+        match = _LINE.match(line)
+        if match:
+            modules.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2))
+    return modules
+
+
+def run_once(target: str) -> Tuple[float, str]:
+    code = f"import time; start = time.perf_counter(); import {target}; print(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env={**os.environ, **ENV},
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def profile(target: str, repeat: int, top: int, raw: str = None) -> Dict:
+    runs = sorted((run_once(target) for _ in range(repeat)), key=lambda run: run[0])
+    seconds, report = runs[len(runs) // 2]
+    if raw:
+        with open(raw, "w") as file:
+            file.write(report)
+    modules = parse_report(report)
+    # The target's own imports: the lines nested under it, which precede its (top level) line
+    end = max(index for index, module in enumerate(modules) if module[0] == target and module[3] == 0)
+    start = max((index + 1 for index, module in enumerate(modules[:end]) if module[3] == 0), default=0)
+    modules = modules[start:end + 1]
+    packages = defaultdict(int)
+    for name, self_us, _, _ in modules:
+        packages[name.split(".")[0]] += self_us
+    slowest = sorted(modules, key=lambda module: module[1], reverse=True)[:top]
+    return {
+        "median_ms": round(statistics.median(run[0] for run in runs) * 1000, 1),
+        "min_ms": round(runs[0][0] * 1000, 1),
+        "modules": len(modules),
+        "packages_ms": {name: round(us / 1000, 1)
+                        for name, us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]},
+        "slowest_modules_self_ms": {name: round(self_us / 1000, 1) for name, self_us, _, _ in slowest},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", default=TARGETS)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--raw", help="File to write the -X importtime report of the (last) target to")
+    args = parser.parse_args()
+    results = {target: profile(target, args.repeat, args.top, args.raw if target == args.targets[-1] else None)
+               for target in args.targets}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Per-request cost of application logging: the previous setup (logging.basicConfig plus a FileHandler
+and a StreamHandler on flask.logger, every line written twice under the handler locks, payloads in
+full) against the queue-backed setup of backend/src/logging_config.py, with payloads logged in full
+(LOG_PAYLOADS) and sampled.
+
+    python -m backend.benchmarks.logging_bench --requests 5000 --threads 1 16
+
+Each variant runs in its own process against a small Flask app whose route logs like a chat turn
+(three lines, the request body and a model response), with stderr and the log file on disk.
+No database is needed. Results are printed as JSON.
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# env overrides of each variant, the legacy one reproduces the previous App.setup_flask
+VARIANTS = {
+    "legacy": {},
+    "queue_full_payloads": {"LOG_PAYLOADS": "true"},
+    "queue_sampled": {"LOG_PAYLOADS": "false", "LOG_PAYLOAD_SAMPLE_RATE": "0.01"},
+    "queue_sampled_text": {"LOG_PAYLOADS": "false", "LOG_PAYLOAD_SAMPLE_RATE": "0.01", "LOG_FORMAT": "text"},
+}
+
+REQUEST_BODY = {"user_id": "6f1c2a4e-5d1b-4c3e-9a8f-2b7d0e4c1a55", "battle_id": "0b9d7f6e-3a2c-4e1b-8d5f-7c6a4b3e2d10",
+                "text": "My Crisis suits advance 10\" and fire at the Intercessors on the left objective. " * 4}
+MODEL_RESPONSE = "The Intercessors take 4 wounds and lose two models, then fall back behind the ruins. " * 48
+
+
+def legacy_setup(flask, log_file: str):
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    file_handler = logging.FileHandler(log_file)
+    file_handler.setLevel(logging.INFO)
+    file_handler.setFormatter(formatter)
+    flask.logger.addHandler(file_handler)
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(formatter)
+    flask.logger.addHandler(console_handler)
+
+
+def build_app(variant: str, log_file: str):
+    from flask import Flask, jsonify, request
+
+    flask = Flask("logging_bench")
+    if variant == "legacy":
+        legacy_setup(flask, log_file)
+
+        def payload(route, label, value):
+            flask.logger.info(f"{label}: {value}")
+    else:
+        from backend.src.logging_config import build_handlers, configure_logging, log_payload
+        configure_logging(handlers=build_handlers(filename=log_file))
+
+        def payload(route, label, value):
+            log_payload(flask.logger, route, label, value)
+
+    @flask.route("/turn", methods=["POST"])
+    def turn():
+        data = request.get_json()
+        flask.logger.info("Chat turn for battle %s", data["battle_id"])
+        payload("chat_turn", "Chat turn request body", data)
+        payload("generate", "Model response", MODEL_RESPONSE)
+        flask.logger.info("Battle %s updated", data["battle_id"])
+        return jsonify({"ok": True})
+
+    return flask
+
+
+def run_variant(variant: str, requests: int, threads: int, log_file: str) -> dict:
+    flask = build_app(variant, log_file)
+    client = flask.test_client()
+    for _ in range(50):
+        client.post("/turn", json=REQUEST_BODY)
+
+    def one(_):
+        start = time.perf_counter()
+        client.post("/turn", json=REQUEST_BODY)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        samples = sorted(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    drain_start = time.perf_counter()
+    if variant != "legacy":
+        from backend.src.logging_config import stop_logging
+        stop_logging()
+    drain = time.perf_counter() - drain_start
+    return {
+        "median_ms": round(statistics.median(samples) * 1000, 4),
+        "p99_ms": round(samples[int(len(samples) * 0.99) - 1] * 1000, 4),
+        "requests_per_second": round(requests / elapsed, 1),
+        "drain_ms": round(drain * 1000, 2),
+        "log_bytes": os.path.getsize(log_file) if os.path.exists(log_file) else 0,
+    }
+
+
+def spawn(variant: str, requests: int, threads: int, directory: str) -> dict:
+    log_file = os.path.join(directory, f"{variant}-{threads}.log")
+    env = {**os.environ, **VARIANTS[variant], "LOG_FILE": log_file}
+    with open(os.path.join(directory, f"{variant}-{threads}.stderr"), "wb") as stderr:
+        output = subprocess.run(
+            [sys.executable, "-m", "backend.benchmarks.logging_bench", "--child", variant,
+             "--requests", str(requests), "--threads", str(threads), "--log-file", log_file],
+            env=env, stdout=subprocess.PIPE, stderr=stderr, check=True,
+        ).stdout
+    result = json.loads(output)
+    result["stderr_bytes"] = os.path.getsize(stderr.name)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--variants", nargs="+", choices=sorted(VARIANTS), default=list(VARIANTS))
+    parser.add_argument("--child", choices=sorted(VARIANTS), help=argparse.SUPPRESS)
+    parser.add_argument("--log-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(run_variant(args.child, args.requests, args.threads[0], args.log_file)))
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        results = {str(threads): {variant: spawn(variant, args.requests, threads, directory) for variant in args.variants}
+                   for threads in args.threads}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark database setup: a Postgres test container or a SQLite file, seeded with N users,
+battles per user and messages per battle.
+
+The database has to be chosen before the app is imported (DATABASE_URL is read on first use),
+so call configure_database() first.
+"""
+import os
+import random
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import BigInteger, insert, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+
+ARMIES = [
+    {"id": 1, "armyName": "Kauyon", "armySizePoints": 2000, "faction": "T'au Empire", "detachment": "Kauyon",
+     "characters": ["Commander in Coldstar"], "otherDatasheets": ["Strike Team", "Crisis Battlesuits"]},
+    {"id": 2, "armyName": "Awakened Dynasty", "armySizePoints": 2000, "faction": "Necrons", "detachment": "Awakened Dynasty",
+     "characters": ["Overlord"], "otherDatasheets": ["Necron Warriors", "Immortals"]},
+    {"id": 3, "armyName": "Gladius", "armySizePoints": 2000, "faction": "Space Marines", "detachment": "Gladius Task Force",
+     "characters": ["Captain"], "otherDatasheets": ["Intercessor Squad", "Redemptor Dreadnought"]},
+]
+
+
+@dataclass
+class SeededUser:
+    user_id: str
+    email: str
+    battle_ids: List[str] = field(default_factory=list)
+
+
+@compiles(JSONB, "sqlite")
+def _jsonb_on_sqlite(type_, compiler, **kw):
+    return "JSON"
+
+
+@compiles(BigInteger, "sqlite")
+def _bigint_on_sqlite(type_, compiler, **kw):
+    # Only INTEGER PRIMARY KEY columns autoincrement in SQLite
+    return "INTEGER"
+
+
+def configure_database(sqlite_path: Optional[str] = None, postgres_container: bool = False):
+    """
+    Points DATABASE_URL at the benchmark database. Returns the started container, if any
+    (stop it when done). Without options the existing DATABASE_URL is used.
+    """
+    if postgres_container:
+        from testcontainers.postgres import PostgresContainer # Optional, pip install testcontainers[postgres]
+        container = PostgresContainer("postgres:16-alpine", driver="psycopg2")
+        container.start()
+        os.environ["DATABASE_URL"] = container.get_connection_url()
+        return container
+    if sqlite_path:
+        # A file, not :memory:, the server under test runs in other processes
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(sqlite_path)}"
+    elif not os.environ.get("DATABASE_URL"):
+        raise ValueError("Set DATABASE_URL, or use a SQLite file or a Postgres container")
+    return None
+
+
+def create_schema(reset: bool = False):
+    from backend.src.app import app
+    from backend.models import Battle, BattleMessage, Interaction, User  # noqa: F401, registers the tables
+
+    with app.flask.app_context():
+        if reset:
+            if app.db.engine.dialect.name == "postgresql":
+                app.db.session.execute(text("DROP VIEW IF EXISTS battle_log_view"))
+                app.db.session.commit()
+            app.db.drop_all()
+        app.db.create_all()
+
+
+def seed(users: int, battles_per_user: int, messages_per_battle: int, random_seed: int = 0) -> List[SeededUser]:
+    """
+    Inserts the users, battles and battle messages with bulk INSERTs. Returns the seeded ids.
+    """
+    from backend.src.app import app
+    from backend.models.Battle import Battle
+    from backend.models.BattleMessage import BattleMessage
+    from backend.models.User import User
+
+    rng = random.Random(random_seed)
+    run = uuid.uuid4().hex[:8]
+    now = datetime.now()
+    seeded, user_rows, battle_rows, message_rows = [], [], [], []
+    for user_index in range(users):
+        user = SeededUser(user_id=str(uuid.uuid4()), email=f"bench-{run}-{user_index}@example.com")
+        user_rows.append({"id": uuid.UUID(user.user_id), "username": f"bench-{run}-{user_index}",
+                          "email": user.email, "created_at": now})
+        for battle_index in range(battles_per_user):
+            battle_id = uuid.uuid4()
+            user.battle_ids.append(str(battle_id))
+            player, opponent = rng.sample(ARMIES, 2)
+            battle_rows.append({
+                "id": battle_id, "user_id": uuid.UUID(user.user_id), "battle_name": f"Battle {battle_index}",
+                "width": "44", "height": "60", "player_army": player, "opponent_army": opponent,
+                "battle_round": str(rng.randint(1, 5)), "army_turn": "0", "player_score": "0", "opponent_score": "0",
+                "archived": battle_index > 0 and rng.random() < 0.5, "timestamp": now - timedelta(minutes=battle_index),
+                "battle_log": None, "message_seq": messages_per_battle, "summary_seq": 0,
+            })
+            for seq in range(messages_per_battle):
+                message_rows.append({
+                    "battle_id": battle_id, "seq": seq, "creator": "user" if seq % 2 == 0 else "ai",
+                    "message": f"Message {seq}: " + "The Crisis suits advance and open fire. " * rng.randint(1, 12),
+                    "partial": False, "timestamp": now,
+                })
+        seeded.append(user)
+
+    with app.flask.app_context():
+        session = app.db.session
+        for model, rows in ((User, user_rows), (Battle, battle_rows), (BattleMessage, message_rows)):
+            for start in range(0, len(rows), 5000):
+                session.execute(insert(model), rows[start:start + 5000])
+        session.commit()
+    return seeded
+
+
+def to_fixture(seeded: List[SeededUser]) -> List[Dict]:
+    return [{"user_id": user.user_id, "email": user.email, "battle_ids": user.battle_ids} for user in seeded]
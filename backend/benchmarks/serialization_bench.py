@@ -0,0 +1,122 @@
+"""
+Micro-benchmark of the battle response encoding: the previous format (armies and battle log as
+JSON encoded strings inside the JSON response, stdlib encoder) against native nested objects
+encoded with the standard library and with orjson (if installed).
+
+    python -m backend.benchmarks.serialization_bench --messages 10 100 1000
+
+No database is needed, battles are built in memory. Results are printed as JSON.
+"""
+import argparse
+import gzip
+import json
+import os
+import statistics
+import time
+import uuid
+from datetime import datetime
+
+# The models need a configured database URL even though nothing is queried
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from backend.src.app import app  # noqa: E402
+from backend.models.Battle import Battle  # noqa: E402
+from backend.models.BattleMessage import BattleMessage  # noqa: E402
+from backend.src.serialization import ORJSON_OPTIONS, orjson  # noqa: E402
+
+ARMY = {
+    "id": 1, "armyName": "Kauyon Hunting Party", "armySizePoints": 2000, "faction": "T'au Empire",
+    "detachment": "Kauyon",
+    "characters": ["Commander in Coldstar\n  - Missile pod\n  - Fusion blaster\n  - Shield generator"] * 4,
+    "otherDatasheets": ["10x Strike Team\n  - Pulse rifle\n  - Guardian drone\n  - Markerlight"] * 12,
+}
+
+
+def make_battle(messages: int) -> Battle:
+    battle = Battle(id=uuid.uuid4(), user_id=uuid.uuid4(), battle_name="Benchmark", width="44", height="60",
+                    player_army=ARMY, opponent_army=ARMY, battle_round="3", army_turn="1",
+                    player_score="25", opponent_score="30", archived=False, timestamp=datetime.now(),
+                    battle_log={}, message_seq=messages)
+    battle.messages = [
+        BattleMessage(battle_id=battle.id, seq=seq, creator="user" if seq % 2 == 0 else "ai", partial=False,
+                      message="The Crisis suits advance 10\" and fire at the Intercessors. " * (2 if seq % 2 == 0 else 8),
+                      timestamp=datetime.now())
+        for seq in range(messages)
+    ]
+    return battle
+
+
+def legacy_to_dict(battle: Battle) -> dict:
+    """
+    The previous Battle.to_dict(): nested values as JSON strings.
+    """
+    return {
+        "id": str(battle.id),
+        "battle_name": str(battle.battle_name),
+        "user_id": str(battle.user_id),
+        "width": battle.width,
+        "height": battle.height,
+        "player_army": json.dumps(battle.player_army),
+        "opponent_army": json.dumps(battle.opponent_army),
+        "battle_round": battle.battle_round,
+        "army_turn": battle.army_turn,
+        "player_score": battle.player_score,
+        "opponent_score": battle.opponent_score,
+        "archived": battle.archived,
+        "timestamp": battle.timestamp.isoformat(),
+        "battle_log": json.dumps(battle.message_log),
+    }
+
+
+def stdlib_encode(obj) -> bytes:
+    # What Flask's default provider does for jsonify
+    return json.dumps(obj, ensure_ascii=True, sort_keys=True).encode("utf-8")
+
+
+def legacy_decode(body: bytes):
+    battle = json.loads(body)
+    for key in ("player_army", "opponent_army", "battle_log"):
+        battle[key] = json.loads(battle[key])
+    return battle
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def run(messages: int, repeat: int) -> dict:
+    battle = make_battle(messages)
+    variants = {
+        "legacy_stdlib": (lambda: stdlib_encode(legacy_to_dict(battle)), legacy_decode),
+        "native_stdlib": (lambda: stdlib_encode(battle.to_dict()), json.loads),
+    }
+    if orjson:
+        variants["native_orjson"] = (lambda: orjson.dumps(battle.to_dict(), option=ORJSON_OPTIONS), orjson.loads)
+    results = {}
+    for name, (encode, decode) in variants.items():
+        body = encode()
+        results[name] = {
+            "encode_ms": round(timed(encode, repeat), 4),
+            "decode_ms": round(timed(lambda: decode(body), repeat), 4),
+            "bytes": len(body),
+            "gzip_bytes": len(gzip.compress(body, compresslevel=6)),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    with app.flask.app_context():
+        print(json.dumps({str(messages): run(messages, args.repeat) for messages in args.messages}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
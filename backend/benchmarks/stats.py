@@ -0,0 +1,34 @@
+import statistics
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import jwt
+
+from backend.src.parameters import JWT_SECRET, JWT_ALGORITHM
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(latencies: List[float]) -> Dict:
+    return {
+        "count": len(latencies),
+        "mean": statistics.mean(latencies) if latencies else None,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+    }
+
+
+def mint_token(user_id: str, email: Optional[str] = None) -> str:
+    """
+    An access token like the one /api/authorization hands out after the Google login.
+    """
+    payload = {"user_id": user_id, "exp": datetime.now().astimezone() + timedelta(hours=1)}
+    if email:
+        payload["email"] = email
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
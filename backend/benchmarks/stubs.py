@@ -0,0 +1,91 @@
+import asyncio
+import os
+import time
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+from backend.src.parameters import CONTEXT_MAX_MESSAGES
+
+
+class FakeGenClient:
+    """
+    Stand-in for GenClient that sleeps instead of calling Gemini, so the API can be load tested
+    without spending quota. It still reads the conversation window like the real client does.
+    """
+
+    def __init__(self, latency: float = 2.0, chunks: int = 10, chunk_size: Optional[int] = None, reply_chars: int = 0):
+        """
+        Args:
+            latency (float): Seconds per generate call, spread over the chunks when streaming.
+            chunks (int): Number of streamed chunks, unless chunk_size is given.
+            chunk_size (int): Characters per streamed chunk.
+            reply_chars (int): Pads replies to at least this many characters.
+        """
+        self.latency = latency
+        self.chunks = chunks
+        self.chunk_size = chunk_size
+        self.reply_chars = reply_chars
+
+    def reply(self, content: str) -> str:
+        text = f"Acknowledged, commander. You said: {content}"
+        if len(text) < self.reply_chars:
+            text += " The Necron phalanx advances." * ((self.reply_chars - len(text)) // 28 + 1)
+        return text
+
+    def generate(self, content: str, battle_state) -> str:
+        battle_state.recent_messages(CONTEXT_MAX_MESSAGES)
+        time.sleep(self.latency)
+        return self.reply(content)
+
+    def generate_stream(self, content: str, battle_state) -> Iterator[str]:
+        battle_state.recent_messages(CONTEXT_MAX_MESSAGES)
+        text = self.reply(content)
+        size = self.chunk_size or max(1, len(text) // self.chunks)
+        count = -(-len(text) // size)
+        for start in range(0, len(text), size):
+            time.sleep(self.latency / count)
+            yield text[start:start + size]
+
+    async def agenerate(self, content: str, battle_state) -> str:
+        battle_state.recent_messages(CONTEXT_MAX_MESSAGES)
+        await asyncio.sleep(self.latency)
+        return self.reply(content)
+
+    async def agenerate_stream(self, content: str, battle_state) -> AsyncIterator[str]:
+        battle_state.recent_messages(CONTEXT_MAX_MESSAGES)
+        text = self.reply(content)
+        size = self.chunk_size or max(1, len(text) // self.chunks)
+        count = -(-len(text) // size)
+        for start in range(0, len(text), size):
+            await asyncio.sleep(self.latency / count)
+            yield text[start:start + size]
+
+    def plan_opponent_turn(self, battle_state) -> str:
+        battle_state.recent_messages(CONTEXT_MAX_MESSAGES)
+        time.sleep(self.latency)
+        return f"Round {battle_state.battle_round}: hold the objectives, then counter-charge."
+
+    def analyze_image(self, image_bytes: bytes, mime_type: str) -> str:
+        time.sleep(self.latency)
+        return f"A {len(image_bytes)} byte {mime_type} photo of the board."
+
+    def summarize(self, previous_summary: Optional[str], messages: List[Tuple[str, str]]) -> str:
+        time.sleep(self.latency)
+        return f"{previous_summary or ''} {len(messages)} more messages.".strip()
+
+
+def install_fake_gen_client(latency: float, chunk_size: Optional[int] = None, reply_chars: int = 0):
+    """
+    Makes App.gen_client return a FakeGenClient. Must run before the first model call.
+    """
+    from backend.src.app import app
+    app._gen_client = FakeGenClient(latency, chunk_size=chunk_size, reply_chars=reply_chars)
+
+
+def install_fake_gen_client_from_env():
+    """
+    install_fake_gen_client configured by the BENCHMARK_STUB_* variables the harness sets on the server.
+    """
+    chunk_size = os.environ.get("BENCHMARK_STUB_CHUNK_SIZE")
+    install_fake_gen_client(float(os.environ["BENCHMARK_STUB_LATENCY"]),
+                            chunk_size=int(chunk_size) if chunk_size else None,
+                            reply_chars=int(os.environ.get("BENCHMARK_STUB_REPLY_CHARS", 0)))
@@ -0,0 +1,49 @@
+# backend/gunicorn.conf.py
+# Gunicorn settings, overridable through the environment.
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+
+# Chat turns wait several seconds on Gemini. With the default sync workers each of those pins a
+# whole process, so use threads (gthread) or greenlets (gevent) to keep serving other routes.
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+# Gunicorn silently turns sync workers into gthread when threads > 1, so only set it for gthread
+threads = int(os.environ.get("GUNICORN_THREADS", 16)) if worker_class == "gthread" else 1
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 200))  # gevent only
+
+# Streamed model responses can take longer than the default 30s
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+
+# Load the app (backend.wsgi:app) once in the master and fork the workers from it: they start in
+# milliseconds and share the imported modules copy-on-write. Connections opened while loading are
+# dropped in post_fork. Restarts then need a new master, HUP doesn't reload the code.
+# Off by default for gevent, which patches the standard library in each worker after the fork.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "false" if worker_class == "gevent" else "true").lower() == "true"
+
+
+def when_ready(server):
+    if preload_app:
+        # Modules the app imports on first use, loaded here so workers don't import them each
+        from backend.src.factory import preload_imports
+        preload_imports()
+        # Keeps the garbage collector of the workers from writing to (and so copying) the shared objects
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from backend.src.app import app
+        app.after_fork()
+    if worker_class == "gevent":
+        # psycopg2 blocks the whole process under gevent unless it cooperates with the event loop
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    if os.environ.get("BENCHMARK_STUB_LATENCY"):
+        # Load testing only: swap Gemini for a stand-in that sleeps (see backend/benchmarks)
+        from backend.benchmarks.stubs import install_fake_gen_client_from_env
+        install_fake_gen_client_from_env()
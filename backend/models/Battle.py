@@ -1,4 +1,3 @@
-import json
 import uuid
 from datetime import datetime
 from backend.src.app import app
@@ -7,6 +6,10 @@ from sqlalchemy.ext.mutable import MutableDict
 
 class Battle(app.db.Model):
     __tablename__ = 'battles'
+    __table_args__ = (
+        # Serves the per-user battle listing: filter on user/archived, keyset on timestamp
+        app.db.Index('ix_battles_user_archived_timestamp', 'user_id', 'archived', 'timestamp'),
+    )
 
     # Columns
     id = app.db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -24,6 +27,8 @@ class Battle(app.db.Model):
     timestamp = app.db.Column(app.db.DateTime, nullable=False, default=datetime.now(), index=True)
     battle_log = app.db.Column(MutableDict.as_mutable(JSONB), default=dict)
     """
+    Legacy storage of the battle log, messages now live in the battle_messages table (see message_log).
+    Blobs of battles created before that are moved over by `flask upgrade-db` or on the battle's next turn.
     The battle log will contain all of the chat history the user had with the model this will be stored in Dict
     {   
         1: { // The key is the message number
@@ -38,27 +43,59 @@ class Battle(app.db.Model):
         }
     }
     """
+    message_seq = app.db.Column(app.db.Integer, nullable=False, default=0, server_default='0') # Next message number to allocate
+    log_summary = app.db.Column(app.db.Text, nullable=True) # Rolling summary of the messages older than the context window
+    summary_seq = app.db.Column(app.db.Integer, nullable=False, default=0, server_default='0') # Messages with a lower seq are covered by log_summary
+    log_archived = app.db.Column(app.db.Boolean, nullable=False, default=False, server_default='false') # Messages moved to battle_archives, see archive.py
+    log_restored_at = app.db.Column(app.db.DateTime, nullable=True) # Last time the archived messages were restored
+
     # Relationships
+    messages = app.db.relationship('BattleMessage', order_by='BattleMessage.seq', lazy='select',
+                                   cascade="all, delete-orphan", passive_deletes=True)
+    rosters = app.db.relationship('Roster', lazy='select', cascade="all, delete-orphan", passive_deletes=True)
+    archive = app.db.relationship('BattleArchive', uselist=False, lazy='select',
+                                  cascade="all, delete-orphan", passive_deletes=True)
+
     def __repr__(self):
         return f'<Battle {self.battle_name} (User: {self.user_id}, ID: {self.id})>'
 
-    # Helper to convert model to dictionary
-    def to_dict(self):
-        return {
-            "id": str(self.id),
-            "battle_name": str(self.battle_name),
-            "user_id": str(self.user_id),
-            "width": self.width,
-            "height": self.height,
-            "player_army": json.dumps(self.player_army) if isinstance(self.player_army, dict) else self.player_army,
-            "opponent_army": json.dumps(self.opponent_army) if isinstance(self.opponent_army, dict) else self.opponent_army,
-            "battle_round": self.battle_round,
-            "army_turn": self.army_turn,
-            "player_score": self.player_score,
-            "opponent_score": self.opponent_score,
-            "battle_log": json.dumps(self.battle_log),
-            "archived": self.archived, 
-            "timestamp": self.timestamp.isoformat(),
-        }
+    @property
+    def message_log(self):
+        """
+        Compatibility view of the battle_messages rows in the legacy battle_log format, keyed by message number.
+        Falls back to the legacy blob for battles whose log has not been migrated yet.
+        Archived messages are read from the archive (without restoring them), merged with any written since.
+        """
+        if not self.messages and self.battle_log:
+            return dict(self.battle_log)
+        battle_log = self.archive.message_log() if self.log_archived and self.archive is not None else {}
+        battle_log.update((str(message.seq), message.to_dict()) for message in self.messages)
+        return battle_log
+
+    # army_turn values, the AI plays the opponent army
+    PLAYER_TURN = "0"
+    OPPONENT_TURN = "1"
+
+    # Columns returned by the battle listing unless the log is explicitly requested
+    SUMMARY_COLUMNS = (
+        'id', 'battle_name', 'user_id', 'width', 'height', 'player_army', 'opponent_army',
+        'battle_round', 'army_turn', 'player_score', 'opponent_score', 'archived', 'timestamp',
+    )
+
+    # Helper to convert model to dictionary, `fields` limits the output (and the attributes loaded) to those keys
+    def to_dict(self, include_battle_log: bool = True, fields=None):
+        if fields is None:
+            fields = self.SUMMARY_COLUMNS + (('battle_log',) if include_battle_log else ())
+        battle = {}
+        for name in fields:
+            if name == 'battle_log':
+                battle[name] = self.message_log
+                continue
+            value = getattr(self, name)
+            if isinstance(value, uuid.UUID):
+                value = str(value)
+            elif isinstance(value, datetime):
+                value = value.isoformat()
+            battle[name] = value
+        return battle
     
-print(f"--- MODEL LOADED: {Battle.__name__} (Table: {Battle.__tablename__}) ---") # <--- ADD THIS
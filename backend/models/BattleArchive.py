@@ -0,0 +1,22 @@
+from datetime import datetime
+from backend.src.app import app
+from backend.src.log_codec import decode_log
+from sqlalchemy.dialects.postgresql import UUID
+
+class BattleArchive(app.db.Model):
+    __tablename__ = 'battle_archives'
+
+    # Columns
+    battle_id = app.db.Column(UUID(as_uuid=True), app.db.ForeignKey('battles.id', ondelete='CASCADE'), primary_key=True) # One archive per battle
+    codec = app.db.Column(app.db.String(10), nullable=False) # 'zstd' or 'gzip'
+    payload = app.db.Column(app.db.LargeBinary, nullable=False) # The battle log as compressed JSON lines, see log_codec.py
+    message_count = app.db.Column(app.db.Integer, nullable=False)
+    raw_bytes = app.db.Column(app.db.Integer, nullable=False) # Uncompressed size of the payload
+    archived_at = app.db.Column(app.db.DateTime, nullable=False, default=datetime.now)
+
+    def __repr__(self):
+        return f'<BattleArchive {self.battle_id} ({self.message_count} messages, {self.codec})>'
+
+    # Helper to decompress the archived messages in the battle log format, keyed by message number
+    def message_log(self):
+        return decode_log(self.codec, self.payload)
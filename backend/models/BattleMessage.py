@@ -0,0 +1,33 @@
+from datetime import datetime
+from backend.src.app import app
+from sqlalchemy.dialects.postgresql import UUID
+
+class BattleMessage(app.db.Model):
+    __tablename__ = 'battle_messages'
+    __table_args__ = (
+        # One row per message number within a battle, also the index used to read a battle's log in order
+        app.db.Index('ux_battle_messages_battle_seq', 'battle_id', 'seq', unique=True),
+    )
+
+    # Columns
+    id = app.db.Column(app.db.BigInteger, primary_key=True, autoincrement=True)
+    battle_id = app.db.Column(UUID(as_uuid=True), app.db.ForeignKey('battles.id', ondelete='CASCADE'), nullable=False) # Foreign key to battles table
+    seq = app.db.Column(app.db.Integer, nullable=False) # The message number within the battle, allocated from Battle.message_seq
+    creator = app.db.Column(app.db.String(20), nullable=False) # 'user', 'ai' or 'combat' (combat engine results, see combat.py)
+    message = app.db.Column(app.db.Text, nullable=False)
+    partial = app.db.Column(app.db.Boolean, nullable=False, default=False) # True if the response stream was interrupted
+    timestamp = app.db.Column(app.db.DateTime, nullable=False, default=datetime.now)
+
+    def __repr__(self):
+        return f'<BattleMessage {self.seq} (Battle: {self.battle_id}, Creator: {self.creator})>'
+
+    # Helper to convert model to the battle log entry format
+    def to_dict(self):
+        message = {
+            "creator": self.creator,
+            "message": self.message,
+            "timestamp": self.timestamp.isoformat(),
+        }
+        if self.partial:
+            message["partial"] = True
+        return message
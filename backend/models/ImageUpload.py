@@ -0,0 +1,38 @@
+import uuid
+from datetime import datetime
+from backend.src.app import app
+from sqlalchemy.dialects.postgresql import UUID
+
+class ImageUpload(app.db.Model):
+    __tablename__ = 'image_uploads'
+    __table_args__ = (
+        # A user uploading the same photo twice gets the same upload
+        app.db.Index('ux_image_uploads_user_sha256', 'user_id', 'sha256', unique=True),
+    )
+
+    # Columns
+    id = app.db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = app.db.Column(UUID(as_uuid=True), app.db.ForeignKey('users.id'), nullable=False) # Foreign key to users table
+    sha256 = app.db.Column(app.db.String(64), nullable=False, index=True) # Content hash, also names the stored file
+    filename = app.db.Column(app.db.Text, nullable=True) # Name of the uploaded file, never used as a path
+    content_type = app.db.Column(app.db.String(50), nullable=False) # Sniffed from the content, e.g. 'image/jpeg'
+    size_bytes = app.db.Column(app.db.Integer, nullable=False)
+    status = app.db.Column(app.db.String(20), nullable=False, default='pending') # 'pending', 'processing', 'done' or 'failed'
+    analysis = app.db.Column(app.db.Text, nullable=True) # The model's description of the photo
+    error = app.db.Column(app.db.Text, nullable=True)
+    created_at = app.db.Column(app.db.DateTime, nullable=False, default=datetime.now)
+    processed_at = app.db.Column(app.db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<ImageUpload {self.id} (User: {self.user_id}, Status: {self.status})>'
+
+    # Helper to convert model to dictionary
+    def to_dict(self):
+        return {
+            "job_id": str(self.id),
+            "status": self.status,
+            "filename": self.filename,
+            "size_bytes": self.size_bytes,
+            "analysis": self.analysis,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
@@ -29,4 +29,3 @@ class Interaction(app.db.Model):
             "llm_output": self.llm_output,
             "context": self.context # JSONB is directly serializable
         }
-print(f"--- MODEL LOADED: {Interaction.__name__} (Table: {Interaction.__tablename__}) ---") # <--- ADD THIS
\ No newline at end of file
@@ -0,0 +1,40 @@
+import uuid
+from backend.src.app import app
+from sqlalchemy.dialects.postgresql import UUID
+
+class Roster(app.db.Model):
+    __tablename__ = 'rosters'
+    __table_args__ = (
+        # One roster per side of a battle, also the index used to load a battle's rosters
+        app.db.Index('ux_rosters_battle_side', 'battle_id', 'side', unique=True),
+    )
+
+    # Columns
+    id = app.db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    battle_id = app.db.Column(UUID(as_uuid=True), app.db.ForeignKey('battles.id', ondelete='CASCADE'), nullable=False) # Foreign key to battles table
+    side = app.db.Column(app.db.String(10), nullable=False) # 'player' or 'opponent' (played by the model)
+    army_name = app.db.Column(app.db.Text, nullable=True)
+    faction = app.db.Column(app.db.Text, nullable=True, index=True)
+    detachment = app.db.Column(app.db.Text, nullable=True)
+    points = app.db.Column(app.db.Integer, nullable=True) # Army size in points
+    notes = app.db.Column(app.db.Text, nullable=True) # Army details that did not parse
+    prompt_text = app.db.Column(app.db.Text, nullable=False) # Compact rendering sent to the model, see roster.render_prompt
+
+    # Relationships
+    units = app.db.relationship('RosterUnit', order_by='RosterUnit.position', lazy='select',
+                                cascade="all, delete-orphan", passive_deletes=True)
+
+    def __repr__(self):
+        return f'<Roster {self.faction} (Battle: {self.battle_id}, Side: {self.side})>'
+
+    # Helper to convert model to dictionary
+    def to_dict(self):
+        return {
+            "side": self.side,
+            "army_name": self.army_name,
+            "faction": self.faction,
+            "detachment": self.detachment,
+            "points": self.points,
+            "notes": self.notes,
+            "units": [unit.to_dict() for unit in self.units],
+        }
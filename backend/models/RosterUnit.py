@@ -0,0 +1,33 @@
+from backend.src.app import app
+from sqlalchemy.dialects.postgresql import UUID, JSONB
+
+class RosterUnit(app.db.Model):
+    __tablename__ = 'roster_units'
+    __table_args__ = (
+        app.db.Index('ux_roster_units_roster_position', 'roster_id', 'position', unique=True),
+    )
+
+    # Columns
+    id = app.db.Column(app.db.BigInteger, primary_key=True, autoincrement=True)
+    roster_id = app.db.Column(UUID(as_uuid=True), app.db.ForeignKey('rosters.id', ondelete='CASCADE'), nullable=False) # Foreign key to rosters table
+    position = app.db.Column(app.db.Integer, nullable=False) # Order of the unit in the army list
+    name = app.db.Column(app.db.Text, nullable=False, index=True)
+    points = app.db.Column(app.db.Integer, nullable=True)
+    models = app.db.Column(app.db.Integer, nullable=False, default=1) # Number of models in the unit
+    wargear = app.db.Column(JSONB, nullable=False, default=list) # ["5x Bolt rifle", ...]
+    keywords = app.db.Column(JSONB, nullable=False, default=list) # ["Character", "Warlord", ...]
+    enhancement = app.db.Column(app.db.Text, nullable=True)
+
+    def __repr__(self):
+        return f'<RosterUnit {self.name} (Roster: {self.roster_id})>'
+
+    # Helper to convert model to dictionary
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "points": self.points,
+            "models": self.models,
+            "wargear": self.wargear,
+            "keywords": self.keywords,
+            "enhancement": self.enhancement,
+        }
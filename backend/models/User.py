@@ -20,6 +20,9 @@ class User(app.db.Model):
     def __repr__(self):
         return f'<User {self.username} (ID: {self.id})>'
 
+    # Keys of to_dict(), selectable with the 'fields' query parameter
+    FIELDS = ('user_id', 'username', 'email', 'created_at', 'profile_picture')
+
     # Helper to convert model to dictionary for JSON response
     def to_dict(self):
         return {
@@ -29,4 +32,3 @@ class User(app.db.Model):
             "created_at": self.created_at.isoformat(), # Use ISO format for dates
             "profile_picture": str(self.profile_picture)
         }
-print(f"--- MODEL LOADED: {User.__name__} (Table: {User.__tablename__}) ---") # <--- ADD THIS
\ No newline at end of file
@@ -1,3 +1,8 @@
 from .User import User
 from .Interaction import Interaction
 from .Battle import Battle
+from .BattleMessage import BattleMessage
+from .BattleArchive import BattleArchive
+from .Roster import Roster
+from .RosterUnit import RosterUnit
+from .ImageUpload import ImageUpload
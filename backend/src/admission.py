@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import math
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from redis import Redis, RedisError
+
+from backend.src.app import app
+from backend.src.concurrency import GenerationBusy
+from backend.src.metrics import REGISTRY, Counter, Histogram
+from backend.src.parameters import (ADMISSION_BURST, ADMISSION_CONCURRENCY, ADMISSION_ENABLED, ADMISSION_LEASE_SECONDS,
+                                    ADMISSION_MAX_QUEUE, ADMISSION_RATE, GENERATION_QUEUE_TIMEOUT)
+
+log = logging.getLogger(__name__)
+
+ADMISSION_REQUESTS = REGISTRY.register(Counter(
+    "admission_requests_total",
+    "Chat turns by admission result (admitted, rate_limited, queue_full, timeout, error)", ("result",)))
+ADMISSION_WAIT = REGISTRY.register(Histogram(
+    "admission_wait_seconds", "Time chat turns waited for a deployment wide generation slot", ("result",)))
+
+BUCKET_KEY = "admission:bucket:{}"
+HOLDERS_KEY = "admission:holders" # zset of granted tickets by lease expiry
+QUEUE_KEY = "admission:queue" # zset of waiting tickets by fair queuing tag
+DEADLINES_KEY = "admission:deadlines" # zset of waiting tickets by the time their waiter has to poll again by
+TAGS_KEY = "admission:tags" # hash of user -> finish tag of their last queued ticket
+STATE_KEY = "admission:state" # hash with the virtual time (tag of the last granted ticket) and the ticket sequence
+
+# Waiters re-check their ticket at this interval, doubling up to the maximum. A waiter that has not polled
+# for ABANDON_AFTER seconds (gone away, crashed) loses its place in the queue.
+POLL_INTERVAL = 0.02
+MAX_POLL_INTERVAL = 0.25
+ABANDON_AFTER = 2.0
+# Rough duration of a model call, Retry-After of a turn that found no slot assumes the turns ahead take this long
+SECONDS_PER_TURN = 5
+
+# KEYS[1] bucket, ARGV rate (tokens per second), capacity. Returns {1, 0} or {0, seconds until a token}.
+_TAKE_TOKEN = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = math.min(capacity, (tonumber(bucket[1]) or capacity) + math.max(0, now - (tonumber(bucket[2]) or now)) * rate)
+local taken = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    taken = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {taken, tostring(taken == 1 and 0 or (1 - tokens) / rate)}
+"""
+
+# Hands free slots to the head of the queue, skipping abandoned tickets. Start-time fair queuing: a ticket's tag
+# is max(virtual time, finish tag of the user's previous ticket), so backlogged users take turns and each user's
+# tickets keep their order. Ticket names start with a sequence number, which breaks ties in arrival order.
+_GRANT = """
+local function now()
+    local time = redis.call('TIME')
+    return tonumber(time[1]) + tonumber(time[2]) / 1000000
+end
+
+local function forget_user(ticket, tag)
+    local user = string.match(ticket, '^%d+:([^:]*):')
+    local finish = tonumber(redis.call('HGET', KEYS[4], user))
+    if finish and finish <= tag + 1 then
+        redis.call('HDEL', KEYS[4], user)
+    end
+end
+
+local function grant(now, limit, lease)
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+    while redis.call('ZCARD', KEYS[1]) < limit do
+        local head = redis.call('ZRANGE', KEYS[2], 0, 0, 'WITHSCORES')
+        if #head == 0 then
+            break
+        end
+        local ticket, tag = head[1], tonumber(head[2])
+        local deadline = tonumber(redis.call('ZSCORE', KEYS[3], ticket))
+        redis.call('ZREM', KEYS[2], ticket)
+        redis.call('ZREM', KEYS[3], ticket)
+        forget_user(ticket, tag)
+        if deadline and deadline >= now then
+            redis.call('ZADD', KEYS[1], now + lease, ticket)
+            redis.call('HSET', KEYS[5], 'vtime', tostring(tag))
+        end
+    end
+end
+"""
+
+# KEYS holders, queue, deadlines, tags, state. ARGV limit, lease, max queue, patience, user, ticket ('' to join).
+# Returns {status, ticket, queued}: status 1 granted, 0 waiting, -1 queue full, -2 dropped from the queue.
+_ACQUIRE = _GRANT + """
+local limit, lease, max_queue, patience = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local now = now()
+local ticket = ARGV[6]
+if ticket == '' then
+    grant(now, limit, lease)
+    if redis.call('ZCARD', KEYS[1]) >= limit and redis.call('ZCARD', KEYS[2]) >= max_queue then
+        return {-1, '', redis.call('ZCARD', KEYS[2])}
+    end
+    local user = ARGV[5]
+    local start = math.max(tonumber(redis.call('HGET', KEYS[5], 'vtime')) or 0, tonumber(redis.call('HGET', KEYS[4], user)) or 0)
+    redis.call('HSET', KEYS[4], user, tostring(start + 1))
+    ticket = string.format('%016d:%s:%s', redis.call('HINCRBY', KEYS[5], 'seq', 1), user, ARGV[7])
+    redis.call('ZADD', KEYS[2], start, ticket)
+elseif redis.call('ZSCORE', KEYS[1], ticket) then
+    return {1, ticket, redis.call('ZCARD', KEYS[2])}
+elseif not redis.call('ZSCORE', KEYS[2], ticket) then
+    return {-2, ticket, redis.call('ZCARD', KEYS[2])}
+end
+redis.call('ZADD', KEYS[3], now + patience, ticket)
+grant(now, limit, lease)
+local status = redis.call('ZSCORE', KEYS[1], ticket) and 1 or 0
+return {status, ticket, redis.call('ZCARD', KEYS[2])}
+"""
+
+# KEYS as _ACQUIRE, ARGV limit, lease, ticket. Frees the ticket's slot or takes it out of the queue.
+_RELEASE = _GRANT + """
+local ticket = ARGV[3]
+redis.call('ZREM', KEYS[1], ticket)
+local tag = tonumber(redis.call('ZSCORE', KEYS[2], ticket))
+if tag then
+    redis.call('ZREM', KEYS[2], ticket)
+    redis.call('ZREM', KEYS[3], ticket)
+    forget_user(ticket, tag)
+end
+grant(now(), tonumber(ARGV[1]), tonumber(ARGV[2]))
+return redis.call('ZCARD', KEYS[2])
+"""
+
+_QUEUE_KEYS = [HOLDERS_KEY, QUEUE_KEY, DEADLINES_KEY, TAGS_KEY, STATE_KEY]
+
+
+class RateLimited(GenerationBusy):
+    """
+    Raised when a user sends chat turns faster than their token bucket refills.
+    """
+
+
+class Admission:
+    """
+    Deployment wide admission control of chat turns, shared by every web and Celery process through Redis.
+    Each user has a token bucket (`rate` turns per second, up to `burst` at once), a turn finding it empty is
+    rejected with the seconds until the next token. Admitted turns then take one of `limit` generation slots;
+    while all are taken they wait in a queue that serves users in turn (a user with many waiting turns does not
+    hold up a user with one) and each user's turns in order, for up to `timeout` seconds.
+    A slot that is never released (crashed worker) frees up after `lease_seconds`.
+    If Redis is unavailable turns are admitted without either check.
+    """
+
+    def __init__(self, get_redis: Callable[[], Redis], enabled: bool, rate: float, burst: int, limit: int,
+                 max_queue: int, lease_seconds: int, timeout: float):
+        self._get_redis = get_redis
+        self.enabled = enabled
+        self.rate = rate
+        self.burst = burst
+        self.limit = limit
+        self.max_queue = max_queue
+        self.lease_seconds = lease_seconds
+        self.timeout = timeout
+        self._scripts = {}
+
+    def _script(self, source: str):
+        # Registered per client, redis-py re-sends a script after a NOSCRIPT (e.g. a Redis restart)
+        redis = self._get_redis()
+        if self._scripts.get(source, (None,))[0] is not redis:
+            self._scripts[source] = (redis, redis.register_script(source))
+        return self._scripts[source][1]
+
+    def take_token(self, user_id):
+        """
+        Takes a token from the user's bucket. Raises RateLimited when it is empty.
+        """
+        if not self.enabled:
+            return
+        try:
+            taken, wait = self._script(_TAKE_TOKEN)(keys=[BUCKET_KEY.format(user_id)], args=[self.rate, self.burst])
+        except RedisError as e:
+            log.warning(f"Admission control unavailable: {e}")
+            ADMISSION_REQUESTS.inc(result="error")
+            return
+        if not taken:
+            ADMISSION_REQUESTS.inc(result="rate_limited")
+            raise RateLimited(f"User {user_id} is out of chat turns", retry_after=max(1, math.ceil(float(wait))))
+
+    def _poll(self, user_id, ticket: Optional[bytes]) -> List:
+        return self._script(_ACQUIRE)(keys=_QUEUE_KEYS, args=[
+            self.limit, self.lease_seconds, self.max_queue, ABANDON_AFTER, str(user_id), ticket or "", uuid.uuid4().hex])
+
+    def _result(self, user_id, status: int, queued: int, waited: float):
+        if status == 1:
+            ADMISSION_REQUESTS.inc(result="admitted")
+            ADMISSION_WAIT.observe(waited, result="admitted")
+            return
+        result = "queue_full" if status == -1 else "timeout"
+        ADMISSION_REQUESTS.inc(result=result)
+        ADMISSION_WAIT.observe(waited, result=result)
+        retry_after = max(1, math.ceil(queued / max(self.limit, 1))) * SECONDS_PER_TURN
+        raise GenerationBusy(f"No generation slot for user {user_id} ({queued} turns queued, {result})",
+                             retry_after=retry_after)
+
+    def acquire(self, user_id, timeout: Optional[float] = None) -> Optional[bytes]:
+        """
+        Waits for a generation slot, returns the ticket to release it with (None when admission control is off
+        or unavailable). Raises GenerationBusy when the queue is full or the wait times out.
+        timeout overrides self.timeout, 0 only takes a slot that is free right away.
+        """
+        if not self.enabled:
+            return None
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        interval = POLL_INTERVAL
+        ticket = None
+        try:
+            status, ticket, queued = self._poll(user_id, ticket)
+            while status == 0 and time.monotonic() - start < timeout:
+                time.sleep(interval)
+                interval = min(interval * 2, MAX_POLL_INTERVAL)
+                status, ticket, queued = self._poll(user_id, ticket)
+        except RedisError as e:
+            log.warning(f"Admission control unavailable: {e}")
+            ADMISSION_REQUESTS.inc(result="error")
+            return None
+        if status != 1 and ticket:
+            self.release(ticket)
+        self._result(user_id, status, queued, time.monotonic() - start)
+        return ticket
+
+    async def acquire_async(self, user_id, timeout: Optional[float] = None) -> Optional[bytes]:
+        """
+        acquire() without holding a thread while waiting.
+        """
+        if not self.enabled:
+            return None
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        interval = POLL_INTERVAL
+        ticket = None
+        try:
+            status, ticket, queued = await asyncio.to_thread(self._poll, user_id, ticket)
+            while status == 0 and time.monotonic() - start < timeout:
+                await asyncio.sleep(interval)
+                interval = min(interval * 2, MAX_POLL_INTERVAL)
+                status, ticket, queued = await asyncio.to_thread(self._poll, user_id, ticket)
+        except RedisError as e:
+            log.warning(f"Admission control unavailable: {e}")
+            ADMISSION_REQUESTS.inc(result="error")
+            return None
+        if status != 1 and ticket:
+            await asyncio.to_thread(self.release, ticket)
+        self._result(user_id, status, queued, time.monotonic() - start)
+        return ticket
+
+    def release(self, ticket: Optional[bytes]):
+        """
+        Frees the slot of a ticket (or its place in the queue) and hands free slots to the next waiting turns.
+        """
+        if not ticket:
+            return
+        try:
+            self._script(_RELEASE)(keys=_QUEUE_KEYS, args=[self.limit, self.lease_seconds, ticket])
+        except RedisError as e:
+            log.warning(f"Failed to release generation slot {ticket}, it frees up when its lease ends: {e}")
+
+    @contextmanager
+    def slot(self, user_id, timeout: Optional[float] = None):
+        ticket = self.acquire(user_id, timeout)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Queue depth, the number of users waiting and the slots in use, across all processes.
+        """
+        redis = self._get_redis()
+        pipe = redis.pipeline()
+        pipe.zcount(HOLDERS_KEY, time.time(), "+inf")
+        pipe.zrange(QUEUE_KEY, 0, -1)
+        in_flight, queued = pipe.execute()
+        return {"in_flight": in_flight, "limit": self.limit, "queued": len(queued),
+                "queued_users": len({ticket.split(b":")[1] for ticket in queued})}
+
+
+admission = Admission(lambda: app.redis, ADMISSION_ENABLED, ADMISSION_RATE, ADMISSION_BURST, ADMISSION_CONCURRENCY,
+                      ADMISSION_MAX_QUEUE, ADMISSION_LEASE_SECONDS, GENERATION_QUEUE_TIMEOUT)
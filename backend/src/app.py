@@ -2,11 +2,21 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-import logging
+from typing import TYPE_CHECKING
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from .gen_client import GenClient
+from redis import Redis
+from sqlalchemy.engine import Engine
+from .database import engine_options, pool_metrics
+from .logging_config import configure_logging
+from .metrics import instrument_engine_events
+from .parameters import REDIS_URL, RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_CLASSIFIER
+from .response_cache import ResponseCache, is_rules_question, load_classifier
+from .serialization import json_provider_class
+
+if TYPE_CHECKING:
+    from .gen_client import GenClient
 
 
 
@@ -14,22 +24,16 @@ class App:
 
     _flask: Flask = None
     _db: SQLAlchemy = None
-    _gen_client: GenClient = None
+    _gen_client: "GenClient" = None
+    _redis: Redis = None
 
     
     def setup_flask(self):
         flask = Flask(__name__)
+        flask.json = json_provider_class()(flask)
         CORS(flask, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
-        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-        file_handler = logging.FileHandler('app.log')
-        file_handler.setLevel(logging.INFO)
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        file_handler.setFormatter(formatter)
-        flask.logger.addHandler(file_handler)
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.INFO)
-        console_handler.setFormatter(formatter)
-        flask.logger.addHandler(console_handler)
+        # flask.logger propagates to the root logger's queue, Flask adds no handler of its own when the root has one
+        configure_logging()
 
         return flask
 
@@ -47,17 +51,48 @@ class App:
                 raise ValueError("No DATABASE_URL set for Flask application. Please set it in .env file.")
             self.flask.config['SQLALCHEMY_DATABASE_URI'] = db_url
             self.flask.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False # Disable modification tracking overhead
+            self.flask.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(db_url)
             self._db = SQLAlchemy(self.flask)
+            instrument_engine_events(Engine)
         return self._db
+
+    def pool_metrics(self):
+        """
+        Connection pool metrics of this process (checked out connections, overflow, checkout wait time).
+        """
+        with self.flask.app_context():
+            return pool_metrics(self.db.engine)
     
+    def after_fork(self):
+        """
+        Drops what a forked process must not share with its parent: pooled database connections
+        (closed by the parent, not here) and the Redis client. Both are recreated on first use.
+        """
+        if self._db is not None:
+            with self.flask.app_context():
+                self._db.engine.dispose(close=False)
+        self._redis = None
+
     @property
     def log(self):
         return self.flask.logger
     
+    @property
+    def redis(self):
+        if not self._redis:
+            self._redis = Redis.from_url(REDIS_URL)
+        return self._redis
+
     @property
     def gen_client(self):
         if not self._gen_client:
-            self._gen_client = GenClient()
+            # google-genai takes most of the import time of the app, only load it once a model call needs it
+            from .gen_client import GenClient
+            response_cache = None
+            if RESPONSE_CACHE_ENABLED:
+                classifier = load_classifier(RESPONSE_CACHE_CLASSIFIER) if RESPONSE_CACHE_CLASSIFIER else is_rules_question
+                response_cache = ResponseCache(lambda: self.redis, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRIES, classifier)
+            self._gen_client = GenClient(response_cache=response_cache, get_redis=lambda: self.redis)
         return self._gen_client
     
 
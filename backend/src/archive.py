@@ -0,0 +1,128 @@
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, func, insert, or_, select
+
+from backend.models.Battle import Battle
+from backend.models.BattleArchive import BattleArchive
+from backend.models.BattleMessage import BattleMessage
+from backend.src.app import app
+from backend.src.log_codec import encode_log
+from backend.src.metrics import REGISTRY, Counter
+from backend.src.parameters import ARCHIVE_INACTIVE_DAYS
+
+db = app.db
+log = app.log
+
+BATTLE_ARCHIVE_OPERATIONS = REGISTRY.register(Counter(
+    "battle_archive_operations_total", "Battle logs moved to (archived) and back from (restored) cold storage", ("action",)))
+
+
+def archivable_battle_ids(limit: int, inactive_days: int = ARCHIVE_INACTIVE_DAYS, session=None) -> List[uuid.UUID]:
+    """
+    Battles with messages in the hot table that are archived, or had no new message for `inactive_days`.
+    A battle restored within `inactive_days` stays hot, it is being looked at again.
+    """
+    session = session or db.session
+    cutoff = datetime.now() - timedelta(days=inactive_days)
+    last_message = (select(func.max(BattleMessage.timestamp))
+                    .where(BattleMessage.battle_id == Battle.id)
+                    .scalar_subquery())
+    return session.execute(
+        select(Battle.id)
+        .where(Battle.log_archived.is_(False), Battle.message_seq > 0,
+               or_(Battle.archived.is_(True), func.coalesce(last_message, Battle.timestamp) < cutoff),
+               or_(Battle.log_restored_at.is_(None), Battle.log_restored_at < cutoff))
+        .order_by(Battle.timestamp)
+        .limit(limit)
+    ).scalars().all()
+
+
+def archive_battle(battle_id, session=None) -> Optional[int]:
+    """
+    Compresses a battle's messages into battle_archives and deletes them from battle_messages, leaving
+    the battle row as a stub (log_archived). Commits. Returns the number of archived messages,
+    None if the battle is gone or already archived.
+    The battle row lock serializes this with chat turns (see allocate_message_seq).
+    """
+    session = session or db.session
+    battle = session.execute(select(Battle).where(Battle.id == battle_id).with_for_update()).scalar_one_or_none()
+    if battle is None or battle.log_archived:
+        session.rollback()
+        return None
+    battle_log = battle.message_log
+    codec, payload, raw_bytes = encode_log(battle_log)
+    session.add(BattleArchive(battle_id=battle.id, codec=codec, payload=payload,
+                              message_count=len(battle_log), raw_bytes=raw_bytes))
+    session.execute(delete(BattleMessage).where(BattleMessage.battle_id == battle.id))
+    battle.battle_log = None
+    battle.log_archived = True
+    session.commit()
+    BATTLE_ARCHIVE_OPERATIONS.inc(action="archived")
+    return len(battle_log)
+
+
+def restore_battle_log(battle_id, session=None) -> int:
+    """
+    Moves an archived battle's messages back into battle_messages. Commits.
+    Returns the number of restored messages, 0 if the battle log was not archived.
+    """
+    session = session or db.session
+    battle = session.execute(select(Battle).where(Battle.id == battle_id).with_for_update()).scalar_one_or_none()
+    if battle is None or not battle.log_archived:
+        session.rollback()
+        return 0
+    restored = 0
+    if battle.archive is not None:
+        rows = [{
+            "battle_id": battle.id,
+            "seq": int(seq),
+            "creator": entry.get("creator", "user"),
+            "message": entry.get("message") or "",
+            "partial": bool(entry.get("partial", False)),
+            "timestamp": datetime.fromisoformat(entry["timestamp"]) if entry.get("timestamp") else datetime.now(),
+        } for seq, entry in battle.archive.message_log().items()]
+        if rows:
+            session.execute(insert(BattleMessage), rows)
+        session.execute(delete(BattleArchive).where(BattleArchive.battle_id == battle.id))
+        restored = len(rows)
+    battle.log_archived = False
+    battle.log_restored_at = datetime.now()
+    session.commit()
+    # Drops the stale collections loaded above, the next read sees the restored messages
+    session.expire(battle)
+    BATTLE_ARCHIVE_OPERATIONS.inc(action="restored")
+    log.info(f"Restored {restored} archived messages of battle {battle_id}")
+    return restored
+
+
+def archive_battles(limit: int, inactive_days: int = ARCHIVE_INACTIVE_DAYS) -> int:
+    """
+    Archives up to `limit` battles (see archivable_battle_ids), one transaction per battle.
+    Returns the number of archived battles.
+    """
+    archived = 0
+    for battle_id in archivable_battle_ids(limit, inactive_days):
+        try:
+            if archive_battle(battle_id) is not None:
+                archived += 1
+        except Exception as e:
+            db.session.rollback()
+            log.error(f"Failed to archive battle {battle_id}: {e}")
+    if archived:
+        log.info(f"Archived the messages of {archived} battles")
+    return archived
+
+
+def archive_stats(session=None) -> Dict[str, int]:
+    """
+    Totals of the cold storage, for the CLI.
+    """
+    battles, messages, raw_bytes, stored_bytes = (session or db.session).execute(
+        select(func.count(), func.coalesce(func.sum(BattleArchive.message_count), 0),
+               func.coalesce(func.sum(BattleArchive.raw_bytes), 0),
+               func.coalesce(func.sum(func.length(BattleArchive.payload)), 0))
+        .select_from(BattleArchive)
+    ).one()
+    return {"battles": battles, "messages": messages, "raw_bytes": raw_bytes, "stored_bytes": stored_bytes}
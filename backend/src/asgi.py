@@ -0,0 +1,806 @@
+"""
+Asynchronous (ASGI) entry point serving the same API as server.py, for deployments where most
+requests wait on Gemini: a waiting chat turn holds no thread, so one process serves many more
+concurrent turns at the same memory.
+
+    uvicorn backend.src.asgi:app --host 0.0.0.0 --port 5000 --workers 4
+
+Requires the 'asgi' extra (pip install -e 'backend[asgi]'). Models, BattleState, the battle and
+response caches and the Celery tasks are shared with the Flask app; queries run on an asyncpg
+engine and model calls on the asyncio Gemini client. Redis and Celery have no asyncio client in
+use here, their (short) calls run in the default thread pool.
+"""
+import asyncio
+import os
+import time
+import uuid
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import AsyncIterator, Dict, List, Optional
+
+import anyio
+import httpx
+import jwt
+from google.auth.exceptions import TransportError
+from google.oauth2 import id_token
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from backend.models.Battle import Battle
+from backend.models.ImageUpload import ImageUpload
+from backend.models.Interaction import Interaction
+from backend.models.User import User
+from backend.src.app import app as source
+from backend.src.battle_cache import battle_cache, battle_snapshot
+from backend.src.battle_queries import battle_page_statement, new_battle, parse_turn
+from backend.src.battle_state import BattleNotFound, BattleState, get_battle_snapshot_async
+from backend.src.admission import admission, RateLimited
+from backend.src.concurrency import AsyncConcurrencyLimiter, GenerationBusy, async_generation_limiter
+from backend.src.database import async_database_url, async_engine_options, pool_metrics
+from backend.src.idempotency import IdempotentRequest, idempotency_store, request_fingerprint
+from backend.src.image_store import (DONE as IMAGE_DONE, FAILED as IMAGE_FAILED, MAX_UPLOAD_REQUEST_BYTES, UnsupportedImage,
+                                    UploadTooLarge, register_upload, save_upload)
+from backend.src.job_owners import job_owners
+from backend.src.helpers import decode_cursor, decode_token, encode_cursor, parse_bool_arg, token_cache
+from backend.src.http_client import google_request
+from backend.src.logging_config import log_payload
+from backend.src.metrics import REGISTRY, REQUEST_TIMINGS, GaugeCollector, observe_request
+from backend.src.parameters import (COMPRESSION_MIN_BYTES, DEFAULT_BATTLE_PAGE_SIZE, GENERATION_MODE, GOOGLE_TOKEN_URL,
+                                    GZIP_LEVEL, HTTP_CONNECT_TIMEOUT, HTTP_POOL_SIZE, HTTP_READ_TIMEOUT, JWT_ALGORITHM,
+                                    JWT_SECRET, LOG_PAYLOADS, MAX_BATTLE_PAGE_SIZE, MAX_IMAGE_BYTES, METRICS_TOKEN)
+from backend.src.serialization import encode_json, parse_fields, select_fields
+from backend.tasks.interaction_buffer import flush_stats
+from backend.tasks.tasks import generate_reply_task, log_interaction_task, process_image_task
+
+log = source.log
+
+
+class OrjsonResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return encode_json(content)
+
+
+def jsonify(content, status_code: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    return OrjsonResponse(content, status_code=status_code, headers=headers)
+
+
+async def read_json(request: Request) -> Dict:
+    try:
+        return await request.json()
+    except ValueError:
+        raise HTTPException(400, "Request body must be JSON")
+
+
+def jwt_required(endpoint):
+    """
+    helpers.jwt_required for the ASGI app, passes the verified token payload after the request.
+    """
+    @wraps(endpoint)
+    async def decorated_endpoint(request: Request):
+        auth_header = request.headers.get("Authorization", "")
+        identity = decode_token(auth_header[7:]) if auth_header.startswith("Bearer ") else None
+        if not identity:
+            return jsonify({"error": "Unauthorized"}, 401)
+        return await endpoint(request, identity)
+    return decorated_endpoint
+
+
+def identity_user_id(identity: Dict) -> Optional[uuid.UUID]:
+    try:
+        return uuid.UUID(identity.get('user_id'))
+    except (TypeError, ValueError):
+        return None
+
+
+def sessions(request: Request):
+    return request.app.state.sessions()
+
+
+async def metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"error": "Unauthorized"}, 401)
+    # Collectors read Redis and the pool with blocking calls
+    return PlainTextResponse(await asyncio.to_thread(REGISTRY.render), media_type='text/plain; version=0.0.4')
+
+
+async def google_authorization(request: Request):
+    data = await read_json(request)
+    code = data.get('code')
+    client_id = data.get('client_id')
+    redirect_uri = data.get('redirect_uri')
+    if not code or not client_id or not redirect_uri:
+        return jsonify({'error': 'Missing required parameters'}, 400)
+    try:
+        token_resp = await request.app.state.http.post(GOOGLE_TOKEN_URL, data={
+            'code': code,
+            'client_id': client_id,
+            'client_secret': os.environ.get('GOOGLE_CLIENT_SECRET'),
+            'redirect_uri': redirect_uri,
+            'grant_type': 'authorization_code'
+        })
+    except httpx.HTTPError as e:
+        log.error(f"Token exchange failed: {e}")
+        return jsonify({'error': 'Failed to exchange code', 'details': str(e)}, 502)
+    if not token_resp.is_success:
+        log.error(f"Token exchange failed: {token_resp.text}")
+        return jsonify({'error': 'Failed to exchange code', 'details': token_resp.text}, 400)
+
+    id_token_jwt = token_resp.json().get('id_token')
+    if not id_token_jwt:
+        log.error("No id_token in response")
+        return jsonify({'error': 'No id_token in response'}, 400)
+
+    try:
+        # Google's signing certificates are cached per process, refetched with a blocking client when expired
+        idinfo = await asyncio.to_thread(id_token.verify_oauth2_token, id_token_jwt, google_request, client_id)
+    except ValueError as e:
+        return jsonify({'error': 'Invalid id_token', 'details': str(e)}, 401)
+    except TransportError as e:
+        log.error(f"Fetching Google's signing certificates failed: {e}")
+        return jsonify({'error': 'Failed to verify id_token', 'details': str(e)}, 502)
+    if LOG_PAYLOADS:
+        log.info(f"ID Token verified: {idinfo}")
+
+    email = idinfo.get('email')
+    username = idinfo.get('name')
+    async with sessions(request) as session:
+        user = (await session.execute(select(User).where(or_(
+            User.email == email if email else False,
+            User.username == username if username else False,
+        )).limit(1))).scalars().first()
+        if user is None:
+            user = User(id=uuid.uuid4(), username=username, email=email,
+                        profile_picture=idinfo.get('picture'), created_at=datetime.now())
+            session.add(user)
+            await session.commit()
+    payload = {
+        "user_id": str(user.id),
+        "email": user.email,
+        "exp": datetime.now().astimezone() + timedelta(hours=12)
+    }
+    return jsonify({
+        "access_token": jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM),
+        "user": user.to_dict()
+    })
+
+
+@jwt_required
+async def get_user(request: Request, identity: Dict):
+    try:
+        fields = parse_fields(request.query_params.get('fields'), User.FIELDS)
+    except ValueError as e:
+        return jsonify({"error": "Invalid query parameter", "details": str(e)}, 400)
+    async with sessions(request) as session:
+        user = (await session.execute(
+            select(User).where(User.email == str(request.path_params['email'])).limit(1))).scalars().first()
+    if user is None:
+        return jsonify({"error": "Users not found"}, 404)
+    return jsonify(select_fields(user.to_dict(), fields))
+
+
+@jwt_required
+async def update_user(request: Request, identity: Dict):
+    data = await read_json(request)
+    user_id = data.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Missing user_id"}, 400)
+    try:
+        user_id = uuid.UUID(user_id)
+    except ValueError:
+        return jsonify({"error": "Invalid user_id format"}, 400)
+    async with sessions(request) as session:
+        user = await session.get(User, user_id)
+        if user is None:
+            return jsonify({"error": "User not found"}, 404)
+        if 'name' in data:
+            user.username = data['name']
+        if 'email' in data:
+            user.email = data['email']
+        if 'profile_picture' in data:
+            user.profile_picture = data['profile_picture']
+        try:
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            return jsonify({"error": "Failed to update user", "details": str(e)}, 500)
+        return jsonify(user.to_dict())
+
+
+@jwt_required
+async def fetch_battles(request: Request, identity: Dict):
+    """
+    The battle listing, see server.fetch_battles for the query parameters.
+    """
+    args = request.query_params
+    user_id = args.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Missing user_id parameter"}, 400)
+    try:
+        user_id = uuid.UUID(user_id)
+        archived = parse_bool_arg(args.get('archived'))
+        limit = int(args.get('limit', DEFAULT_BATTLE_PAGE_SIZE))
+        cursor = args.get('cursor')
+        after = decode_cursor(cursor) if cursor else None
+        fields = parse_fields(args.get('fields'), Battle.SUMMARY_COLUMNS + ('battle_log',))
+    except ValueError as e:
+        return jsonify({"error": "Invalid query parameter", "details": str(e)}, 400)
+    if user_id != identity_user_id(identity):
+        return jsonify({"error": "user_id does not match the authenticated user"}, 403)
+    limit = max(1, min(limit, MAX_BATTLE_PAGE_SIZE))
+    include = set(filter(None, args.get('include', '').split(',')))
+    if fields is None:
+        fields = Battle.SUMMARY_COLUMNS + (('battle_log',) if 'battle_log' in include else ())
+    try:
+        async with sessions(request) as session:
+            result = await session.execute(battle_page_statement(user_id, fields, limit, archived, after))
+            battles = result.scalars().all()
+            page = battles[:limit]
+            body = [battle.to_dict(fields=fields) for battle in page]
+    except Exception as e:
+        log.info(f"Error fetching battles: {e}")
+        return jsonify({"error": "Failed to fetch battles"}, 500)
+    headers = {'X-Next-Cursor': encode_cursor(page[-1].timestamp, page[-1].id)} if len(battles) > limit else None
+    return jsonify(body, headers=headers)
+
+
+@jwt_required
+async def create_battle(request: Request, identity: Dict):
+    data = await read_json(request)
+    log_payload(log, "create_battle", "Create battle request body", data)
+    if not data:
+        return jsonify({"error": "Missing data in request body"}, 400)
+    try:
+        user_id = uuid.UUID(data.get('userId'))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid userId format"}, 400)
+
+    battle = new_battle(user_id, data)
+    async with sessions(request) as session:
+        try:
+            session.add(battle)
+            await session.commit()
+        except IntegrityError as e:
+            await session.rollback()
+            log.info(f"Database Integrity Error: {e}")
+            return jsonify({"error": "Database error creating battle"}, 500)
+    await asyncio.to_thread(battle_cache.put, battle.id, battle_snapshot(battle))
+    log.info(f"Battle created: {battle}")
+    return jsonify(battle.to_dict(), 201)
+
+
+async def owned_snapshot(request: Request, identity: Dict, battle_id: uuid.UUID) -> Optional[Dict]:
+    async with sessions(request) as session:
+        snapshot = await get_battle_snapshot_async(session, battle_id)
+    if snapshot is None or snapshot["user_id"] != str(identity_user_id(identity)):
+        return None
+    return snapshot
+
+
+async def load_battle_log(request: Request, battle_state: BattleState):
+    """
+    Reads the messages older than the cached snapshot, so battle_state.battle_log holds the whole log.
+    """
+    if battle_state.log_start_seq:
+        async with sessions(request) as session:
+            await session.run_sync(battle_state.load_log)
+
+
+@jwt_required
+async def get_battle(request: Request, identity: Dict):
+    try:
+        fields = parse_fields(request.query_params.get('fields'), Battle.SUMMARY_COLUMNS + ('battle_log',))
+    except ValueError as e:
+        return jsonify({"error": "Invalid query parameter", "details": str(e)}, 400)
+    battle_id = request.path_params['battle_id']
+    snapshot = await owned_snapshot(request, identity, battle_id)
+    if snapshot is None:
+        return jsonify({"error": "Battle not found"}, 404)
+    battle_state = BattleState.from_snapshot(battle_id, snapshot)
+    if fields is not None and 'battle_log' not in fields:
+        return jsonify(select_fields(battle_state.details, fields))
+    await load_battle_log(request, battle_state)
+    return jsonify(select_fields(battle_state.battle, fields))
+
+
+@jwt_required
+async def archive_battle(request: Request, identity: Dict):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    data = data or {}
+    archived = data.get('archived', True) if isinstance(data, dict) else None
+    if not isinstance(archived, bool):
+        return jsonify({"error": "archived must be true or false"}, 400)
+    battle_id = request.path_params['battle_id']
+    snapshot = await owned_snapshot(request, identity, battle_id)
+    if snapshot is None:
+        return jsonify({"error": "Battle not found"}, 404)
+    async with sessions(request) as session:
+        try:
+            await session.execute(update(Battle).where(Battle.id == battle_id).values(archived=archived))
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            log.info(f"Error archiving battle: {e}")
+            return jsonify({"error": "Failed to archive battle"}, 500)
+    snapshot["archived"] = archived
+    await asyncio.to_thread(battle_cache.put, battle_id, snapshot)
+    battle_state = BattleState.from_snapshot(battle_id, snapshot)
+    await load_battle_log(request, battle_state)
+    return jsonify(battle_state.battle)
+
+
+@jwt_required
+async def update_turn(request: Request, identity: Dict):
+    """
+    Moves a battle to another round or turn, see server.update_turn.
+    """
+    data = await read_json(request)
+    try:
+        turn = parse_turn(data or {})
+    except ValueError as e:
+        return jsonify({"error": "Invalid turn", "details": str(e)}, 400)
+    battle_id = request.path_params['battle_id']
+    snapshot = await owned_snapshot(request, identity, battle_id)
+    if snapshot is None:
+        return jsonify({"error": "Battle not found"}, 404)
+    async with sessions(request) as session:
+        try:
+            await session.execute(update(Battle).where(Battle.id == battle_id).values(**turn))
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            log.info(f"Error updating battle turn: {e}")
+            return jsonify({"error": "Failed to update battle turn"}, 500)
+    snapshot.update(turn)
+    await asyncio.to_thread(battle_cache.put, battle_id, snapshot)
+    battle_state = BattleState.from_snapshot(battle_id, snapshot)
+    await load_battle_log(request, battle_state)
+    body = battle_state.battle
+    if battle_state.army_turn == Battle.PLAYER_TURN:
+        await asyncio.to_thread(battle_state.schedule_opponent_plan)
+    else:
+        body["opponent_plan"] = await asyncio.to_thread(battle_state.opponent_plan_status)
+    return jsonify(body)
+
+
+@jwt_required
+async def post_text_interaction_stream(request: Request, identity: Dict):
+    """
+    A chat turn, see server.post_text_interaction_stream. The database session is only held
+    while loading and saving the battle, not while the model generates.
+    """
+    data = await read_json(request)
+    log_payload(log, "chat_turn", "Chat turn request body", data)
+    user_id_str = data.get('user_id')
+    battle_id_str = data.get('battle_id')
+    user_message = data.get('text')
+    if not user_id_str or not user_message:
+        return jsonify({"error": "Missing 'user_id' or 'text' in request body"}, 400)
+    try:
+        user_id = uuid.UUID(user_id_str)
+    except ValueError:
+        return jsonify({"error": "Invalid user_id format"}, 400)
+    if user_id != identity_user_id(identity):
+        return jsonify({"error": "user_id does not match the authenticated user"}, 403)
+
+    try:
+        async with sessions(request) as session:
+            battle_state = await BattleState.load_async(session, battle_id_str)
+    except BattleNotFound:
+        return jsonify({"error": "Battle not found"}, 404)
+    if battle_state.user_id != str(user_id):
+        return jsonify({"error": "Battle not found"}, 404)
+
+    idempotent = None
+    if request.headers.get('Idempotency-Key'):
+        idempotent = await asyncio.to_thread(idempotency_store.claim, user_id, request.headers['Idempotency-Key'],
+                                             request_fingerprint(battle_state.battle_id, user_message))
+        if not idempotent.leader:
+            return await idempotent_replay(request, idempotent)
+
+    try:
+        await asyncio.to_thread(admission.take_token, user_id)
+    except RateLimited as e:
+        if idempotent:
+            await asyncio.to_thread(idempotent.release)
+        return generation_busy_response(e)
+
+    if GENERATION_MODE == 'celery' or 'respond-async' in request.headers.get('Prefer', ''):
+        job = await asyncio.to_thread(generate_reply_task.delay, battle_id_str, str(user_id), user_message)
+        await asyncio.to_thread(job_owners.record, job.id, user_id)
+        status_url = f"/api/interactions/jobs/{job.id}"
+        body = {"job_id": job.id, "status_url": status_url}
+        if idempotent:
+            await asyncio.to_thread(idempotent.complete, 202, body, {"Location": status_url})
+        return jsonify(body, 202, {"Location": status_url})
+
+    try:
+        ticket = await admission.acquire_async(user_id)
+        try:
+            await async_generation_limiter.acquire()
+        except GenerationBusy:
+            await asyncio.to_thread(admission.release, ticket)
+            raise
+    except GenerationBusy as e:
+        if idempotent:
+            await asyncio.to_thread(idempotent.release)
+        return generation_busy_response(e)
+
+    if wants_event_stream(request):
+        return LimitedStreamingResponse(
+            stream_text_interaction(request, battle_state, user_id, user_message, idempotent), async_generation_limiter,
+            ticket=ticket, media_type='text/event-stream', headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    try:
+        response = await source.gen_client.agenerate(content=user_message, battle_state=battle_state)
+    except Exception as e:
+        if idempotent:
+            await asyncio.to_thread(idempotent.release)
+        log.error(f"Error calling Gemini API: {e}")
+        return jsonify({"error": "Failed to call Gemini API", "details": str(e)}, 500)
+    finally:
+        async_generation_limiter.release()
+        await asyncio.to_thread(admission.release, ticket)
+    try:
+        async with sessions(request) as session:
+            updated_battle_log = await battle_state.update_battle_log_async(session, user_message, response)
+    except Exception as e:
+        if idempotent:
+            await asyncio.to_thread(idempotent.release)
+        log.error(f"Error saving the battle log: {e}")
+        return jsonify({"error": "Failed to update battle log"}, 500)
+    await asyncio.to_thread(log_interaction_task.delay, str(user_id), user_message, response, "text")
+    body = {
+        "message": "Text interaction processed successfully",
+        "battle_log": updated_battle_log
+    }
+    if idempotent:
+        await asyncio.to_thread(idempotent.complete, 200, body, reply=response)
+    return jsonify(body)
+
+
+async def idempotent_replay(request: Request, idempotent: IdempotentRequest) -> Response:
+    """
+    server.idempotent_replay, waiting without holding a thread.
+    """
+    if idempotent.pending and not idempotent.conflict:
+        await idempotency_store.wait_async(idempotent)
+    if idempotent.conflict:
+        return jsonify({"error": "Idempotency-Key was already used for a different request"}, 422)
+    if idempotent.pending:
+        return jsonify({"error": "A request with this Idempotency-Key is in progress, retry shortly"}, 409,
+                       {"Retry-After": "1"})
+    record = idempotent.record
+    headers = {**record["headers"], "Idempotent-Replayed": "true"}
+    if wants_event_stream(request) and record["reply"] is not None:
+        events = format_sse('chunk', {"text": record["reply"]}) + format_sse('done', record["body"])
+        return Response(events, media_type='text/event-stream', headers={**headers, "Cache-Control": "no-cache"})
+    return jsonify(record["body"], record["status_code"], headers)
+
+
+def generation_busy_response(error: GenerationBusy) -> Response:
+    log.info(f"Rejecting chat turn: {error}")
+    headers = {"Retry-After": str(error.retry_after)}
+    if isinstance(error, RateLimited):
+        return jsonify({"error": "Too many messages, wait before sending another"}, 429, headers)
+    return jsonify({"error": "Too many concurrent requests, try again shortly"}, 503, headers)
+
+
+def wants_event_stream(request: Request) -> bool:
+    """
+    True when the client prefers Server-Sent Events over JSON (quality values are not weighed).
+    """
+    accept = request.headers.get('Accept', '')
+    return 'text/event-stream' in accept and 'application/json' not in accept
+
+
+def format_sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {encode_json(data).decode('utf-8')}\n\n"
+
+
+class LimitedStreamingResponse(StreamingResponse):
+    """
+    Releases the generation slot (and the admission ticket) once the response is over, also when the client
+    went away before the stream started. Closes the body iterator so a disconnect saves the partial reply.
+    """
+
+    def __init__(self, content: AsyncIterator[str], limiter: AsyncConcurrencyLimiter,
+                 ticket: Optional[bytes] = None, **kwargs):
+        super().__init__(content, **kwargs)
+        self._limiter = limiter
+        self._ticket = ticket
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            with anyio.CancelScope(shield=True):
+                await self.body_iterator.aclose()
+            self._limiter.release()
+            with anyio.CancelScope(shield=True):
+                await asyncio.to_thread(admission.release, self._ticket)
+
+
+async def stream_text_interaction(request: Request, battle_state: BattleState, user_id: uuid.UUID,
+                                  user_message: str, idempotent: Optional[IdempotentRequest] = None) -> AsyncIterator[str]:
+    """
+    server.stream_text_interaction on the asyncio Gemini client.
+    """
+    chunks = []
+    try:
+        async for chunk in source.gen_client.agenerate_stream(content=user_message, battle_state=battle_state):
+            chunks.append(chunk)
+            yield format_sse('chunk', {"text": chunk})
+    except (GeneratorExit, asyncio.CancelledError):
+        log.info(f"Client disconnected from stream for battle {battle_state.battle_id}")
+        with anyio.CancelScope(shield=True):
+            await save_streamed_response(request, battle_state, user_id, user_message, chunks, partial=True)
+            if idempotent:
+                await asyncio.to_thread(idempotent.release)
+        raise
+    except Exception as e:
+        log.error(f"Error streaming from Gemini API: {e}")
+        await save_streamed_response(request, battle_state, user_id, user_message, chunks, partial=True)
+        if idempotent:
+            await asyncio.to_thread(idempotent.release)
+        yield format_sse('error', {"error": "Failed to call Gemini API", "details": str(e)})
+        return
+
+    updated_battle_log = await save_streamed_response(request, battle_state, user_id, user_message, chunks, partial=False)
+    body = {
+        "message": "Text interaction processed successfully",
+        "battle_log": updated_battle_log
+    }
+    if idempotent:
+        if updated_battle_log:
+            await asyncio.to_thread(idempotent.complete, 200, body, reply="".join(chunks))
+        else:
+            await asyncio.to_thread(idempotent.release)
+    yield format_sse('done', body)
+
+
+async def save_streamed_response(request: Request, battle_state: BattleState, user_id: uuid.UUID,
+                                 user_message: str, chunks: List[str], partial: bool):
+    if partial and not chunks:
+        return None
+    response = "".join(chunks)
+    try:
+        async with sessions(request) as session:
+            updated_battle_log = await battle_state.update_battle_log_async(session, user_message, response, partial)
+    except Exception as e:
+        log.error(f"Error saving streamed response: {e}")
+        return None
+    await asyncio.to_thread(log_interaction_task.delay, str(user_id), user_message, response, "text")
+    return updated_battle_log
+
+
+@jwt_required
+async def get_interaction_job(request: Request, identity: Dict):
+    job_id = request.path_params['job_id']
+    if not await asyncio.to_thread(job_owners.is_owner, job_id, identity_user_id(identity)):
+        return jsonify({"error": "Job not found"}, 404)
+    job = generate_reply_task.AsyncResult(job_id)
+    state = await asyncio.to_thread(lambda: job.state)
+    if state in ('PENDING', 'RECEIVED', 'STARTED', 'RETRY'):
+        return jsonify({"job_id": job_id, "status": state.lower()}, 202, {"Retry-After": "1"})
+    if state == 'FAILURE':
+        log.error(f"Generation job {job_id} failed: {job.result}")
+        return jsonify({"job_id": job_id, "status": "failed", "error": "Failed to call Gemini API"}, 500)
+    result = await asyncio.to_thread(lambda: job.result) or {}
+    return jsonify({"job_id": job_id, "status": "done", **result})
+
+
+async def log_placeholder_interaction(request: Request, user_id: uuid.UUID, interaction_type: str,
+                                      user_input: str, llm_output: str) -> Interaction:
+    interaction = Interaction(user_id=user_id, type=interaction_type, user_input=user_input, llm_output=llm_output)
+    async with sessions(request) as session:
+        session.add(interaction)
+        await session.commit()
+    return interaction
+
+
+@jwt_required
+async def post_text_interaction(request: Request, identity: Dict):
+    data = await read_json(request)
+    user_id_str = data.get('user_id')
+    user_text = data.get('text')
+    if not user_id_str or not user_text:
+        return jsonify({"error": "Missing 'user_id' or 'text' in request body"}, 400)
+    try:
+        user_id = uuid.UUID(user_id_str)
+    except ValueError:
+        return jsonify({"error": "Invalid user_id format"}, 400)
+    if user_id != identity_user_id(identity):
+        return jsonify({"error": "user_id does not match the authenticated user"}, 403)
+
+    llm_response_text = f"LLM processed text from {user_id}: '{user_text}'."
+    try:
+        interaction = await log_placeholder_interaction(request, user_id, 'text', user_text, llm_response_text)
+    except Exception as e:
+        log.info(f"Error logging text interaction: {e}")
+        return jsonify({"error": "An unexpected error occurred logging interaction"}, 500)
+    return jsonify({
+        "message": "Text interaction processed successfully",
+        "llm_response": llm_response_text,
+        "interaction_id": str(interaction.id)
+    })
+
+
+@jwt_required
+async def post_image_interaction(request: Request, identity: Dict):
+    content_length = request.headers.get('content-length')
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_REQUEST_BYTES:
+        return jsonify({"error": f"Images are limited to {MAX_IMAGE_BYTES} bytes"}, 413)
+    # Starlette spools file parts to a temporary file past 1MB, save_upload bounds their size
+    form = await request.form(max_files=1)
+    file = form.get('image')
+    user_id_str = form.get('user_id')
+    if file is None or isinstance(file, str):
+        return jsonify({"error": "No 'image' file part in the request"}, 400)
+    if not user_id_str:
+        return jsonify({"error": "Missing 'user_id' in form data"}, 400)
+    if not file.filename:
+        return jsonify({"error": "No selected file"}, 400)
+    try:
+        user_id = uuid.UUID(user_id_str)
+    except ValueError:
+        return jsonify({"error": "Invalid user_id format"}, 400)
+    if user_id != identity_user_id(identity):
+        return jsonify({"error": "user_id does not match the authenticated user"}, 403)
+
+    try:
+        stored = await asyncio.to_thread(save_upload, file.file)
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}, 413)
+    except UnsupportedImage as e:
+        return jsonify({"error": str(e)}, 415)
+    except OSError as e:
+        log.error(f"Error saving image upload: {e}")
+        return jsonify({"error": "Could not save uploaded file"}, 500)
+
+    try:
+        async with sessions(request) as session:
+            upload, needs_processing = await session.run_sync(register_upload, user_id, stored, file.filename)
+        body = upload.to_dict()
+    except Exception as e:
+        log.error(f"Error registering image upload: {e}")
+        return jsonify({"error": "An unexpected error occurred registering the upload"}, 500)
+    if needs_processing:
+        await asyncio.to_thread(process_image_task.delay, body["job_id"])
+    log.info(f"Image upload {body['job_id']} for user {user_id}: {body['status']}")
+
+    status_url = f"/api/interactions/image/{body['job_id']}"
+    body["status_url"] = status_url
+    return jsonify(body, 200 if body["status"] == IMAGE_DONE else 202, {"Location": status_url})
+
+
+@jwt_required
+async def get_image_interaction(request: Request, identity: Dict):
+    upload_id = request.path_params['upload_id']
+    async with sessions(request) as session:
+        upload = await session.get(ImageUpload, upload_id)
+    if upload is None or upload.user_id != identity_user_id(identity):
+        return jsonify({"error": "Upload not found"}, 404)
+    if upload.status == IMAGE_FAILED:
+        log.error(f"Image upload {upload_id} failed: {upload.error}")
+        return jsonify({**upload.to_dict(), "error": "Failed to analyze the image"}, 500)
+    if upload.status != IMAGE_DONE:
+        return jsonify(upload.to_dict(), 202, {"Retry-After": "2"})
+    return jsonify(upload.to_dict())
+
+
+async def http_exception(request: Request, exc: HTTPException) -> Response:
+    return jsonify({"error": exc.detail}, exc.status_code)
+
+
+class RequestTimingMiddleware:
+    """
+    The before/after_request instrumentation of server.py: observes the request latency (time to
+    the response start, i.e. first byte for streams) with its db/llm/serialization breakdown.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        timings = defaultdict(float)
+        token = REQUEST_TIMINGS.set(timings)
+        status = 500
+        observed = False
+
+        def observe():
+            route = scope.get("route")
+            observe_request(scope["method"], route.path if route else 'unmatched', status,
+                            time.perf_counter() - start, timings)
+
+        async def timed_send(message):
+            nonlocal status, observed
+            if message["type"] == "http.response.start" and not observed:
+                status, observed = message["status"], True
+                observe()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            REQUEST_TIMINGS.reset(token)
+            if not observed:
+                observe()
+
+
+@asynccontextmanager
+async def lifespan(api: Starlette):
+    if os.environ.get("BENCHMARK_STUB_LATENCY"):
+        from backend.benchmarks.stubs import install_fake_gen_client_from_env
+        install_fake_gen_client_from_env()
+    database_url = os.getenv('DATABASE_URL')
+    if not database_url:
+        raise ValueError("No DATABASE_URL set. Please set it in .env file.")
+    engine = create_async_engine(async_database_url(database_url), **async_engine_options(database_url))
+    api.state.engine = engine
+    api.state.sessions = async_sessionmaker(engine, expire_on_commit=False)
+    api.state.http = httpx.AsyncClient(timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                                       limits=httpx.Limits(max_keepalive_connections=HTTP_POOL_SIZE))
+    try:
+        yield
+    finally:
+        await api.state.http.aclose()
+        await engine.dispose()
+
+
+routes = [
+    Route('/api/metrics', metrics, methods=['GET']),
+    Route('/api/authorization', google_authorization, methods=['POST']),
+    Route('/api/users/{email:uuid}', get_user, methods=['GET']),
+    Route('/api/users', update_user, methods=['PUT']),
+    Route('/api/battles', fetch_battles, methods=['GET']),
+    Route('/api/battles', create_battle, methods=['POST']),
+    Route('/api/battles/{battle_id:uuid}', get_battle, methods=['GET']),
+    Route('/api/battles/{battle_id:uuid}/archive', archive_battle, methods=['PUT']),
+    Route('/api/battles/{battle_id:uuid}/turn', update_turn, methods=['PUT']),
+    Route('/api/interactions/text/stream', post_text_interaction_stream, methods=['POST']),
+    Route('/api/interactions/jobs/{job_id}', get_interaction_job, methods=['GET']),
+    Route('/api/interactions/text', post_text_interaction, methods=['POST']),
+    Route('/api/interactions/image', post_image_interaction, methods=['POST']),
+    Route('/api/interactions/image/{upload_id:uuid}', get_image_interaction, methods=['GET']),
+]
+
+middleware = [
+    Middleware(RequestTimingMiddleware),
+    Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+               allow_headers=["Authorization", "Content-Type", "Prefer", "Idempotency-Key"],
+               expose_headers=["X-Next-Cursor", "Location", "Retry-After", "Idempotent-Replayed"]),
+    # Brotli is Flask only, Starlette ships gzip; event streams are never compressed
+    Middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_BYTES, compresslevel=GZIP_LEVEL),
+]
+
+app = Starlette(routes=routes, middleware=middleware, lifespan=lifespan,
+                exception_handlers={HTTPException: http_exception})
+
+REGISTRY.register(GaugeCollector("db_pool", "Database connection pool of this process",
+                                 lambda: pool_metrics(app.state.engine.sync_engine)))
+REGISTRY.register(GaugeCollector("generation", "Model calls of this process",
+                                 lambda: {"in_flight": async_generation_limiter.in_flight,
+                                          "limit": async_generation_limiter.limit}))
+REGISTRY.register(GaugeCollector("jwt_cache", "Verified token cache of this process",
+                                 lambda: {"hits": token_cache.hits, "misses": token_cache.misses}))
+REGISTRY.register(GaugeCollector("interaction_log", "Buffered interaction logging (shared across processes)",
+                                 lambda: flush_stats(source.redis)))
+REGISTRY.register(GaugeCollector("admission", "Model calls and chat turns waiting for one (shared across processes)",
+                                 admission.stats))
@@ -0,0 +1,210 @@
+import json
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+from redis import Redis, RedisError, WatchError
+from sqlalchemy import select
+
+from backend.models.Battle import Battle
+from backend.models.BattleMessage import BattleMessage
+from backend.src.app import app
+from backend.src.metrics import REGISTRY, Counter
+from backend.src.parameters import BATTLE_CACHE_ENABLED, BATTLE_CACHE_MESSAGES, BATTLE_CACHE_TTL
+
+log = logging.getLogger(__name__)
+
+BATTLE_CACHE_REQUESTS = REGISTRY.register(Counter(
+    "battle_cache_requests_total", "Battle state cache lookups by result (hit, miss, stale, error)", ("result",)))
+
+
+def tail_start_seq(message_seq: int, summary_seq: int) -> int:
+    """
+    The oldest message a snapshot keeps: the newest BATTLE_CACHE_MESSAGES, leaving out those the summary covers.
+    """
+    return max(summary_seq, message_seq - BATTLE_CACHE_MESSAGES, 0)
+
+
+def load_messages(battle_id, start_seq: int, stop_seq: Optional[int] = None, session=None) -> List[List]:
+    """
+    The battle_messages rows of a battle with start_seq <= seq < stop_seq as [seq, entry] pairs in ascending
+    seq order, read through the (battle_id, seq) index.
+    """
+    session = session or app.db.session
+    statement = select(BattleMessage).where(BattleMessage.battle_id == battle_id, BattleMessage.seq >= start_seq)
+    if stop_seq is not None:
+        statement = statement.where(BattleMessage.seq < stop_seq)
+    rows = session.execute(statement.order_by(BattleMessage.seq)).scalars()
+    return [[row.seq, row.to_dict()] for row in rows]
+
+
+def battle_snapshot(battle: Battle, session=None) -> Dict:
+    """
+    Everything a chat turn or the battle endpoint needs from a battle, in a JSON serializable dict.
+    Only the newest messages are kept (see tail_start_seq), as [seq, entry] pairs in ascending seq order;
+    log_start_seq is the seq of the oldest of them, older messages are only in the database.
+    Battles whose legacy battle_log blob was not migrated yet keep all of its entries.
+    """
+    snapshot = battle.to_dict(include_battle_log=False)
+    message_seq = battle.message_seq or 0
+    summary_seq = battle.summary_seq or 0
+    if not message_seq and battle.battle_log:
+        log_start_seq = 0
+        messages = [[int(seq), entry] for seq, entry in sorted(battle.battle_log.items(), key=lambda item: int(item[0]))]
+    else:
+        log_start_seq = tail_start_seq(message_seq, summary_seq)
+        messages = load_messages(battle.id, log_start_seq, session=session) if message_seq else []
+    snapshot.update({
+        "log_summary": battle.log_summary,
+        "summary_seq": summary_seq,
+        "message_seq": message_seq,
+        "army_prompts": {roster.side: roster.prompt_text for roster in battle.rosters},
+        "log_start_seq": log_start_seq,
+        "messages": messages,
+    })
+    return snapshot
+
+
+class BattleCache:
+    """
+    Read-through Redis cache of battle snapshots, keyed by battle id.
+    Every write bumps a per-battle version counter and a snapshot is only served when it carries the
+    current version, so a bump alone is enough to invalidate it. Version counters outlive snapshots
+    (twice the TTL), an expired counter would restart at a version an old snapshot still carries.
+    Redis errors are logged and treated as misses, the database stays the source of truth.
+    """
+
+    def __init__(self, get_redis: Callable[[], Redis], ttl_seconds: int, enabled: bool = True):
+        self._get_redis = get_redis
+        self._ttl_seconds = ttl_seconds
+        self.enabled = enabled
+
+    @staticmethod
+    def key(battle_id) -> str:
+        return f"battle:{battle_id}"
+
+    @staticmethod
+    def version_key(battle_id) -> str:
+        return f"battle:{battle_id}:version"
+
+    def get(self, battle_id, load: Callable[[], Optional[Dict]]) -> Optional[Dict]:
+        """
+        Returns the cached snapshot of a battle, or calls `load` and caches its result.
+        """
+        snapshot, version = self.lookup(battle_id)
+        if snapshot is None:
+            snapshot = load()
+            if snapshot is not None:
+                self.fill(battle_id, snapshot, version)
+        return snapshot
+
+    def lookup(self, battle_id) -> Tuple[Optional[Dict], Optional[int]]:
+        """
+        Returns the current snapshot (None on a miss) and the version a snapshot loaded now has to be filled with.
+        """
+        if not self.enabled:
+            return None, None
+        redis = self._get_redis()
+        try:
+            raw, version = redis.mget(self.key(battle_id), self.version_key(battle_id))
+        except RedisError as e:
+            log.warning(f"Battle cache unavailable: {e}")
+            BATTLE_CACHE_REQUESTS.inc(result="error")
+            return None, None
+        version = int(version or 0)
+        if raw is not None:
+            snapshot = json.loads(raw)
+            if snapshot.get("version") == version:
+                BATTLE_CACHE_REQUESTS.inc(result="hit")
+                return snapshot, version
+            BATTLE_CACHE_REQUESTS.inc(result="stale")
+        else:
+            BATTLE_CACHE_REQUESTS.inc(result="miss")
+        return None, version
+
+    def fill(self, battle_id, snapshot: Dict, version: Optional[int]):
+        """
+        Caches a snapshot loaded at `version` (from lookup), unless a writer bumped the version in the meantime.
+        """
+        if version is None:
+            return
+        snapshot["version"] = version
+        redis = self._get_redis()
+        try:
+            with redis.pipeline() as pipe:
+                pipe.watch(self.version_key(battle_id))
+                if int(pipe.get(self.version_key(battle_id)) or 0) != version:
+                    return
+                pipe.multi()
+                pipe.set(self.key(battle_id), json.dumps(snapshot), ex=self._ttl_seconds)
+                pipe.execute()
+        except WatchError:
+            pass
+        except RedisError as e:
+            log.warning(f"Failed to cache battle {battle_id}: {e}")
+
+    def put(self, battle_id, snapshot: Dict):
+        """
+        Write-through after a committed change: stores the snapshot under a new version.
+        A snapshot that was read from the cache (it carries a version) is only stored if nobody
+        else wrote the battle since it was read, otherwise the cached entry is invalidated so the
+        next read picks up both changes from the database.
+        """
+        if not self.enabled:
+            return
+        read_version = snapshot.get("version")
+        redis = self._get_redis()
+        try:
+            with redis.pipeline() as pipe:
+                pipe.watch(self.version_key(battle_id))
+                version = int(pipe.get(self.version_key(battle_id)) or 0)
+                if read_version is not None and version != read_version:
+                    pipe.reset()
+                    self.invalidate(battle_id)
+                    return
+                snapshot["version"] = version + 1
+                pipe.multi()
+                pipe.set(self.version_key(battle_id), version + 1, ex=self._ttl_seconds * 2)
+                pipe.set(self.key(battle_id), json.dumps(snapshot), ex=self._ttl_seconds)
+                pipe.execute()
+        except WatchError:
+            self.invalidate(battle_id)
+        except RedisError as e:
+            log.warning(f"Failed to write battle {battle_id} to the cache: {e}")
+            self.invalidate(battle_id)
+
+    def invalidate(self, battle_id):
+        """
+        Makes the cached snapshot of a battle stale, the next read reloads it from the database.
+        """
+        if not self.enabled:
+            return
+        redis = self._get_redis()
+        try:
+            pipe = redis.pipeline(transaction=False)
+            pipe.delete(self.key(battle_id))
+            pipe.incr(self.version_key(battle_id))
+            pipe.expire(self.version_key(battle_id), self._ttl_seconds * 2)
+            pipe.execute()
+        except RedisError as e:
+            log.error(f"Failed to invalidate cached battle {battle_id}: {e}")
+
+    @staticmethod
+    def append_messages(snapshot: Dict, first_seq: int, entries: List[Dict]) -> bool:
+        """
+        Applies newly inserted messages to a snapshot in place and drops those that fell out of its tail.
+        Returns False when the snapshot did not hold every message before `first_seq` (another turn or a
+        legacy migration happened), in which case it has to be reloaded instead.
+        """
+        if snapshot.get("message_seq") != first_seq:
+            return False
+        for offset, entry in enumerate(entries):
+            snapshot["messages"].append([first_seq + offset, entry])
+        snapshot["message_seq"] = first_seq + len(entries)
+        start = tail_start_seq(snapshot["message_seq"], snapshot.get("summary_seq", 0))
+        if start > snapshot.get("log_start_seq", 0):
+            snapshot["messages"] = [message for message in snapshot["messages"] if message[0] >= start]
+            snapshot["log_start_seq"] = start
+        return True
+
+
+battle_cache = BattleCache(lambda: app.redis, BATTLE_CACHE_TTL, BATTLE_CACHE_ENABLED)
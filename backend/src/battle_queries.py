@@ -0,0 +1,92 @@
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import Select, select, tuple_
+from sqlalchemy.orm import load_only, selectinload
+
+from backend.models.Battle import Battle
+from backend.models.Roster import Roster
+from backend.models.RosterUnit import RosterUnit
+from backend.src.roster import OPPONENT, PLAYER, parse_army, render_prompt
+
+
+def battle_page_statement(user_id: uuid.UUID, fields: Iterable[str], limit: int, archived: Optional[bool] = None,
+                          after: Optional[Tuple[datetime, uuid.UUID]] = None) -> Select:
+    """
+    One page of a user's battles, newest first, for the Flask and the ASGI battle listing.
+    Only the columns of `fields` are loaded, plus id and timestamp for the keyset cursor.
+    Selects one extra row to tell whether another page exists.
+    """
+    columns = [getattr(Battle, name) for name in Battle.SUMMARY_COLUMNS
+               if name in fields or name in ('id', 'timestamp')]
+    options = []
+    if 'battle_log' in fields:
+        # Archived logs are listed from the archive, without restoring them
+        columns.extend((Battle.battle_log, Battle.log_archived))
+        options.extend((selectinload(Battle.messages), selectinload(Battle.archive)))
+    statement = select(Battle).options(load_only(*columns), *options).where(Battle.user_id == user_id)
+    if archived is not None:
+        statement = statement.where(Battle.archived == archived)
+    if after is not None:
+        statement = statement.where(tuple_(Battle.timestamp, Battle.id) < tuple_(*after))
+    return statement.order_by(Battle.timestamp.desc(), Battle.id.desc()).limit(limit + 1)
+
+
+def new_roster(side: str, army) -> Roster:
+    """
+    The roster of one side of a battle, parsed once from the army details sent by the client.
+    """
+    parsed = parse_army(army)
+    return Roster(side=side,
+                  army_name=parsed.army_name,
+                  faction=parsed.faction,
+                  detachment=parsed.detachment,
+                  points=parsed.points,
+                  notes=parsed.notes,
+                  prompt_text=render_prompt(parsed),
+                  units=[RosterUnit(position=position, name=unit.name, points=unit.points, models=unit.models,
+                                    wargear=unit.wargear, keywords=unit.keywords, enhancement=unit.enhancement)
+                         for position, unit in enumerate(parsed.units)])
+
+
+def new_battle(user_id: uuid.UUID, data: Dict) -> Battle:
+    """
+    A new battle from the create battle request body, with the rosters parsed from its armies.
+    """
+    play_area = data.get('playArea')
+    return Battle(user_id=user_id,
+                  id=uuid.uuid4(),
+                  battle_name=data.get('battleName'),
+                  # String columns, asyncpg does not convert the numbers clients send
+                  width=str(play_area.get('width')),
+                  height=str(play_area.get('height')),
+                  player_army=data.get('playerArmy'),
+                  opponent_army=data.get('opponentArmy'),
+                  battle_round="0",
+                  army_turn="0",
+                  player_score="0",
+                  opponent_score="0",
+                  timestamp=datetime.now(),
+                  battle_log={},
+                  message_seq=0,
+                  archived=False,
+                  # Nothing to load, serializing the new battle must not lazy load (not possible on an AsyncSession)
+                  messages=[],
+                  rosters=[new_roster(PLAYER, data.get('playerArmy')), new_roster(OPPONENT, data.get('opponentArmy'))],
+                  )
+
+
+def parse_turn(data: Dict) -> Dict[str, str]:
+    """
+    The battle_round and army_turn columns from the turn update request body,
+    e.g. {'battle_round': 2, 'army_turn': '1'}. Raises ValueError if they are invalid.
+    """
+    try:
+        battle_round = int(data['battle_round'])
+        army_turn = str(data['army_turn'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Expected {'battle_round': <number>, 'army_turn': '0' | '1'}")
+    if battle_round < 0 or army_turn not in (Battle.PLAYER_TURN, Battle.OPPONENT_TURN):
+        raise ValueError("Expected {'battle_round': <number>, 'army_turn': '0' | '1'}")
+    return {'battle_round': str(battle_round), 'army_turn': army_turn}
@@ -1,80 +1,376 @@
+import asyncio
 from datetime import datetime
-import json
-from typing import Dict
+import uuid
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
-from flask import jsonify
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import selectinload
 from backend.src.app import app
+from backend.src.archive import restore_battle_log
 from backend.models.Battle import Battle
+from backend.models.BattleMessage import BattleMessage
+from backend.models.Roster import Roster
+from backend.src.battle_cache import BattleCache, battle_cache, battle_snapshot, load_messages
+from backend.src.context_builder import ContextBuilder, LogEntry
+from backend.src.opponent_plan import plan_cache
+from backend.src.parameters import PREFETCH_ENABLED, SUMMARY_MIN_MESSAGES
+from backend.src.roster import PLAYER, parse_army, render_prompt
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
 
 db = app.db
 log = app.log
 
+def allocate_message_seq(battle_id, count: int, session=None) -> int:
+    """
+    Atomically reserves `count` consecutive message numbers for a battle and returns the first.
+    The UPDATE holds the battle row lock until the transaction commits, so concurrent turns
+    are serialized instead of claiming the same message id.
+    """
+    session = session or db.session
+    next_seq = session.execute(
+        update(Battle)
+        .where(Battle.id == battle_id)
+        .values(message_seq=Battle.message_seq + count)
+        .returning(Battle.message_seq)
+    ).scalar_one()
+    first_seq = next_seq - count
+    if first_seq == 0:
+        # First allocation for this battle, move over a legacy battle_log blob if there is one
+        legacy_log = session.execute(select(Battle.battle_log).where(Battle.id == battle_id)).scalar()
+        migrated = migrate_legacy_battle_log(battle_id, legacy_log, session)
+        if migrated:
+            session.execute(update(Battle).where(Battle.id == battle_id).values(message_seq=migrated + count))
+            first_seq = migrated
+    return first_seq
+
+
+def migrate_legacy_battle_log(battle_id, legacy_log, session=None) -> int:
+    """
+    Copies the entries of a legacy battle_log blob into battle_messages and clears the blob.
+    Returns the number of migrated messages. Does not commit.
+    """
+    if not legacy_log:
+        return 0
+    session = session or db.session
+    entries = sorted(legacy_log.items(), key=lambda item: int(item[0]))
+    rows = []
+    for seq, (_, entry) in enumerate(entries):
+        timestamp = entry.get("timestamp")
+        rows.append({
+            "battle_id": battle_id,
+            "seq": seq,
+            "creator": entry.get("creator", "user"),
+            "message": entry.get("message") or "",
+            "partial": bool(entry.get("partial", False)),
+            "timestamp": datetime.fromisoformat(timestamp) if timestamp else datetime.now(),
+        })
+    session.execute(insert(BattleMessage), rows)
+    session.execute(update(Battle).where(Battle.id == battle_id).values(battle_log=None))
+    return len(rows)
+
+
+class BattleNotFound(LookupError):
+    pass
+
+
+def load_battle_snapshot(battle_id, session=None) -> Optional[Dict]:
+    """
+    Loads a battle's snapshot from the database, restoring its messages first if they were archived.
+    """
+    session = session or db.session
+    battle = session.get(Battle, battle_id)
+    if battle is not None and battle.log_archived:
+        restore_battle_log(battle_id, session)
+    return battle_snapshot(battle, session) if battle is not None else None
+
+
+def load_messages_before(battle_id, before_seq: int, session=None) -> List[List]:
+    """
+    The messages of a battle older than `before_seq` (those a snapshot does not keep), as [seq, entry] pairs.
+    Falls back to the whole log (Battle.message_log) when some are missing from battle_messages, i.e. the
+    battle was archived since the snapshot was loaded.
+    """
+    session = session or db.session
+    messages = load_messages(battle_id, 0, before_seq, session)
+    if len(messages) < before_seq:
+        battle = session.get(Battle, battle_id)
+        if battle is not None:
+            battle_log = battle.message_log
+            messages = [[seq, battle_log[str(seq)]] for seq in range(before_seq) if str(seq) in battle_log]
+    return messages
+
+
+def get_battle_snapshot(battle_id) -> Optional[Dict]:
+    """
+    Returns the battle snapshot (see battle_snapshot) from the cache, loading it on a miss.
+    """
+    return battle_cache.get(battle_id, lambda: load_battle_snapshot(battle_id))
+
+
+async def get_battle_snapshot_async(session: "AsyncSession", battle_id) -> Optional[Dict]:
+    """
+    get_battle_snapshot for the ASGI app: Redis calls run in a thread, the load on the async session.
+    """
+    snapshot, version = await asyncio.to_thread(battle_cache.lookup, battle_id)
+    if snapshot is None:
+        snapshot = await session.run_sync(lambda sync_session: load_battle_snapshot(battle_id, sync_session))
+        if snapshot is not None:
+            await asyncio.to_thread(battle_cache.fill, battle_id, snapshot, version)
+    return snapshot
+
+
 class BattleState:
-    _battle: Battle
+    _snapshot: Dict
+    # Oldest message seq within the context budget on this turn, set by GenClient when it builds the context.
+    # Older messages the summary does not cover yet were sent too, schedule_summary folds them into it.
+    context_start_seq: Optional[int] = None
+    # Combat engine results of this turn, added by GenClient when the model calls the tool
+    combat_results: Tuple[str, ...] = ()
+    # (log_start_seq, messages before it) read by load_log
+    _older_messages: Optional[Tuple[int, List[List]]] = None
     
     def __init__(self, battle_id: str):
-        self._battle = db.session.get(Battle, battle_id)
+        self._battle_id = self.parse_id(battle_id)
+        self._snapshot = get_battle_snapshot(self._battle_id)
+        if self._snapshot is None:
+            raise BattleNotFound(battle_id)
+
+    @classmethod
+    async def load_async(cls, session: "AsyncSession", battle_id: str) -> "BattleState":
+        snapshot = await get_battle_snapshot_async(session, cls.parse_id(battle_id))
+        if snapshot is None:
+            raise BattleNotFound(battle_id)
+        return cls.from_snapshot(battle_id, snapshot)
+
+    @staticmethod
+    def parse_id(battle_id) -> uuid.UUID:
+        try:
+            return uuid.UUID(str(battle_id))
+        except ValueError:
+            raise BattleNotFound(battle_id)
+
+    @classmethod
+    def from_snapshot(cls, battle_id, snapshot: Dict) -> "BattleState":
+        battle_state = cls.__new__(cls)
+        battle_state._battle_id = uuid.UUID(str(battle_id))
+        battle_state._snapshot = snapshot
+        return battle_state
 
     @property
     def battle(self):
         """
-        Returns the battle details
+        Returns the battle details and its whole battle log
         """
-        return self._battle.to_dict()
+        battle = self.details
+        battle["battle_log"] = self.battle_log
+        return battle
+
+    @property
+    def details(self):
+        """
+        Returns the battle details without the battle log
+        """
+        return {name: self._snapshot[name] for name in Battle.SUMMARY_COLUMNS}
     
     @property
     def battle_id(self):
         """
         Returns the battle ID
         """
-        return str(self._battle.id)
+        return str(self._battle_id)
+
+    @property
+    def user_id(self):
+        """
+        Returns the ID of the user owning the battle
+        """
+        return self._snapshot["user_id"]
     
     @property
     def player_army(self):
         """
         Returns the player army details
         """
-        return self._battle.player_army
+        return self._snapshot["player_army"]
     
     @property
     def opponent_army(self):
         """
         Returns the opponent army details
         """
-        return self._battle.opponent_army
+        return self._snapshot["opponent_army"]
+
+    @property
+    def log_start_seq(self) -> int:
+        """
+        Returns the seq of the oldest message in the snapshot, older messages are read by load_log
+        """
+        return self._snapshot.get("log_start_seq", 0)
 
     @property
     def battle_log(self):
         """
-        Returns the battle log
+        Returns the whole battle log, the messages older than the snapshot are loaded from the database
+        on first use (the ASGI app calls load_log on its own session first)
         """
-        return self._battle.battle_log
+        if self.log_start_seq and (self._older_messages is None or self._older_messages[0] != self.log_start_seq):
+            self.load_log()
+        older = self._older_messages[1] if self.log_start_seq else []
+        return {str(seq): entry for seq, entry in older + self._snapshot["messages"]}
+
+    def load_log(self, session=None):
+        """
+        Reads the messages older than the snapshot from the database, for battle_log.
+        """
+        if self.log_start_seq:
+            self._older_messages = (self.log_start_seq, load_messages_before(self._battle_id, self.log_start_seq, session))
     
+    def army_prompt(self, side: str) -> str:
+        """
+        Returns the compact text of an army ('player' or 'opponent') for the prompt, rendered once
+        when the battle was created. Battles without rosters are rendered from their army details.
+        """
+        prompts = self._snapshot.setdefault("army_prompts", {})
+        if side not in prompts:
+            prompts[side] = render_prompt(parse_army(self.player_army if side == PLAYER else self.opponent_army))
+        return prompts[side]
+
+    @property
+    def battle_round(self) -> str:
+        return self._snapshot["battle_round"]
+
+    @property
+    def army_turn(self) -> str:
+        return self._snapshot["army_turn"]
+
+    @property
+    def message_seq(self) -> int:
+        """
+        Returns the number of messages allocated so far
+        """
+        return self._snapshot["message_seq"]
+
+    @property
+    def summary(self) -> Optional[str]:
+        """
+        Returns the rolling summary of the messages older than the context window
+        """
+        return self._snapshot["log_summary"]
+
+    @property
+    def summary_seq(self) -> int:
+        """
+        Returns the seq of the first message not covered by the summary
+        """
+        return self._snapshot["summary_seq"]
+
+    def recent_messages(self, limit: int) -> List[LogEntry]:
+        """
+        Returns up to `limit` of the newest messages not covered by the summary, in ascending seq order.
+        Read from the snapshot, which keeps the newest BATTLE_CACHE_MESSAGES.
+        """
+        messages = [(seq, entry) for seq, entry in self._snapshot["messages"] if seq >= self.summary_seq]
+        return messages[-limit:] if limit else []
+
+    def opponent_plan_status(self) -> Optional[Dict]:
+        """
+        Returns the prefetched opponent plan of the current round (see PlanCache.get), None when prefetching is off.
+        """
+        if not PREFETCH_ENABLED:
+            return None
+        return plan_cache.get(self.battle_id, self.battle_round)
+
+    @property
+    def opponent_plan(self) -> Optional[str]:
+        """
+        Returns the prefetched plan for the opponent's turn in progress, if it is ready.
+        Looked up once per BattleState.
+        """
+        if "_opponent_plan" not in self.__dict__:
+            status = self.opponent_plan_status() if self.army_turn == Battle.OPPONENT_TURN else None
+            self._opponent_plan = status.get("plan") if status else None
+        return self._opponent_plan
+
+    def schedule_opponent_plan(self):
+        """
+        Queues the opponent plan for this round once the player's turn starts, unless it is already queued or done.
+        """
+        if PREFETCH_ENABLED and self.army_turn == Battle.PLAYER_TURN and plan_cache.claim(self.battle_id, self.battle_round):
+            from backend.tasks.tasks import prefetch_opponent_plan_task
+            prefetch_opponent_plan_task.delay(self.battle_id, self.battle_round)
+
+    def schedule_summary(self):
+        """
+        Queues a summary update once enough messages have dropped out of the context window.
+        """
+        if self.context_start_seq is None:
+            return
+        if self.context_start_seq - self.summary_seq >= SUMMARY_MIN_MESSAGES:
+            from backend.tasks.tasks import summarize_battle_task
+            summarize_battle_task.delay(self.battle_id, self.context_start_seq)
+
     @staticmethod
     def stringify_keys(d):
         return {str(k): v for k, v in d.items()}
 
-    def update_battle_log(self, user_message: str, ai_response: str):
-        battle = db.session.get(Battle, self.battle_id)
-        if battle.battle_log is None:
-            battle.battle_log = {}
-        user_message_id = len(battle.battle_log)
-        ai_message_id = user_message_id + 1
-        interaction = {
-            user_message_id: {
-                "creator": 'user',
-                "message": user_message,
-                "timestamp": datetime.now().isoformat()
-            },
-            ai_message_id: {
-                "creator": 'ai',
-                "message": ai_response,
-                "timestamp": datetime.now().isoformat()
-            }
-        }
-        battle.battle_log.update(interaction)
+    def update_battle_log(self, user_message: str, ai_response: str, partial: bool = False):
+        """
+        Appends a user message and the AI response to the battle log, with the combat engine results in between.
+        Args:
+            user_message (str): The message sent by the player.
+            ai_response (str): The (possibly partial) response of the model.
+            partial (bool): True when the response stream was interrupted before completing.
+        """
+        first_seq, entries = self.add_messages(db.session, user_message, ai_response, partial)
         db.session.commit()
-        return battle.battle_log
+        if not self.apply_saved_messages(first_seq, entries):
+            self._snapshot = get_battle_snapshot(self._battle_id)
+        self.schedule_summary()
+        return self.battle_log
+
+    async def update_battle_log_async(self, session: "AsyncSession", user_message: str, ai_response: str, partial: bool = False):
+        """
+        update_battle_log for the ASGI app, the same statements run on the async session.
+        """
+        first_seq, entries = await session.run_sync(self.add_messages, user_message, ai_response, partial)
+        await session.commit()
+        if not await asyncio.to_thread(self.apply_saved_messages, first_seq, entries):
+            self._snapshot = await get_battle_snapshot_async(session, self._battle_id)
+        await asyncio.to_thread(self.schedule_summary)
+        await session.run_sync(self.load_log)
+        return self.battle_log
+
+    def add_messages(self, session, user_message: str, ai_response: str, partial: bool) -> Tuple[int, List[Dict]]:
+        """
+        Adds the user message, the combat engine results and the response to the session,
+        returns their first seq and log entries. Does not commit.
+        """
+        user_message_id = allocate_message_seq(self._battle_id, 2 + len(self.combat_results), session)
+        messages = [
+            BattleMessage(battle_id=self._battle_id, seq=user_message_id, creator='user',
+                          message=user_message, timestamp=datetime.now()),
+            *[BattleMessage(battle_id=self._battle_id, seq=user_message_id + 1 + index, creator='combat',
+                            message=f"[Combat engine] {result}", timestamp=datetime.now())
+              for index, result in enumerate(self.combat_results)],
+            BattleMessage(battle_id=self._battle_id, seq=user_message_id + 1 + len(self.combat_results), creator='ai',
+                          message=ai_response, partial=partial, timestamp=datetime.now()),
+        ]
+        entries = [message.to_dict() for message in messages]
+        session.add_all(messages)
+        return user_message_id, entries
+
+    def apply_saved_messages(self, first_seq: int, entries: List[Dict]) -> bool:
+        """
+        Writes committed messages through to the battle cache. Returns False when the snapshot
+        has to be reloaded because another turn or a legacy log migration happened since it was read.
+        """
+        if BattleCache.append_messages(self._snapshot, first_seq, entries):
+            battle_cache.put(self._battle_id, self._snapshot)
+            return True
+        battle_cache.invalidate(self._battle_id)
+        return False
 
     @property
     def get_model_formated_battle_log(self):
@@ -86,32 +382,19 @@ class BattleState:
         }
         """
         formatted_log = []
-        for message in self._battle.battle_log.values():
+        for message in self.battle_log.values():
             formatted_log.append({
-                "role": message["creator"],
+                "role": ContextBuilder.role(message["creator"]),
                 "parts": [{"text": message["message"]}]
             })
-        return formatted_log.strip()
+        return formatted_log
     
-    def get_battle_armies(battle_id):
+    @staticmethod
+    def get_battle_armies(battle_id) -> Dict[str, Dict]:
         """
-        Returns the player and opponent army details for a given battle.
+        Returns the parsed player and opponent rosters of a battle (see Roster.to_dict), keyed by side.
         """
-        battle = app.db.session.get(Battle, battle_id)
-        if battle is None:
-            return jsonify({"error": "Battle not found"}), 404
-
-        # If armies are stored as JSON strings, parse them
-        try:
-            player_army = battle.player_army
-            opponent_army = battle.opponent_army
-            if isinstance(player_army, str):
-                player_army = json.loads(player_army)
-            if isinstance(opponent_army, str):
-                opponent_army = json.loads(opponent_army)
-        except Exception as e:
-            app.flask.logger.info(f"Error parsing army details: {e}")
-        return {
-            "player_army": player_army,
-            "opponent_army": opponent_army
-        }
\ No newline at end of file
+        rosters = db.session.execute(
+            select(Roster).options(selectinload(Roster.units)).where(Roster.battle_id == battle_id)
+        ).scalars().all()
+        return {roster.side: roster.to_dict() for roster in rosters}
\ No newline at end of file
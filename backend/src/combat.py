@@ -0,0 +1,549 @@
+import logging
+import re
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from .metrics import REGISTRY, Counter
+
+log = logging.getLogger(__name__)
+
+# Re-roll options of hit and wound rolls
+NO_REROLL = "none"
+REROLL_ONES = "ones"
+REROLL_FAILED = "failed" # Also Twin-linked for wound rolls
+REROLLS = (NO_REROLL, REROLL_ONES, REROLL_FAILED)
+
+EXACT = "exact"
+SIMULATE = "simulate"
+
+# Fixed numbers ('3') or dice ('D6', '2D3+1'), as written on datasheets
+_DICE = re.compile(r"^(\d*)[dD](\d+)(?:\+(\d+))?$")
+_FACES = np.arange(1, 7)
+
+COMBAT_CALCULATIONS = REGISTRY.register(Counter(
+    "combat_calculations_total", "Attack sequences worked out by the combat engine", ("method", "result")))
+
+
+class InvalidProfile(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Dice:
+    count: int = 0
+    sides: int = 6
+    bonus: int = 0
+
+    @classmethod
+    def parse(cls, value) -> "Dice":
+        text = str(value).replace(" ", "")
+        if text.isdigit():
+            return cls(bonus=int(text))
+        match = _DICE.match(text)
+        if not match or int(match.group(2)) < 2:
+            raise InvalidProfile(f"Not a number or dice expression: {value!r}")
+        return cls(count=int(match.group(1) or 1), sides=int(match.group(2)), bonus=int(match.group(3) or 0))
+
+    def pmf(self) -> np.ndarray:
+        """
+        Probability of each total, indexed by the total.
+        """
+        pmf = np.zeros(self.bonus + 1)
+        pmf[self.bonus] = 1.0
+        face = np.full(self.sides + 1, 1.0 / self.sides)
+        face[0] = 0.0
+        for _ in range(self.count):
+            pmf = np.convolve(pmf, face)
+        return pmf
+
+    def roll(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        if not self.count:
+            return np.full(size, self.bonus, dtype=np.int64)
+        dtype = np.int8 if self.sides < 128 else np.int64
+        return rng.integers(1, self.sides + 1, size=(size, self.count), dtype=dtype).sum(axis=1) + self.bonus
+
+    def __str__(self):
+        if not self.count:
+            return str(self.bonus)
+        return f"{self.count if self.count > 1 else ''}D{self.sides}{f'+{self.bonus}' if self.bonus else ''}"
+
+
+@dataclass(frozen=True)
+class AttackProfile:
+    """
+    One weapon profile fired (or swung) by a number of models at one target unit, with the 10th edition
+    attack sequence: hit roll, wound roll, saving throw, damage and Feel No Pain.
+    Skills and saves are the number to roll, e.g. 3 for 3+; ap is the size of the modifier, 1 for AP -1.
+    """
+    attacks: Dice
+    skill: int
+    strength: int
+    toughness: int
+    save: int
+    damage: Dice = field(default_factory=lambda: Dice(bonus=1))
+    models: int = 1
+    ap: int = 0
+    invulnerable_save: Optional[int] = None
+    feel_no_pain: Optional[int] = None
+    cover: bool = False
+    hit_modifier: int = 0
+    wound_modifier: int = 0
+    reroll_hits: str = NO_REROLL
+    reroll_wounds: str = NO_REROLL
+    critical_hit: int = 6
+    critical_wound: int = 6 # Lower for Anti-X
+    sustained_hits: int = 0
+    lethal_hits: bool = False
+    devastating_wounds: bool = False
+    torrent: bool = False
+    wounds_per_model: Optional[int] = None # Needed for models slain
+    target_models: Optional[int] = None
+
+    def __post_init__(self):
+        for name in ("skill", "save", "invulnerable_save", "feel_no_pain", "critical_hit", "critical_wound"):
+            value = getattr(self, name)
+            if value is not None and not 2 <= value <= 7:
+                raise InvalidProfile(f"{name} must be between 2 and 7 (no save), got {value}")
+        for name in ("strength", "toughness", "models", "wounds_per_model", "target_models"):
+            value = getattr(self, name)
+            if value is not None and value < 1:
+                raise InvalidProfile(f"{name} must be at least 1, got {value}")
+        if self.ap < 0 or self.sustained_hits < 0:
+            raise InvalidProfile("ap and sustained_hits are positive numbers, e.g. ap=1 for AP -1")
+        if self.reroll_hits not in REROLLS or self.reroll_wounds not in REROLLS:
+            raise InvalidProfile(f"Re-rolls are one of {', '.join(REROLLS)}")
+
+    @classmethod
+    def from_dict(cls, values: Dict[str, Any]) -> "AttackProfile":
+        """
+        Builds a profile from JSON values (e.g. the arguments of a tool call), missing or null ones take their default.
+        """
+        names = {f.name: f for f in fields(cls)}
+        unknown = set(values) - set(names)
+        if unknown:
+            raise InvalidProfile(f"Unknown attack profile fields: {', '.join(sorted(unknown))}")
+        kwargs = {}
+        for name, value in values.items():
+            if value is None:
+                continue
+            if name in ("attacks", "damage"):
+                value = Dice.parse(value)
+            elif names[name].type in (bool, "bool"):
+                value = bool(value)
+            elif name not in ("reroll_hits", "reroll_wounds"):
+                try:
+                    value = int(value)
+                except (TypeError, ValueError):
+                    raise InvalidProfile(f"{name} must be a whole number, got {value!r}")
+            kwargs[name] = value
+        missing = {"attacks", "skill", "strength", "toughness", "save"} - set(kwargs)
+        if missing:
+            raise InvalidProfile(f"Missing attack profile fields: {', '.join(sorted(missing))}")
+        return cls(**kwargs)
+
+    @property
+    def wound_target(self) -> int:
+        if self.strength >= 2 * self.toughness:
+            return 2
+        if self.strength > self.toughness:
+            return 3
+        if self.strength == self.toughness:
+            return 4
+        return 5 if 2 * self.strength > self.toughness else 6
+
+    @property
+    def save_target(self) -> int:
+        """
+        The number the saving throw needs, 7 or more if there is none. Cover does not help 3+ or better saves against AP 0.
+        """
+        cover = 1 if self.cover and not (self.save <= 3 and self.ap == 0) else 0
+        target = self.save + self.ap - cover
+        if self.invulnerable_save:
+            target = min(target, self.invulnerable_save)
+        return max(target, 2)
+
+    def describe(self) -> str:
+        ap = f"AP-{self.ap}" if self.ap else "AP0"
+        text = (f"{self.models} x {self.attacks} attacks, {'torrent' if self.torrent else f'{self.skill}+ to hit'}, "
+                f"S{self.strength} {ap} Dmg {self.damage} vs T{self.toughness} Sv{self.save}+")
+        if self.invulnerable_save:
+            text += f" {self.invulnerable_save}++"
+        if self.feel_no_pain:
+            text += f" FNP {self.feel_no_pain}+"
+        if self.cover:
+            text += " in cover"
+        rules = [name.replace("_", " ") for name in ("lethal_hits", "devastating_wounds") if getattr(self, name)]
+        if self.sustained_hits:
+            rules.append(f"sustained hits {self.sustained_hits}")
+        rules += [f"re-roll {kind} {option}" for kind, option in (("hits", self.reroll_hits), ("wounds", self.reroll_wounds))
+                  if option != NO_REROLL]
+        return text + (f" ({', '.join(rules)})" if rules else "")
+
+
+def roll_outcomes(target: int, modifier: int, critical: int, reroll: str) -> Tuple[float, float]:
+    """
+    (P(critical success), P(other success)) of a D6 hit or wound roll. An unmodified 1 always fails,
+    an unmodified roll of `critical` or more always succeeds and modifiers are capped at +1/-1.
+    """
+    crit, success = _judge(_FACES, target, modifier, critical)
+    again = _FACES == 1 if reroll == REROLL_ONES else ~success if reroll == REROLL_FAILED else np.zeros(6, bool)
+    # A re-rolled die counts as a fresh roll
+    p_crit = (crit & ~again).sum() / 6 + again.mean() * crit.mean()
+    p_success = (success & ~again).sum() / 6 + again.mean() * success.mean()
+    return float(p_crit), float(p_success - p_crit)
+
+
+def _judge(faces: np.ndarray, target: int, modifier: int, critical: int) -> Tuple[np.ndarray, np.ndarray]:
+    crit = faces >= critical
+    return crit, crit | ((faces != 1) & (faces + max(-1, min(1, modifier)) >= target))
+
+
+def _fail_save(profile: AttackProfile) -> float:
+    return float(((_FACES == 1) | (_FACES < profile.save_target)).mean())
+
+
+def _ignore_damage(profile: AttackProfile) -> float:
+    return (7 - profile.feel_no_pain) / 6 if profile.feel_no_pain else 0.0
+
+
+def _mix(*weighted: Tuple[float, np.ndarray]) -> np.ndarray:
+    pmf = np.zeros(max(len(values) for _, values in weighted))
+    for weight, values in weighted:
+        pmf[:len(values)] += weight * values
+    return pmf
+
+
+def _point(value: int) -> np.ndarray:
+    pmf = np.zeros(value + 1)
+    pmf[value] = 1.0
+    return pmf
+
+
+def _power(pmf: np.ndarray, n: int) -> np.ndarray:
+    """
+    Distribution of the sum of n independent draws of pmf.
+    """
+    result = _point(0)
+    while n:
+        if n & 1:
+            result = np.convolve(result, pmf)
+        n >>= 1
+        if n:
+            pmf = np.convolve(pmf, pmf)
+    return result
+
+
+def _compound(counts: np.ndarray, pmf: np.ndarray) -> np.ndarray:
+    """
+    Distribution of the sum of a random number (distributed as counts) of independent draws of pmf.
+    """
+    total, power = np.zeros(1), _point(0)
+    for n, weight in enumerate(counts):
+        if weight > 0:
+            total = _mix((1.0, total), (weight, power))
+        if n < len(counts) - 1:
+            power = np.convolve(power, pmf)
+    return total
+
+
+def _models_slain(unsaved: np.ndarray, damage: np.ndarray, wounds: int, models: Optional[int]) -> np.ndarray:
+    """
+    Distribution of the models slain when a random number (unsaved) of attacks with damage distributed as `damage`
+    is allocated one at a time to models with `wounds` wounds each. Excess damage of an attack is lost.
+    State: [models slain, wounds left on the model being allocated to].
+    """
+    models = models or len(unsaved) - 1
+    state = np.zeros((models + 1, wounds + 1))
+    state[0, wounds] = 1.0
+    slain = unsaved[0] * state.sum(axis=1)
+    for weight in unsaved[1:]:
+        step = np.zeros_like(state)
+        step[models, wounds] = state[models].sum()
+        alive = state[:models]
+        for value, p in enumerate(damage):
+            if p == 0:
+                continue
+            if value < wounds:
+                step[:models, 1:wounds + 1 - value] += p * alive[:, 1 + value:]
+            step[1:, wounds] += p * alive[:, 1:min(value, wounds) + 1].sum(axis=1)
+        state = step
+        slain += weight * state.sum(axis=1)
+    return slain
+
+
+@dataclass
+class CombatResult:
+    """
+    Distributions of the outcomes of an attack sequence, indexed by value: hits, wounds, unsaved (attacks that
+    got through saves, mortal wounds included), damage (after Feel No Pain) and models_slain when known.
+    """
+    method: str
+    distributions: Dict[str, np.ndarray]
+    trials: Optional[int] = None
+    seed: Optional[int] = None
+
+    def mean(self, name: str) -> float:
+        pmf = self.distributions[name]
+        return float(np.dot(np.arange(len(pmf)), pmf))
+
+    def at_least(self, name: str) -> np.ndarray:
+        """
+        P(outcome >= value), indexed by value.
+        """
+        return np.cumsum(self.distributions[name][::-1])[::-1]
+
+    def to_dict(self, min_probability: float = 0.005) -> Dict[str, Any]:
+        """
+        A compact JSON summary: the expected outcomes and the chances of at least 1, 2, ... damage and models slain,
+        up to the first value below min_probability.
+        """
+        summary = {
+            "method": self.method,
+            "expected": {name: round(self.mean(name), 3) for name in self.distributions},
+        }
+        for name in ("damage", "models_slain"):
+            if name in self.distributions:
+                chances = self.at_least(name)[1:]
+                kept = chances[chances >= min_probability]
+                summary[f"chance_of_at_least_{name}"] = {str(value): round(float(p), 4)
+                                                        for value, p in enumerate(kept, start=1)}
+        if self.method == SIMULATE:
+            summary.update(trials=self.trials, seed=self.seed)
+        return summary
+
+    def describe(self) -> str:
+        expected = ", ".join(f"{round(self.mean(name), 2)} {name.replace('_', ' ')}" for name in self.distributions)
+        text = f"expected {expected}"
+        if "models_slain" in self.distributions:
+            chances = self.at_least("models_slain")
+            text += f"; {round(float(chances[1]) * 100 if len(chances) > 1 else 0.0, 1)}% to slay at least one model"
+        return text
+
+
+def distribution(profile: AttackProfile) -> CombatResult:
+    """
+    The exact distributions of an attack sequence. Each attack is independent, so the distribution of one
+    attack is worked out from the roll probabilities and summed over the (possibly random) number of attacks.
+    """
+    if profile.torrent:
+        crit_hit, normal_hit = 0.0, 1.0
+    else:
+        crit_hit, normal_hit = roll_outcomes(profile.skill, profile.hit_modifier, profile.critical_hit, profile.reroll_hits)
+    crit_wound, normal_wound = roll_outcomes(profile.wound_target, profile.wound_modifier, profile.critical_wound,
+                                             profile.reroll_wounds)
+    fail_save = _fail_save(profile)
+    ignore = _ignore_damage(profile)
+    damage = profile.damage.pmf()
+    if ignore:
+        # Each point of damage is rolled for separately
+        damage = _mix(*[(p, _binomial(value, 1 - ignore)) for value, p in enumerate(damage) if p > 0])
+
+    # Per wound roll, and per automatic wound of a Lethal Hit
+    unsaved = (crit_wound if profile.devastating_wounds else crit_wound * fail_save) + normal_wound * fail_save
+    wound_roll = {
+        "wounds": np.array([1 - crit_wound - normal_wound, crit_wound + normal_wound]),
+        "unsaved": np.array([1 - unsaved, unsaved]),
+        "damage": _mix((1 - unsaved, _point(0)), (unsaved, damage)),
+    }
+    automatic = {
+        "wounds": _point(1),
+        "unsaved": np.array([1 - fail_save, fail_save]),
+        "damage": _mix((1 - fail_save, _point(0)), (fail_save, damage)),
+    }
+
+    sustained = profile.sustained_hits
+    miss = 1 - crit_hit - normal_hit
+    per_attack = {"hits": _mix((miss, _point(0)), (normal_hit, _point(1)), (crit_hit, _point(1 + sustained)))}
+    for name in wound_roll:
+        if profile.lethal_hits:
+            critical = np.convolve(automatic[name], _power(wound_roll[name], sustained))
+        else:
+            critical = _power(wound_roll[name], 1 + sustained)
+        per_attack[name] = _mix((miss, _point(0)), (normal_hit, wound_roll[name]), (crit_hit, critical))
+
+    attacks = _power(profile.attacks.pmf(), profile.models)
+    distributions = {name: _compound(attacks, pmf) for name, pmf in per_attack.items()}
+    if profile.wounds_per_model:
+        distributions["models_slain"] = _models_slain(distributions["unsaved"], damage, profile.wounds_per_model,
+                                                      profile.target_models)
+    return CombatResult(EXACT, distributions)
+
+
+def _binomial(n: int, p: float) -> np.ndarray:
+    return _power(np.array([1 - p, p]), n)
+
+
+def _roll(rng: np.random.Generator, size: int, target: int, modifier: int, critical: int,
+          reroll: str) -> Tuple[np.ndarray, np.ndarray]:
+    faces = rng.integers(1, 7, size=size, dtype=np.int8)
+    crit, success = _judge(faces, target, modifier, critical)
+    if reroll != NO_REROLL:
+        again = faces == 1 if reroll == REROLL_ONES else ~success
+        faces[again] = rng.integers(1, 7, size=int(again.sum()), dtype=np.int8)
+        crit, success = _judge(faces, target, modifier, critical)
+    return crit, success
+
+
+def simulate(profile: AttackProfile, trials: int, seed: Optional[int] = None) -> CombatResult:
+    """
+    Monte Carlo estimate of the distributions: every die of `trials` independent attack sequences is rolled,
+    all trials at once. Each stage rolls one flat array of dice, trial after trial, and knows from the
+    previous stage how many of them belong to each trial. The same seed gives the same result.
+    """
+    rng = np.random.default_rng(seed)
+    if profile.attacks.count:
+        attacks = profile.attacks.roll(rng, trials * profile.models).reshape(trials, profile.models).sum(axis=1)
+    else:
+        attacks = np.full(trials, profile.attacks.bonus * profile.models)
+    count = int(attacks.sum())
+    if profile.torrent:
+        crit_hit, hit = np.zeros(count, bool), np.ones(count, bool)
+    else:
+        crit_hit, hit = _roll(rng, count, profile.skill, profile.hit_modifier, profile.critical_hit, profile.reroll_hits)
+    hits = hit.astype(np.int8)
+    if profile.sustained_hits:
+        hits += crit_hit.astype(np.int8) * np.int8(profile.sustained_hits)
+    trial_hits = _per_trial(hits, attacks)
+
+    # One wound roll per hit. With Lethal Hits the first hit of a critical hit wounds automatically.
+    automatic = np.zeros(int(trial_hits.sum()), bool)
+    if profile.lethal_hits:
+        automatic[(np.cumsum(hits) - hits)[crit_hit]] = True
+    crit_wound, wound = _roll(rng, len(automatic), profile.wound_target, profile.wound_modifier,
+                              profile.critical_wound, profile.reroll_wounds)
+    wound |= automatic
+    mortal = crit_wound & ~automatic if profile.devastating_wounds else np.zeros(len(automatic), bool)
+    saving = wound & ~mortal
+    faces = rng.integers(1, 7, size=int(saving.sum()), dtype=np.int8)
+    unsaved = mortal.copy()
+    unsaved[saving] = (faces == 1) | (faces < profile.save_target)
+    trial_unsaved = _per_trial(unsaved, trial_hits)
+
+    damage = profile.damage.roll(rng, int(trial_unsaved.sum()))
+    if profile.feel_no_pain:
+        ignored = rng.integers(1, 7, size=int(damage.sum()), dtype=np.int8) >= profile.feel_no_pain
+        damage = damage - _per_trial(ignored, damage)
+
+    totals = {
+        "hits": trial_hits,
+        "wounds": _per_trial(wound, trial_hits),
+        "unsaved": trial_unsaved,
+        "damage": _per_trial(damage, trial_unsaved),
+    }
+    if profile.wounds_per_model:
+        totals["models_slain"] = _allocate(damage, trial_unsaved, profile.wounds_per_model, profile.target_models)
+    distributions = {name: np.bincount(values) / trials for name, values in totals.items()}
+    return CombatResult(SIMULATE, distributions, trials=trials, seed=seed)
+
+
+def _per_trial(values: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """
+    Sums of consecutive runs of values, counts[i] of them for trial i.
+    """
+    sums = np.zeros(len(counts), dtype=np.int64)
+    present = counts > 0
+    if present.any():
+        sums[present] = np.add.reduceat(values, (np.cumsum(counts) - counts)[present], dtype=np.int64)
+    return sums
+
+
+def _allocate(damage: np.ndarray, counts: np.ndarray, wounds: int, models: Optional[int]) -> np.ndarray:
+    """
+    Models slain per trial, allocating the damage of each trial's unsaved attacks (counts[i] of them for trial i)
+    one at a time. The n-th attacks of all trials are allocated together, one step per attack of the longest trial.
+    """
+    trial = np.repeat(np.arange(len(counts)), counts)
+    position = np.arange(len(trial)) - np.repeat(np.cumsum(counts) - counts, counts)
+    # A radix sort for the (small) positions
+    order = np.argsort(position.astype(np.int16 if counts.max(initial=0) < 2 ** 15 else np.int64), kind="stable")
+    slain = np.zeros(len(counts), dtype=np.int64)
+    left = np.full(len(counts), wounds, dtype=np.int64)
+    start = 0
+    # Within a step every trial appears at most once
+    for end in np.cumsum(np.bincount(position)):
+        step = order[start:end]
+        rows = trial[step]
+        left[rows] -= damage[step]
+        dead = rows[left[rows] <= 0]
+        slain[dead] += 1
+        left[dead] = wounds
+        start = end
+    return np.minimum(slain, models) if models else slain
+
+
+def evaluate(arguments: Dict[str, Any], trials: int, max_trials: int) -> Tuple[AttackProfile, CombatResult]:
+    """
+    Runs a calculation requested by the model (see TOOL_DECLARATION): exact unless it asks for a simulation.
+    Raises InvalidProfile for arguments that do not describe an attack.
+    """
+    arguments = dict(arguments)
+    method = arguments.pop("method", None) or EXACT
+    seed = arguments.pop("seed", None)
+    trials = min(int(arguments.pop("trials", None) or trials), max_trials)
+    try:
+        profile = AttackProfile.from_dict(arguments)
+        if method == SIMULATE:
+            result = simulate(profile, trials, seed=None if seed is None else int(seed))
+        elif method == EXACT:
+            result = distribution(profile)
+        else:
+            raise InvalidProfile(f"method is '{EXACT}' or '{SIMULATE}', got {method!r}")
+    except InvalidProfile:
+        COMBAT_CALCULATIONS.inc(method=method, result="invalid")
+        raise
+    COMBAT_CALCULATIONS.inc(method=method, result="ok")
+    return profile, result
+
+
+TOOL_NAME = "calculate_attack"
+
+_INTEGER = {"type": "INTEGER"}
+_BOOLEAN = {"type": "BOOLEAN"}
+_REROLL = {"type": "STRING", "enum": list(REROLLS)}
+
+# Gemini function declaration (OpenAPI schema subset) of evaluate, see GenClient.tools
+TOOL_DECLARATION = {
+    "name": TOOL_NAME,
+    "description": (
+        "Works out the hit rolls, wound rolls, saving throws and damage of one weapon profile attacking one unit, "
+        "with the 10th edition rules. Returns the expected hits, wounds, unsaved wounds, damage and models slain "
+        "and the chance of at least N damage / models slain. Use it for every expected damage or odds question "
+        "instead of estimating. Roll targets are the number needed, e.g. 3 for 3+; ap is positive, 1 for AP -1."
+    ),
+    "parameters": {
+        "type": "OBJECT",
+        "properties": {
+            "attacks": {"type": "STRING", "description": "Attacks per model, a number or dice, e.g. '2', 'D6', '2D3+1'"},
+            "models": {**_INTEGER, "description": "Attacking models with this weapon, default 1"},
+            "skill": {**_INTEGER, "description": "BS or WS, e.g. 3 for 3+"},
+            "strength": _INTEGER,
+            "ap": {**_INTEGER, "description": "1 for AP -1, default 0"},
+            "damage": {"type": "STRING", "description": "Damage, a number or dice, default '1'"},
+            "toughness": _INTEGER,
+            "save": {**_INTEGER, "description": "Armour save of the target, 7 for none"},
+            "invulnerable_save": _INTEGER,
+            "feel_no_pain": _INTEGER,
+            "wounds_per_model": {**_INTEGER, "description": "Wounds characteristic of the target, for models slain"},
+            "target_models": {**_INTEGER, "description": "Models in the target unit"},
+            "cover": {**_BOOLEAN, "description": "Target has the Benefit of Cover"},
+            "hit_modifier": {**_INTEGER, "description": "-1, 0 or 1"},
+            "wound_modifier": {**_INTEGER, "description": "-1, 0 or 1"},
+            "reroll_hits": _REROLL,
+            "reroll_wounds": {**_REROLL, "description": "'failed' for Twin-linked"},
+            "sustained_hits": {**_INTEGER, "description": "Extra hits per critical hit"},
+            "lethal_hits": _BOOLEAN,
+            "devastating_wounds": _BOOLEAN,
+            "torrent": _BOOLEAN,
+            "critical_hit": {**_INTEGER, "description": "Unmodified hit roll that is a critical hit, default 6"},
+            "critical_wound": {**_INTEGER, "description": "Unmodified wound roll that is a critical wound, "
+                                                          "default 6, e.g. 4 for Anti-Infantry 4+ against infantry"},
+            "method": {"type": "STRING", "enum": [EXACT, SIMULATE],
+                       "description": "'exact' (default) or 'simulate' to actually roll the dice many times"},
+            "seed": {**_INTEGER, "description": "Seed of a simulation, the same seed gives the same rolls"},
+            "trials": {**_INTEGER, "description": "Attack sequences to simulate"},
+        },
+        "required": ["attacks", "skill", "strength", "toughness", "save"],
+    },
+}
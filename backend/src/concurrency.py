@@ -0,0 +1,86 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+
+from .parameters import ASYNC_GENERATION_CONCURRENCY, GENERATION_CONCURRENCY, GENERATION_QUEUE_TIMEOUT
+
+
+class GenerationBusy(Exception):
+    """
+    Raised when no generation slot frees up within the queue timeout.
+    retry_after is the number of seconds clients are told to wait before retrying.
+    """
+
+    def __init__(self, message: str, retry_after: int = 5):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """
+    Caps how many model calls a single worker process runs at once, so a burst of chat turns
+    cannot occupy every thread and starve cheap routes. Requests wait up to `timeout` seconds
+    for a slot before giving up.
+    """
+
+    def __init__(self, limit: int, timeout: float):
+        self.limit = limit
+        self.timeout = timeout
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self):
+        if not self._semaphore.acquire(timeout=self.timeout):
+            raise GenerationBusy(f"All {self.limit} generation slots are busy")
+        with self._lock:
+            self._in_flight += 1
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._semaphore.release()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class AsyncConcurrencyLimiter:
+    """
+    ConcurrencyLimiter for the ASGI app. Waiting turns hold no thread, so the limit only protects
+    the Gemini quota and can be much higher than the threaded one.
+    """
+
+    def __init__(self, limit: int, timeout: float):
+        self.limit = limit
+        self.timeout = timeout
+        self._semaphore = asyncio.BoundedSemaphore(limit)
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def acquire(self):
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise GenerationBusy(f"All {self.limit} generation slots are busy")
+        self._in_flight += 1
+
+    def release(self):
+        self._in_flight -= 1
+        self._semaphore.release()
+
+
+generation_limiter = ConcurrencyLimiter(GENERATION_CONCURRENCY, GENERATION_QUEUE_TIMEOUT)
+async_generation_limiter = AsyncConcurrencyLimiter(ASYNC_GENERATION_CONCURRENCY, GENERATION_QUEUE_TIMEOUT)
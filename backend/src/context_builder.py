@@ -0,0 +1,110 @@
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+# (seq, {"creator": ..., "message": ...}) pairs in the battle log format
+LogEntry = Tuple[int, Dict]
+
+MODEL_CREATORS = ("ai", "agent", "model")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (~4 characters per token) used to keep the prompt under budget
+    without a count_tokens round trip per message.
+    """
+    return len(text) // 4 + 1
+
+
+@dataclass
+class ContextWindow:
+    contents: List["types.Content"] = field(default_factory=list)
+    first_seq: Optional[int] = None # seq of the oldest message sent, None if no history was sent
+    tokens: int = 0
+    # seq of the oldest message within the budget, None without history. The summary should cover the messages
+    # before it, until it does they are sent as well.
+    budget_start_seq: Optional[int] = None
+
+
+class ContextBuilder:
+    """
+    Turns the most recent battle messages into multi-turn Gemini contents.
+    Walks back from the newest message until either max_messages or the token budget is reached;
+    anything older is expected to be covered by the battle's rolling summary. The history holds the messages
+    the summary does not cover yet, so older ones are sent too (up to max_unsummarized of them, in case
+    summaries keep failing) rather than dropping out of the model's context until the next summary.
+    """
+
+    def __init__(self, token_budget: int, max_messages: int, count_tokens: Callable[[str], int] = estimate_tokens,
+                 max_unsummarized: int = 0):
+        self.token_budget = token_budget
+        self.max_messages = max_messages
+        self.count_tokens = count_tokens
+        self.max_unsummarized = max_unsummarized
+
+    @property
+    def history_limit(self) -> int:
+        """
+        The number of newest messages build() may send.
+        """
+        return self.max_messages + self.max_unsummarized if self.max_messages else 0
+
+    @staticmethod
+    def role(creator: str) -> str:
+        return "model" if creator in MODEL_CREATORS else "user"
+
+    def build(self, history: List[LogEntry], user_message: str, preamble: Optional[str] = None) -> ContextWindow:
+        """
+        Args:
+            history (List[LogEntry]): The battle messages not covered by the summary, in ascending seq order.
+            user_message (str): The new message of the player, always sent.
+            preamble (str): Optional text sent as the first part of the first user turn.
+        Returns:
+            ContextWindow: The contents to send and the oldest seq they include.
+        """
+        used = self.count_tokens(user_message) + (self.count_tokens(preamble) if preamble else 0)
+        window: List[LogEntry] = []
+        for seq, entry in reversed(history[-self.max_messages:] if self.max_messages else []):
+            cost = self.count_tokens(entry.get("message") or "")
+            if used + cost > self.token_budget:
+                break
+            used += cost
+            window.append((seq, entry))
+        window.reverse()
+        # A conversation has to start with a user turn
+        while window and self.role(window[0][1].get("creator")) == "model":
+            window.pop(0)
+        budget_start_seq = window[0][0] if window else (history[-1][0] + 1 if history else None)
+        if self.max_unsummarized and budget_start_seq is not None:
+            older = [(seq, entry) for seq, entry in history if seq < budget_start_seq][-self.max_unsummarized:]
+            while older and self.role(older[0][1].get("creator")) == "model":
+                older.pop(0)
+            used += sum(self.count_tokens(entry.get("message") or "") for _, entry in older)
+            window = older + window
+
+        turns: List[Tuple[str, List[str]]] = []
+        for _, entry in window:
+            role = self.role(entry.get("creator"))
+            if turns and turns[-1][0] == role:
+                turns[-1][1].append(entry.get("message") or "")
+            else:
+                turns.append((role, [entry.get("message") or ""]))
+        if turns and turns[-1][0] == "user":
+            turns[-1][1].append(user_message)
+        else:
+            turns.append(("user", [user_message]))
+        if preamble:
+            first_user = next(parts for role, parts in turns if role == "user")
+            first_user.insert(0, preamble)
+
+        # Imported here so loading the app doesn't pull in google-genai before a model call needs it
+        from google.genai import types
+
+        contents = [
+            types.Content(role=role, parts=[types.Part(text=text) for text in parts])
+            for role, parts in turns
+        ]
+        return ContextWindow(contents=contents, first_seq=window[0][0] if window else None, tokens=used,
+                             budget_start_seq=budget_start_seq)
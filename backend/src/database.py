@@ -0,0 +1,150 @@
+import logging
+import threading
+import time
+from typing import Dict
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+from .parameters import (PROCESS_ROLE, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+                         DB_POOL_PRE_PING, DB_STATEMENT_TIMEOUT_MS, DB_PGBOUNCER)
+
+log = logging.getLogger(__name__)
+
+
+class PoolWaitStats:
+    """
+    How long checkouts waited for a pooled connection, across all engines of the process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += 1 if timed_out else 0
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def as_dict(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "checkouts_total": self.checkouts,
+                "checkout_timeouts_total": self.timeouts,
+                "checkout_wait_seconds_total": self.wait_seconds_total,
+                "checkout_wait_seconds_max": self.wait_seconds_max,
+            }
+
+
+pool_wait_stats = PoolWaitStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that records the time spent waiting for a connection.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_wait_stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_wait_stats.record(time.perf_counter() - start)
+        return connection
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """
+    InstrumentedQueuePool for asyncio engines (the ASGI app).
+    """
+
+
+def engine_options(database_url: str) -> Dict:
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for the current process role.
+    """
+    if database_url.startswith("sqlite"):
+        # Local/benchmark fallback, Flask-SQLAlchemy picks the right pool for SQLite
+        return {}
+    if DB_PGBOUNCER:
+        # PgBouncer in transaction mode rejects startup options, set statement_timeout on the PgBouncer/role side
+        log.info(f"Database pool ({PROCESS_ROLE}): NullPool, pooling delegated to PgBouncer")
+        return {"poolclass": NullPool, "pool_pre_ping": DB_POOL_PRE_PING}
+
+    options = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if DB_STATEMENT_TIMEOUT_MS:
+        options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    log.info(f"Database pool ({PROCESS_ROLE}): size={DB_POOL_SIZE} overflow={DB_MAX_OVERFLOW} "
+             f"timeout={DB_POOL_TIMEOUT}s recycle={DB_POOL_RECYCLE}s statement_timeout={DB_STATEMENT_TIMEOUT_MS}ms")
+    return options
+
+
+def async_database_url(database_url: str) -> str:
+    """
+    DATABASE_URL with the driver swapped for its asyncio counterpart (asyncpg, aiosqlite).
+    """
+    url = make_url(database_url)
+    if url.get_backend_name() == "postgresql":
+        return url.set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+    if url.get_backend_name() == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    return database_url
+
+
+def async_engine_options(database_url: str) -> Dict:
+    """
+    create_async_engine options, the same pool settings as engine_options with asyncpg connect arguments.
+    """
+    if database_url.startswith("sqlite"):
+        return {}
+    if DB_PGBOUNCER:
+        # Prepared statements do not survive PgBouncer transaction pooling
+        log.info(f"Async database pool ({PROCESS_ROLE}): NullPool, pooling delegated to PgBouncer")
+        return {"poolclass": NullPool, "pool_pre_ping": DB_POOL_PRE_PING,
+                "connect_args": {"statement_cache_size": 0, "prepared_statement_cache_size": 0}}
+
+    options = {
+        "poolclass": InstrumentedAsyncQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if DB_STATEMENT_TIMEOUT_MS:
+        options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+    log.info(f"Async database pool ({PROCESS_ROLE}): size={DB_POOL_SIZE} overflow={DB_MAX_OVERFLOW} "
+             f"timeout={DB_POOL_TIMEOUT}s recycle={DB_POOL_RECYCLE}s statement_timeout={DB_STATEMENT_TIMEOUT_MS}ms")
+    return options
+
+
+def pool_metrics(engine) -> Dict[str, float]:
+    """
+    Current state of the engine's connection pool plus the checkout wait statistics.
+    """
+    pool = engine.pool
+    metrics = {}
+    if isinstance(pool, QueuePool):
+        metrics.update({
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+        })
+    metrics.update(pool_wait_stats.as_dict())
+    return metrics
@@ -0,0 +1,30 @@
+from flask import Flask
+
+from backend.src.app import app as source
+
+
+def create_app() -> Flask:
+    """
+    The configured Flask app: the API blueprint and the CLI commands (init-db, upgrade-db, ...) on the process's
+    App.flask. Loading it imports Flask, SQLAlchemy and the models; the Gemini, Celery and Google sign-in clients
+    are imported and created on first use. Calling it again returns the same app.
+    """
+    flask = source.flask
+    if "api" not in flask.blueprints:
+        from backend.src import scripts  # noqa: F401
+        from backend.src.server import api
+        flask.register_blueprint(api)
+    return flask
+
+
+def preload_imports():
+    """
+    Imports the modules create_app leaves to first use, without creating any client or connection.
+    Run in the Gunicorn master when the app is preloaded (see gunicorn.conf.py), so workers share them
+    copy-on-write instead of each paying for the imports on its first requests.
+    """
+    import google.genai.types  # noqa: F401
+    import google.oauth2.id_token  # noqa: F401
+    import backend.src.gen_client  # noqa: F401
+    import backend.src.http_client  # noqa: F401
+    import backend.tasks.tasks  # noqa: F401
@@ -1,47 +1,256 @@
+import asyncio
+import hashlib
+import json
 import logging
-import os
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
 from google import genai
 from google.genai import types
+from redis import Redis
 
-from .parameters import GOOGLEAI_API_KEY
+from . import combat
+from .context_builder import ContextBuilder
+from .instructions import ContextCache, static_instructions, static_instructions_digest
+from .logging_config import log_payload
+from .metrics import record_llm_call
+from .response_cache import ResponseCache
+from .roster import OPPONENT, PLAYER
+from .parameters import (GOOGLEAI_API_KEY, CONTEXT_CACHE_ENABLED, CONTEXT_CACHE_TTL_SECONDS,
+                         CONTEXT_TOKEN_BUDGET, CONTEXT_MAX_MESSAGES, COMBAT_TOOL_ENABLED, COMBAT_TOOL_MAX_ROUNDS,
+                         COMBAT_SIMULATION_TRIALS, COMBAT_MAX_TRIALS, SUMMARY_MIN_MESSAGES)
 
 log = logging.getLogger(__name__)
 
 GEMINI_MODEL = "gemini-2.5-flash-preview-04-17"
 
+SUMMARY_INSTRUCTIONS = (
+    "You summarize the chat history of a practice game of Warhammer 40K between a Player and an AI Opponent. "
+    "Keep every fact needed to continue the game: deployment, unit positions and losses, objectives held, "
+    "scores, command points, stratagems used and any agreements between the players. Be concise."
+)
+
+OPPONENT_PLAN_PROMPT = (
+    "[Planning note, not a message from your Opponent] Your Opponent is playing their turn of battle round {battle_round}. "
+    "Think ahead to your own next turn: from the battle so far, write down your plan phase by phase (movement, "
+    "shooting, charges, objectives, stratagems) as short notes for yourself. Do not reply to your Opponent."
+)
+
+IMAGE_ANALYSIS_PROMPT = (
+    "This is a photo of a Warhammer 40K game in progress. Describe the board for a player asking for advice: "
+    "the terrain, the units you can identify for each army and where they stand, objective markers and anything "
+    "else that matters for the next move. Say when something cannot be made out instead of guessing."
+)
+
+# Tool config of the last round of function calls: the model has to reply with text
+NO_FUNCTION_CALLS = types.ToolConfig(function_calling_config=types.FunctionCallingConfig(mode="NONE"))
+
+
+class EmptyReply(Exception):
+    """
+    Raised when the model ends a turn without any text, e.g. a blocked response.
+    An empty reply is never saved to the battle log or the response cache.
+    """
+
+
+def reply_text(response: types.GenerateContentResponse) -> str:
+    if not response.text:
+        finish_reason = response.candidates[0].finish_reason if response.candidates else None
+        raise EmptyReply(f"The model replied without text (finish reason {finish_reason})")
+    return response.text
+
+
+def function_call_parts(response: types.GenerateContentResponse) -> List[types.Part]:
+    """
+    The function calls of a response (or streamed chunk), as parts so they keep their thought signatures.
+    """
+    if not response.candidates or not response.candidates[0].content:
+        return []
+    return [part for part in response.candidates[0].content.parts or [] if part.function_call]
+
+
+def model_turn(text: List[str], calls: List[types.Part]) -> types.Content:
+    """
+    The model turn of a streamed round that ended in function calls, to send back with their results.
+    """
+    parts = [types.Part(text="".join(text))] if text else []
+    return types.Content(role="model", parts=parts + calls)
+
+
 class GenClient:
     _client: genai.Client
+    _context_cache: ContextCache = None
+    _response_cache: ResponseCache = None
+    # Function declarations offered to the model, None when the combat engine tool is off
+    _tools: Optional[List[types.Tool]] = None
 
     @property
     def list_models(self):
         log.info(f'List models: {[model for model in self._client.models.list()]}')
         
-    def __init__(self):
+    def __init__(self, response_cache: Optional[ResponseCache] = None, get_redis: Optional[Callable[[], Redis]] = None):
         self._client = genai.Client(
             api_key=GOOGLEAI_API_KEY,
             http_options=types.HttpOptions(api_version='v1alpha')
         )
+        if CONTEXT_CACHE_ENABLED:
+            self._context_cache = ContextCache(self._client, ttl_seconds=CONTEXT_CACHE_TTL_SECONDS, get_redis=get_redis)
+        # Room for the messages that dropped out of the budget while their summary is scheduled and running
+        self._context_builder = ContextBuilder(token_budget=CONTEXT_TOKEN_BUDGET, max_messages=CONTEXT_MAX_MESSAGES,
+                                               max_unsummarized=2 * SUMMARY_MIN_MESSAGES)
+        self._response_cache = response_cache
+        self._tools_digest = ""
+        if COMBAT_TOOL_ENABLED:
+            self._tools = [types.Tool(function_declarations=[types.FunctionDeclaration(**combat.TOOL_DECLARATION)])]
+            declaration = json.dumps(combat.TOOL_DECLARATION, sort_keys=True)
+            self._tools_digest = hashlib.sha256(declaration.encode("utf-8")).hexdigest()
 
+    def instructions_digest(self) -> str:
+        """
+        Digest of the static instructions and the function declarations, what the cached content holds.
+        """
+        if not self._tools_digest:
+            return static_instructions_digest()
+        return hashlib.sha256(f"{static_instructions_digest()}:{self._tools_digest}".encode("utf-8")).hexdigest()
 
-    def read_rules_file(self) -> str:
-        rules_path = os.path.join(os.path.dirname(__file__), "../instructions/rules.txt")
-        try:
-            with open(rules_path, "r", encoding="utf-8") as f:
-                return f.read()
-        except Exception as e:
-            log.error(f"Error reading rules.txt: {e}")
-            return ""
-    
-    def get_system_instructions(self, battle_state) -> str:
-        system_instructions =  [
-            "*****Your Instructions********", 
-            "You are an AI Oppenent for a Player who wants to play a practive game of Warhammer 40K. YOu are an expert of the latest rules for all factions and detachments of 40K. You will speak to your oppenent as an experienced commander in the 40K universe.",
-            f"Your Opponent is playing {battle_state.player_army} and you are playing {battle_state.opponent_army}.\n",
-            f"************** Here is the current history of the battle messages: {battle_state.battle_log}.\n\n",
-            f"Here are the rules for the game: {self.read_rules_file()}\n"
+    def get_battle_instructions(self, battle_state, stateless: bool = False) -> str:
+        """
+        The part of the system instructions that is specific to the battle.
+        Stateless requests leave out the battle summary.
+        """
+        battle_instructions = [
+            f"Your Opponent is playing this army:\n{battle_state.army_prompt(PLAYER)}\n",
+            f"You are playing this army:\n{battle_state.army_prompt(OPPONENT)}\n",
         ]
-        return "\n".join(system_instructions)
-    
+        if battle_state.summary and not stateless:
+            battle_instructions.append(f"************** Here is a summary of the battle so far: {battle_state.summary}\n")
+        if battle_state.opponent_plan and not stateless:
+            battle_instructions.append(
+                "************** Your plan for this turn, made during your Opponent's turn "
+                f"(adapt it to what happened since): {battle_state.opponent_plan}\n")
+        return "\n".join(battle_instructions)
+
+    def get_system_instructions(self, battle_state, stateless: bool = False) -> str:
+        return "\n".join([static_instructions(), self.get_battle_instructions(battle_state, stateless)])
+
+    def build_request(self, content: str, battle_state, stateless: bool = False) -> Tuple[List[types.Content], types.GenerateContentConfig]:
+        """
+        Builds the contents and config for a generate call.
+        The recent battle messages are sent as multi-turn contents ending with the new message.
+        When the static instructions are available as Gemini cached content they are referenced by
+        name and only the battle specific instructions are sent, otherwise everything goes inline.
+        The combat engine tool is declared in the cached content or inline along with the instructions.
+        Stateless requests (cacheable questions) send neither the battle history nor its summary
+        and use temperature 0, so the answer only depends on what the response cache key covers.
+        """
+        cached_content = None
+        if self._context_cache:
+            cached_content = self._context_cache.get(GEMINI_MODEL, static_instructions(), self.instructions_digest(),
+                                                     tools=self._tools)
+        # A request using cached content cannot also set system_instruction, so the battle instructions lead the contents
+        preamble = self.get_battle_instructions(battle_state, stateless) if cached_content else None
+        history = [] if stateless else battle_state.recent_messages(self._context_builder.history_limit)
+        window = self._context_builder.build(history, content, preamble=preamble)
+        if window.budget_start_seq is not None:
+            battle_state.context_start_seq = window.budget_start_seq
+        temperature = 0 if stateless else None
+        if cached_content:
+            return window.contents, types.GenerateContentConfig(cached_content=cached_content, temperature=temperature)
+        return window.contents, types.GenerateContentConfig(
+            system_instruction=self.get_system_instructions(battle_state, stateless), tools=self._tools,
+            temperature=temperature)
+
+    def response_cache_key(self, content: str, battle_state) -> Optional[str]:
+        """
+        The response cache key of a message, None if the cache is off or the message is not cacheable.
+        """
+        if not self._response_cache:
+            return None
+        return self._response_cache.key(content, battle_state.player_army, battle_state.opponent_army,
+                                        GEMINI_MODEL, self.instructions_digest())
+
+    def call_tools(self, calls: List[types.Part], battle_state) -> types.Content:
+        """
+        Runs the function calls of a model turn and returns the turn answering them.
+        Combat engine results are added to battle_state.combat_results, saved to the battle log with the reply.
+        """
+        parts = []
+        for part in calls:
+            call = part.function_call
+            parts.append(types.Part.from_function_response(name=call.name, response=self.call_tool(call, battle_state)))
+        return types.Content(role="user", parts=parts)
+
+    def call_tool(self, call: types.FunctionCall, battle_state) -> Dict[str, Any]:
+        if call.name != combat.TOOL_NAME:
+            return {"error": f"There is no function {call.name}"}
+        try:
+            profile, result = combat.evaluate(call.args or {}, COMBAT_SIMULATION_TRIALS, COMBAT_MAX_TRIALS)
+        except combat.InvalidProfile as e:
+            log.info(f"Invalid {call.name} call {call.args}: {e}")
+            return {"error": str(e)}
+        battle_state.combat_results += (f"{profile.describe()}: {result.describe()}",)
+        return result.to_dict()
+
+    def round_request(self, contents: List[types.Content], config: types.GenerateContentConfig,
+                      calls_round: int) -> Tuple[List[types.Content], types.GenerateContentConfig]:
+        """
+        The contents and config of a round of function calls. The last round, after COMBAT_TOOL_MAX_ROUNDS rounds
+        of calls, disables function calling so the model replies with text.
+        Cached content cannot be combined with a tool config, so a last round using it is sent inline: the battle
+        instructions leading the first turn (see build_request) join the static ones as system_instruction.
+        """
+        if calls_round < COMBAT_TOOL_MAX_ROUNDS or not self._tools:
+            return contents, config
+        if not config.cached_content:
+            return contents, config.model_copy(update={"tool_config": NO_FUNCTION_CALLS})
+        preamble, *parts = contents[0].parts
+        first = types.Content(role=contents[0].role, parts=parts)
+        return [first, *contents[1:]], config.model_copy(update={
+            "cached_content": None,
+            "system_instruction": "\n".join([static_instructions(), preamble.text]),
+            "tools": self._tools,
+            "tool_config": NO_FUNCTION_CALLS,
+        })
+
+    def generate_content(self, operation: str, contents: List[types.Content], config: types.GenerateContentConfig,
+                         battle_state) -> types.GenerateContentResponse:
+        """
+        generate_content, answering the function calls of the model until it replies with text.
+        The last of the COMBAT_TOOL_MAX_ROUNDS + 1 rounds is sent with function calling disabled.
+        """
+        for calls_round in range(COMBAT_TOOL_MAX_ROUNDS + 1):
+            round_contents, round_config = self.round_request(contents, config, calls_round)
+            start = time.perf_counter()
+            response = self._client.models.generate_content(
+                model=GEMINI_MODEL,
+                contents=round_contents,
+                config=round_config,
+            )
+            record_llm_call(operation, time.perf_counter() - start, response.usage_metadata)
+            calls = function_call_parts(response)
+            if not calls or calls_round == COMBAT_TOOL_MAX_ROUNDS:
+                return response
+            contents = [*contents, response.candidates[0].content, self.call_tools(calls, battle_state)]
+
+    async def agenerate_content(self, operation: str, contents: List[types.Content], config: types.GenerateContentConfig,
+                                battle_state) -> types.GenerateContentResponse:
+        """
+        generate_content() on the asyncio Gemini client. Calculations run in a thread, simulations take up to a second.
+        """
+        for calls_round in range(COMBAT_TOOL_MAX_ROUNDS + 1):
+            round_contents, round_config = self.round_request(contents, config, calls_round)
+            start = time.perf_counter()
+            response = await self._client.aio.models.generate_content(
+                model=GEMINI_MODEL,
+                contents=round_contents,
+                config=round_config,
+            )
+            record_llm_call(operation, time.perf_counter() - start, response.usage_metadata)
+            calls = function_call_parts(response)
+            if not calls or calls_round == COMBAT_TOOL_MAX_ROUNDS:
+                return response
+            answers = await asyncio.to_thread(self.call_tools, calls, battle_state)
+            contents = [*contents, response.candidates[0].content, answers]
+
     def generate(self, content: str, battle_state: str) -> str:
         """
         Generates content using the Gemini model.
@@ -51,13 +260,172 @@ class GenClient:
         Returns:
             str: The generated content.
         """
-        log.info(f"Generating content with battle state: {battle_state}")
+        cache_key = self.response_cache_key(content, battle_state)
+        if cache_key:
+            cached = self._response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        contents, config = self.build_request(content, battle_state, stateless=cache_key is not None)
+        response = self.generate_content("generate", contents, config, battle_state)
+        log_payload(log, "generate", "Model response", response.text)
+        text = reply_text(response)
+        if cache_key:
+            self._response_cache.put(cache_key, text)
+        return text
+
+    def generate_stream(self, content: str, battle_state: str) -> Iterator[str]:
+        """
+        Streams content from the Gemini model as it is generated.
+        Args:
+            content (str): The content to generate.
+            battle_state (str): The current battle state.
+        Yields:
+            str: The text of each chunk, in order.
+        """
+        cache_key = self.response_cache_key(content, battle_state)
+        if cache_key:
+            cached = self._response_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+        contents, config = self.build_request(content, battle_state, stateless=cache_key is not None)
+        chunks = []
+        # Function calls end a round, the next one streams the reply to their results
+        for calls_round in range(COMBAT_TOOL_MAX_ROUNDS + 1):
+            round_contents, round_config = self.round_request(contents, config, calls_round)
+            start = time.perf_counter()
+            usage_metadata = None
+            text, calls = [], []
+            try:
+                stream = self._client.models.generate_content_stream(
+                    model=GEMINI_MODEL,
+                    contents=round_contents,
+                    config=round_config,
+                )
+                for chunk in stream:
+                    # Usage is reported on the last chunk
+                    usage_metadata = chunk.usage_metadata or usage_metadata
+                    calls.extend(function_call_parts(chunk))
+                    if chunk.text:
+                        text.append(chunk.text)
+                        yield chunk.text
+            finally:
+                record_llm_call("stream", time.perf_counter() - start, usage_metadata)
+            chunks.extend(text)
+            if not calls or calls_round == COMBAT_TOOL_MAX_ROUNDS:
+                break
+            contents = [*contents, model_turn(text, calls), self.call_tools(calls, battle_state)]
+        if not chunks:
+            raise EmptyReply("The model streamed no text")
+        # Only completed streams are cached, an interrupted one never gets here
+        if cache_key:
+            self._response_cache.put(cache_key, "".join(chunks))
+
+    async def agenerate(self, content: str, battle_state) -> str:
+        """
+        generate() for the ASGI app, on the asyncio Gemini client.
+        The Redis and context cache calls of the request building run in a thread.
+        """
+        cache_key = self.response_cache_key(content, battle_state)
+        if cache_key:
+            cached = await asyncio.to_thread(self._response_cache.get, cache_key)
+            if cached is not None:
+                return cached
+        contents, config = await asyncio.to_thread(self.build_request, content, battle_state, cache_key is not None)
+        response = await self.agenerate_content("generate", contents, config, battle_state)
+        log_payload(log, "generate", "Model response", response.text)
+        text = reply_text(response)
+        if cache_key:
+            await asyncio.to_thread(self._response_cache.put, cache_key, text)
+        return text
+
+    async def agenerate_stream(self, content: str, battle_state) -> AsyncIterator[str]:
+        """
+        generate_stream() for the ASGI app, on the asyncio Gemini client.
+        """
+        cache_key = self.response_cache_key(content, battle_state)
+        if cache_key:
+            cached = await asyncio.to_thread(self._response_cache.get, cache_key)
+            if cached is not None:
+                yield cached
+                return
+        contents, config = await asyncio.to_thread(self.build_request, content, battle_state, cache_key is not None)
+        chunks = []
+        for calls_round in range(COMBAT_TOOL_MAX_ROUNDS + 1):
+            round_contents, round_config = self.round_request(contents, config, calls_round)
+            start = time.perf_counter()
+            usage_metadata = None
+            text, calls = [], []
+            try:
+                stream = await self._client.aio.models.generate_content_stream(
+                    model=GEMINI_MODEL,
+                    contents=round_contents,
+                    config=round_config,
+                )
+                async for chunk in stream:
+                    usage_metadata = chunk.usage_metadata or usage_metadata
+                    calls.extend(function_call_parts(chunk))
+                    if chunk.text:
+                        text.append(chunk.text)
+                        yield chunk.text
+            finally:
+                record_llm_call("stream", time.perf_counter() - start, usage_metadata)
+            chunks.extend(text)
+            if not calls or calls_round == COMBAT_TOOL_MAX_ROUNDS:
+                break
+            answers = await asyncio.to_thread(self.call_tools, calls, battle_state)
+            contents = [*contents, model_turn(text, calls), answers]
+        if not chunks:
+            raise EmptyReply("The model streamed no text")
+        if cache_key:
+            await asyncio.to_thread(self._response_cache.put, cache_key, "".join(chunks))
+
+    def plan_opponent_turn(self, battle_state) -> str:
+        """
+        Generates the opponent's plan for its next turn, run in the background during the player's turn.
+        Args:
+            battle_state (BattleState): The battle, in the player's turn.
+        Returns:
+            str: The plan, in the model's words.
+        """
+        prompt = OPPONENT_PLAN_PROMPT.format(battle_round=battle_state.battle_round)
+        contents, config = self.build_request(prompt, battle_state)
+        response = self.generate_content("plan", contents, config, battle_state)
+        return response.text
+
+    def analyze_image(self, image_bytes: bytes, mime_type: str) -> str:
+        """
+        Describes a photo of the board with the multimodal model.
+        Args:
+            image_bytes (bytes): The image, as prepared by image_store.prepare_for_model.
+            mime_type (str): Its content type.
+        Returns:
+            str: The description.
+        """
+        start = time.perf_counter()
+        response = self._client.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=[types.Part.from_bytes(data=image_bytes, mime_type=mime_type), IMAGE_ANALYSIS_PROMPT],
+        )
+        record_llm_call("image", time.perf_counter() - start, response.usage_metadata)
+        return response.text
+
+    def summarize(self, previous_summary: Optional[str], messages: List[Tuple[str, str]]) -> str:
+        """
+        Folds older battle messages into the rolling battle summary.
+        Args:
+            previous_summary (str): The current summary, if any.
+            messages (List[Tuple[str, str]]): (creator, message) pairs to add to the summary, oldest first.
+        Returns:
+            str: The updated summary.
+        """
+        transcript = "\n".join(f"{creator}: {message}" for creator, message in messages)
+        prompt = f"Summary so far:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}\n\nUpdated summary:"
+        start = time.perf_counter()
         response = self._client.models.generate_content(
             model=GEMINI_MODEL,
-            contents=content,
-                config=types.GenerateContentConfig(
-                system_instruction=self.get_system_instructions(battle_state)
-            ),
+            contents=prompt,
+            config=types.GenerateContentConfig(system_instruction=SUMMARY_INSTRUCTIONS),
         )
-        log.info(f"Response: {response.text}")
-        return response.text
\ No newline at end of file
+        record_llm_call("summarize", time.perf_counter() - start, response.usage_metadata)
+        return response.text
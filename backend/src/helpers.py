@@ -1,10 +1,42 @@
+import base64
+import uuid
+from datetime import datetime
+from functools import wraps
+from typing import Dict, Optional, Tuple
+
 import jwt
-from flask import request, jsonify
+from flask import g, request, jsonify
 
 from backend.models.Battle import Battle
-from backend.src.parameters import JWT_SECRET, JWT_ALGORITHM
+from backend.src.parameters import (JWT_SECRET, JWT_ALGORITHM, JWT_CACHE_SIZE, JWT_NEGATIVE_CACHE_TTL,
+                                    JWT_CACHE_MAX_TTL, JWT_ERROR_LOG_INTERVAL)
+from backend.src.token_cache import INVALID, RateLimitedLog, TokenCache
 from backend.src.app import app
 
+
+token_cache = TokenCache(max_size=JWT_CACHE_SIZE, negative_ttl=JWT_NEGATIVE_CACHE_TTL, max_ttl=JWT_CACHE_MAX_TTL)
+log_jwt_error = RateLimitedLog(lambda message: app.log.error(message), interval=JWT_ERROR_LOG_INTERVAL)
+
+
+def decode_token(token: str) -> Optional[Dict]:
+    """
+    Verifies a bearer token, using the per-process cache of already verified tokens.
+    """
+    cached = token_cache.get(token)
+    if cached is INVALID:
+        return None
+    if cached is not None:
+        return cached
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except Exception as e:
+        token_cache.put_invalid(token)
+        log_jwt_error(f"JWT decode error: {e}")
+        return None
+    token_cache.put(token, payload)
+    return payload
+
+
 def get_jwt_identity():
     auth_header = request.headers.get("Authorization")
     if request.method == 'OPTIONS':
@@ -12,13 +44,8 @@ def get_jwt_identity():
     if not auth_header or not auth_header.startswith("Bearer "):
         return None
     token = auth_header.split(" ")[1]
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload  # Contains user_id, email, etc.
-    except Exception as e:
-        app.log.error(f"JWT decode error: {e}")
-        return None
-from functools import wraps
+    return decode_token(token)  # Contains user_id, email, etc.
+
 
 def jwt_required(f):
     @wraps(f)
@@ -28,9 +55,23 @@ def jwt_required(f):
         identity = get_jwt_identity()
         if not identity:
             return jsonify({"error": "Unauthorized"}), 401
+        g.identity = identity
         return f(identity, *args, **kwargs)
     return decorated_function
 
+
+def current_user_id() -> Optional[uuid.UUID]:
+    """
+    Returns the user id of the verified token of the current request, without a database lookup.
+    """
+    identity = g.get('identity')
+    if not identity or not identity.get('user_id'):
+        return None
+    try:
+        return uuid.UUID(identity['user_id'])
+    except ValueError:
+        return None
+
 def get_battle_by_id(battle_id: str) -> Battle:
     """
     Returns the battle details for a given battle ID.
@@ -41,3 +82,36 @@ def get_battle_by_id(battle_id: str) -> Battle:
     return battle.to_dict()
 
 
+def parse_bool_arg(value: Optional[str]) -> Optional[bool]:
+    """
+    Parses a boolean query string argument ('true'/'false', '1'/'0').
+    Returns None when the argument is absent, raises ValueError when it is not a boolean.
+    """
+    if value is None or value == '':
+        return None
+    lowered = value.lower()
+    if lowered in ('true', '1', 'yes'):
+        return True
+    if lowered in ('false', '0', 'no'):
+        return False
+    raise ValueError(f"Invalid boolean value: {value}")
+
+
+def encode_cursor(timestamp: datetime, battle_id: uuid.UUID) -> str:
+    """
+    Encodes the (timestamp, id) sort key of the last row in a page into an opaque cursor.
+    """
+    raw = f"{timestamp.isoformat()}|{battle_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """
+    Decodes a cursor produced by encode_cursor. Raises ValueError on malformed input.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, battle_id = base64.urlsafe_b64decode(padded).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(timestamp), uuid.UUID(battle_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
@@ -0,0 +1,88 @@
+import re
+import threading
+import time
+from typing import Dict, Tuple
+
+import requests
+from google.auth import transport
+from google.auth.transport import requests as grequests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .metrics import REGISTRY, Counter
+from .parameters import HTTP_CONNECT_TIMEOUT, HTTP_POOL_SIZE, HTTP_READ_TIMEOUT
+
+HTTP_CACHE_REQUESTS = REGISTRY.register(Counter(
+    "http_cache_requests_total", "Cached outgoing GETs (Google signing certificates) by result (hit, miss)", ("result",)))
+
+# (connect, read) seconds, for every outgoing request
+HTTP_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+_MAX_AGE = re.compile(r"(?:^|,)\s*max-age\s*=\s*(\d+)", re.IGNORECASE)
+
+
+def build_session(pool_size: int) -> requests.Session:
+    """
+    A requests Session keeping up to `pool_size` connections per host alive. Requests that
+    failed to connect are retried twice; nothing that reached the server is, an OAuth code
+    can only be exchanged once.
+    """
+    session = requests.Session()
+    retries = Retry(total=2, connect=2, read=0, status=0, other=0, backoff_factor=0.1)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retries)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def cache_lifetime(headers) -> float:
+    """
+    Seconds a response may be reused for according to its Cache-Control max-age, less its Age.
+    """
+    cache_control = headers.get("Cache-Control", "")
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return 0
+    max_age = _MAX_AGE.search(cache_control)
+    if not max_age:
+        return 0
+    try:
+        age = int(headers.get("Age", 0))
+    except ValueError:
+        age = 0
+    return max(int(max_age.group(1)) - age, 0)
+
+
+class CachingGoogleRequest(grequests.Request):
+    """
+    google-auth transport on the shared session that reuses successful GET responses for as long
+    as their Cache-Control allows. id_token.verify_oauth2_token fetches Google's signing
+    certificates (cached by Google for hours) on every call, with this only the first login
+    after they expire pays for it. Requests without a timeout get HTTP_TIMEOUT.
+    """
+
+    def __init__(self, session: requests.Session, timeout=HTTP_TIMEOUT):
+        super().__init__(session)
+        self._timeout = timeout
+        self._cache: Dict[str, Tuple[float, transport.Response]] = {}
+        self._cache_lock = threading.Lock()
+
+    def __call__(self, url, method="GET", body=None, headers=None, timeout=None, **kwargs):
+        timeout = timeout or self._timeout
+        if method != "GET" or body is not None or headers:
+            return super().__call__(url, method, body, headers, timeout, **kwargs)
+        with self._cache_lock:
+            cached = self._cache.get(url)
+        if cached and cached[0] > time.monotonic():
+            HTTP_CACHE_REQUESTS.inc(result="hit")
+            return cached[1]
+        HTTP_CACHE_REQUESTS.inc(result="miss")
+        response = super().__call__(url, method, body, headers, timeout, **kwargs)
+        lifetime = cache_lifetime(response.headers)
+        if response.status == 200 and lifetime:
+            with self._cache_lock:
+                self._cache[url] = (time.monotonic() + lifetime, response)
+        return response
+
+
+http_session = build_session(HTTP_POOL_SIZE)
+google_request = CachingGoogleRequest(http_session)
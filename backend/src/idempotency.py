@@ -0,0 +1,182 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Callable, Dict, Optional
+
+from redis import Redis, RedisError
+
+from backend.src.app import app
+from backend.src.metrics import REGISTRY, Counter
+from backend.src.parameters import IDEMPOTENCY_PENDING_TTL, IDEMPOTENCY_TTL, IDEMPOTENCY_WAIT_SECONDS
+
+log = logging.getLogger(__name__)
+
+IDEMPOTENCY_REQUESTS = REGISTRY.register(Counter(
+    "idempotency_requests_total",
+    "Chat turns sent with an Idempotency-Key by result (new, replayed, coalesced, conflict, in_progress, error)", ("result",)))
+
+PENDING = "pending"
+DONE = "done"
+# Followers re-read the record at this interval, doubling up to the maximum
+POLL_INTERVAL = 0.05
+MAX_POLL_INTERVAL = 0.5
+
+
+def request_fingerprint(*parts) -> str:
+    """
+    Digest of what makes a request the same request, a key reused with another body is rejected.
+    """
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+class IdempotentRequest:
+    """
+    One request sent with an Idempotency-Key. The first request with a key leads: it generates and
+    completes (or releases) the key. Later requests with the key get the leader's record, see IdempotencyStore.
+    """
+
+    def __init__(self, store: "IdempotencyStore", key: str, fingerprint: str, record: Optional[Dict] = None):
+        self._store = store
+        self.key = key
+        self.fingerprint = fingerprint
+        self.record = record
+
+    @property
+    def leader(self) -> bool:
+        return self.record is None
+
+    @property
+    def conflict(self) -> bool:
+        """
+        True when the key was first used for a different request.
+        """
+        return self.record is not None and self.record.get("fingerprint") != self.fingerprint
+
+    @property
+    def pending(self) -> bool:
+        return self.record is not None and self.record.get("status") == PENDING
+
+    def complete(self, status_code: int, body: Dict, headers: Optional[Dict] = None, reply: Optional[str] = None):
+        """
+        Stores the leader's response for replay. `reply` is the model's reply, replayed to event stream clients.
+        """
+        self._store.complete(self, status_code, body, headers, reply)
+
+    def release(self):
+        """
+        Gives the key up after a failure, so a retry generates again.
+        """
+        self._store.release(self)
+
+
+class IdempotencyStore:
+    """
+    Short-lived Redis store of chat turn responses by Idempotency-Key, so a client retrying a turn
+    (e.g. after a proxy timeout) neither generates nor logs it twice.
+    The first request claims the key with a 'pending' record (SET NX). Requests with the same key
+    arriving while it generates wait for its result (single-flight), later ones replay it until
+    the TTL expires. Only successful responses are stored; a failed leader releases the key and a
+    crashed one holds it for at most `pending_ttl_seconds`.
+    Keys are scoped to the user. If Redis is unavailable requests run as if they had no key.
+    """
+
+    def __init__(self, get_redis: Callable[[], Redis], ttl_seconds: int, pending_ttl_seconds: int, wait_seconds: float):
+        self._get_redis = get_redis
+        self._ttl_seconds = ttl_seconds
+        self._pending_ttl_seconds = pending_ttl_seconds
+        self.wait_seconds = wait_seconds
+
+    @staticmethod
+    def key(user_id, idempotency_key: str) -> str:
+        return f"idempotency:{user_id}:{hashlib.sha256(idempotency_key.encode('utf-8')).hexdigest()}"
+
+    def claim(self, user_id, idempotency_key: str, fingerprint: str) -> IdempotentRequest:
+        """
+        Claims the key, or returns the record of the request that did (see IdempotentRequest.leader).
+        """
+        key = self.key(user_id, idempotency_key)
+        pending = json.dumps({"status": PENDING, "fingerprint": fingerprint})
+        try:
+            redis = self._get_redis()
+            while True:
+                if redis.set(key, pending, nx=True, ex=self._pending_ttl_seconds):
+                    IDEMPOTENCY_REQUESTS.inc(result="new")
+                    return IdempotentRequest(self, key, fingerprint)
+                raw = redis.get(key)
+                if raw is not None:
+                    break
+                # Released or expired in between, claim again
+        except RedisError as e:
+            log.warning(f"Idempotency store unavailable: {e}")
+            IDEMPOTENCY_REQUESTS.inc(result="error")
+            return IdempotentRequest(self, key, fingerprint)
+        request = IdempotentRequest(self, key, fingerprint, json.loads(raw))
+        if request.conflict:
+            IDEMPOTENCY_REQUESTS.inc(result="conflict")
+        elif not request.pending:
+            IDEMPOTENCY_REQUESTS.inc(result="replayed")
+        return request
+
+    def poll(self, request: IdempotentRequest) -> bool:
+        """
+        Re-reads the record of a pending request, True once it is no longer pending.
+        A released key (failed leader) ends the wait too, the follower is told to retry.
+        """
+        try:
+            raw = self._get_redis().get(request.key)
+        except RedisError as e:
+            log.warning(f"Idempotency store unavailable: {e}")
+            return False
+        request.record = json.loads(raw) if raw is not None else {"status": PENDING, "fingerprint": request.fingerprint}
+        return raw is None or not request.pending
+
+    def _wait_result(self, request: IdempotentRequest, done: bool):
+        if done and not request.pending:
+            IDEMPOTENCY_REQUESTS.inc(result="coalesced")
+        else:
+            IDEMPOTENCY_REQUESTS.inc(result="in_progress")
+
+    def wait(self, request: IdempotentRequest):
+        """
+        Blocks until the leader of a pending request completes, fails, or wait_seconds elapse.
+        """
+        deadline = time.monotonic() + self.wait_seconds
+        interval = POLL_INTERVAL
+        done = False
+        while not done and time.monotonic() < deadline:
+            time.sleep(interval)
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+            done = self.poll(request)
+        self._wait_result(request, done)
+
+    async def wait_async(self, request: IdempotentRequest):
+        """
+        wait() without holding a thread while sleeping.
+        """
+        deadline = time.monotonic() + self.wait_seconds
+        interval = POLL_INTERVAL
+        done = False
+        while not done and time.monotonic() < deadline:
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+            done = await asyncio.to_thread(self.poll, request)
+        self._wait_result(request, done)
+
+    def complete(self, request: IdempotentRequest, status_code: int, body: Dict, headers: Optional[Dict], reply: Optional[str]):
+        record = {"status": DONE, "fingerprint": request.fingerprint, "status_code": status_code,
+                  "body": body, "headers": headers or {}, "reply": reply}
+        try:
+            self._get_redis().set(request.key, json.dumps(record, default=str), ex=self._ttl_seconds)
+        except RedisError as e:
+            log.warning(f"Failed to store idempotent response: {e}")
+
+    def release(self, request: IdempotentRequest):
+        try:
+            self._get_redis().delete(request.key)
+        except RedisError as e:
+            log.warning(f"Failed to release idempotency key: {e}")
+
+
+idempotency_store = IdempotencyStore(lambda: app.redis, IDEMPOTENCY_TTL, IDEMPOTENCY_PENDING_TTL, IDEMPOTENCY_WAIT_SECONDS)
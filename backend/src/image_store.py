@@ -0,0 +1,211 @@
+import hashlib
+import io
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime
+from typing import BinaryIO, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from backend.models.ImageUpload import ImageUpload
+from backend.src.metrics import REGISTRY, Counter
+from backend.src.parameters import (IMAGE_JPEG_QUALITY, IMAGE_MAX_DIMENSION, MAX_IMAGE_BYTES, UPLOAD_CHUNK_SIZE,
+                                    UPLOAD_DIR)
+
+try:
+    from PIL import Image, ImageOps
+except ImportError: # Optional, photos are then sent to the model as uploaded
+    Image = None
+
+log = logging.getLogger(__name__)
+
+IMAGE_UPLOADS = REGISTRY.register(Counter(
+    "image_uploads_total", "Image uploads by result (new, duplicate, cached_analysis, too_large, unsupported)", ("result",)))
+
+PENDING = "pending"
+PROCESSING = "processing"
+DONE = "done"
+FAILED = "failed"
+
+# Limit of a whole multipart upload request, the image plus room for the form fields and part headers
+MAX_UPLOAD_REQUEST_BYTES = MAX_IMAGE_BYTES + 64 * 1024
+
+# Image types the multimodal model accepts, by the leading bytes of the file
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+)
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class UnsupportedImage(ValueError):
+    pass
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """
+    The content type of an image from its first bytes, None if it is not a supported image.
+    The client's Content-Type and filename are not trusted.
+    """
+    for signature, content_type in _SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"heic", b"heix", b"mif1", b"msf1"):
+        return "image/heic"
+    return None
+
+
+def original_path(sha256: str) -> str:
+    return os.path.join(UPLOAD_DIR, "originals", sha256[:2], sha256)
+
+
+def processed_path(sha256: str) -> str:
+    return os.path.join(UPLOAD_DIR, "processed", sha256[:2], f"{sha256}.jpg")
+
+
+@dataclass
+class StoredImage:
+    sha256: str
+    size_bytes: int
+    content_type: str
+
+
+class UploadWriter:
+    """
+    Writes an upload to a temporary file chunk by chunk while hashing it, so memory use does not
+    depend on the photo size. finish() moves it to its content addressed path; a photo stored
+    before is kept and the new copy dropped.
+    """
+
+    def __init__(self, max_bytes: int = MAX_IMAGE_BYTES):
+        os.makedirs(os.path.join(UPLOAD_DIR, "tmp"), exist_ok=True)
+        self._max_bytes = max_bytes
+        self._hash = hashlib.sha256()
+        self._head = b""
+        self._size = 0
+        descriptor, self._path = tempfile.mkstemp(dir=os.path.join(UPLOAD_DIR, "tmp"))
+        self._file = os.fdopen(descriptor, "wb")
+
+    def write(self, chunk: bytes):
+        self._size += len(chunk)
+        if self._size > self._max_bytes:
+            self.abort()
+            raise UploadTooLarge(f"Images are limited to {self._max_bytes} bytes")
+        if len(self._head) < 16:
+            self._head += chunk[:16]
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    def finish(self) -> StoredImage:
+        content_type = sniff_image_type(self._head)
+        if content_type is None:
+            self.abort()
+            raise UnsupportedImage("Expected a JPEG, PNG, WebP or HEIC image")
+        self._file.close()
+        sha256 = self._hash.hexdigest()
+        path = original_path(sha256)
+        if os.path.exists(path):
+            os.unlink(self._path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self._path, path)
+        return StoredImage(sha256=sha256, size_bytes=self._size, content_type=content_type)
+
+    def abort(self):
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+
+
+def save_upload(stream: BinaryIO) -> StoredImage:
+    """
+    Stores an uploaded file stream (see UploadWriter). Raises UploadTooLarge or UnsupportedImage.
+    """
+    writer = UploadWriter()
+    try:
+        for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b""):
+            writer.write(chunk)
+    except UploadTooLarge:
+        IMAGE_UPLOADS.inc(result="too_large")
+        raise
+    except Exception:
+        writer.abort()
+        raise
+    try:
+        return writer.finish()
+    except UnsupportedImage:
+        IMAGE_UPLOADS.inc(result="unsupported")
+        raise
+
+
+def register_upload(session, user_id, stored: StoredImage, filename: Optional[str]) -> Tuple[ImageUpload, bool]:
+    """
+    Returns the user's upload of a stored image and whether it has to be analyzed. The same photo
+    uploaded again returns the existing upload (a failed one is retried); a photo already analyzed
+    for another user reuses that analysis. Commits.
+    """
+    upload = session.execute(
+        select(ImageUpload).where(ImageUpload.user_id == user_id, ImageUpload.sha256 == stored.sha256)
+    ).scalar_one_or_none()
+    if upload is not None:
+        IMAGE_UPLOADS.inc(result="duplicate")
+        if upload.status != FAILED:
+            return upload, False
+        upload.status, upload.error = PENDING, None
+        session.commit()
+        return upload, True
+
+    analysis = session.execute(
+        select(ImageUpload.analysis).where(ImageUpload.sha256 == stored.sha256, ImageUpload.status == DONE).limit(1)
+    ).scalar()
+    upload = ImageUpload(user_id=user_id, sha256=stored.sha256, filename=filename, content_type=stored.content_type,
+                         size_bytes=stored.size_bytes, status=DONE if analysis else PENDING, analysis=analysis,
+                         processed_at=datetime.now() if analysis else None)
+    session.add(upload)
+    try:
+        session.commit()
+    except IntegrityError:
+        # The same photo uploaded twice at once, the other request registered it
+        session.rollback()
+        return register_upload(session, user_id, stored, filename)
+    IMAGE_UPLOADS.inc(result="cached_analysis" if analysis else "new")
+    return upload, analysis is None
+
+
+def prepare_for_model(sha256: str, content_type: str) -> Tuple[bytes, str]:
+    """
+    The photo as sent to the model: EXIF rotated, downscaled to IMAGE_MAX_DIMENSION and recompressed
+    as JPEG, kept next to the original for retries. Sent as uploaded if Pillow is not installed or
+    cannot decode it (e.g. HEIC without a plugin).
+    """
+    path = processed_path(sha256)
+    if os.path.exists(path):
+        with open(path, "rb") as file:
+            return file.read(), "image/jpeg"
+    with open(original_path(sha256), "rb") as file:
+        original = file.read()
+    if Image is None:
+        return original, content_type
+    try:
+        with Image.open(io.BytesIO(original)) as image:
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION))
+            buffer = io.BytesIO()
+            image.convert("RGB").save(buffer, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    except Exception as e:
+        log.warning(f"Could not downscale image {sha256}, sending it as uploaded: {e}")
+        return original, content_type
+    processed = buffer.getvalue()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(processed)
+    return processed, "image/jpeg"
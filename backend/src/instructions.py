@@ -0,0 +1,255 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from google import genai
+from google.genai import types
+from redis import Redis, RedisError
+
+log = logging.getLogger(__name__)
+
+INSTRUCTIONS_DIR = os.path.join(os.path.dirname(__file__), "../instructions")
+
+
+class InstructionFile:
+    """
+    In-process cache of an instruction file. The file is only re-read when its mtime changes,
+    so the per-request cost is a single os.stat instead of an open/read of the whole file.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._mtime: Optional[float] = None
+        self._text = ""
+        self._digest = hashlib.sha256(b"").hexdigest()
+        self._missing = False
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self._path).st_mtime
+        except OSError as e:
+            if not self._missing:
+                log.error(f"Error reading {os.path.basename(self._path)}: {e}")
+            self._missing = True
+            self._mtime, self._text = None, ""
+            self._digest = hashlib.sha256(b"").hexdigest()
+            return
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            with open(self._path, "r", encoding="utf-8") as f:
+                text = f.read()
+            self._text = text
+            self._digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            self._mtime = mtime
+            self._missing = False
+            log.info(f"Loaded {os.path.basename(self._path)} ({len(text)} chars)")
+
+    @property
+    def text(self) -> str:
+        self._refresh()
+        return self._text
+
+    @property
+    def digest(self) -> str:
+        """
+        SHA-256 of the current file contents.
+        """
+        self._refresh()
+        return self._digest
+
+
+RULES = InstructionFile(os.path.join(INSTRUCTIONS_DIR, "rules.txt"))
+ORCHESTRATOR = InstructionFile(os.path.join(INSTRUCTIONS_DIR, "orchestrator.txt"))
+
+
+def static_instructions() -> str:
+    """
+    The part of the system instructions that is identical for every battle.
+    """
+    return f"{ORCHESTRATOR.text}\n\nHere are the rules for the game: {RULES.text}\n"
+
+
+def static_instructions_digest() -> str:
+    return hashlib.sha256(f"{ORCHESTRATOR.digest}:{RULES.digest}".encode("utf-8")).hexdigest()
+
+
+# Hash of the cached content of a model and instructions digest (name, expires_at), shared by every process
+CACHE_KEY = "context_cache:{}:{}"
+# Held by the process creating or refreshing the cached content
+LOCK_KEY = CACHE_KEY + ":lock"
+# Set while cached content cannot be created, e.g. the instructions are below the model's minimum size
+UNAVAILABLE_KEY = CACHE_KEY + ":unavailable"
+
+# KEYS[1] lock, ARGV[1] token of the holder. Deletes the lock only if it is still held with that token.
+_RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+@dataclass
+class _CachedContent:
+    name: str
+    digest: str
+    expires_at: float
+    checked_at: float # When it was last read from (or written to) Redis
+
+
+class ContextCache:
+    """
+    Uploads the static instructions (and the function declarations, which a request using cached content
+    cannot set itself) once per model through the Gemini cached-content API and
+    hands out the cache name so requests reference it instead of resending the text.
+    The name and expiry are kept in Redis so every web and Celery process shares one cached content:
+    a single process creates it, or refreshes it before its TTL runs out, under a lock while the others
+    reuse it. Each process keeps a copy for `local_seconds` to spare a Redis round trip per request.
+    When the instructions change a new cached content is created for their digest. The previous one is left
+    to expire rather than deleted, processes still running the previous instructions (rolling deploy) use it.
+    Returns None whenever the cache cannot be used (e.g. the text is below the model's minimum
+    cacheable size, or another process is creating it), in which case callers fall back to sending the
+    instructions inline. Without Redis each process creates and refreshes its own.
+    """
+
+    def __init__(self, client: genai.Client, ttl_seconds: int, get_redis: Optional[Callable[[], Redis]] = None,
+                 refresh_margin_seconds: int = 300, retry_seconds: int = 600, local_seconds: int = 60,
+                 lock_seconds: int = 60):
+        self._client = client
+        self._ttl_seconds = ttl_seconds
+        self._get_redis = get_redis
+        self._refresh_margin_seconds = refresh_margin_seconds
+        self._retry_seconds = retry_seconds
+        self._local_seconds = local_seconds
+        self._lock_seconds = lock_seconds
+        self._entries: Dict[str, _CachedContent] = {}
+        self._unavailable_until: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+
+    def _usable(self, entry: Optional[_CachedContent], digest: str, now: float) -> bool:
+        return (entry is not None and entry.digest == digest and now - entry.checked_at < self._local_seconds
+                and entry.expires_at - now > self._refresh_margin_seconds)
+
+    def get(self, model: str, text: str, digest: str, tools: Optional[List[types.Tool]] = None) -> Optional[str]:
+        """
+        The digest has to cover the tools as well as the text.
+        """
+        now = time.time()
+        entry = self._entries.get(model)
+        if self._usable(entry, digest, now):
+            return entry.name
+        if self._unavailable_until.get((model, digest), 0) > now:
+            return None
+        with self._lock:
+            entry = self._entries.get(model)
+            if self._usable(entry, digest, now):
+                return entry.name
+            if self._get_redis:
+                try:
+                    return self._get_shared(self._get_redis(), model, text, digest, tools, now)
+                except RedisError as e:
+                    log.warning(f"Shared context cache unavailable, using this process's own: {e}")
+            return self._get_local(entry, model, text, digest, tools, now)
+
+    def _get_local(self, entry: Optional[_CachedContent], model: str, text: str, digest: str,
+                   tools: Optional[List[types.Tool]], now: float) -> Optional[str]:
+        if entry and entry.digest == digest and entry.expires_at - now > self._refresh_margin_seconds:
+            entry.checked_at = now
+            return entry.name
+        if entry and entry.digest == digest and self._refresh(entry.name):
+            name = entry.name
+        else:
+            name = self._create(model, text, digest, tools, now)
+        return self._remember(model, name, digest, now)
+
+    def _get_shared(self, redis: Redis, model: str, text: str, digest: str, tools: Optional[List[types.Tool]],
+                    now: float) -> Optional[str]:
+        key = CACHE_KEY.format(model, digest)
+        shared = self._read(redis, key, digest, now)
+        if shared and shared.expires_at - now > self._refresh_margin_seconds:
+            self._entries[model] = shared
+            return shared.name
+        if redis.exists(UNAVAILABLE_KEY.format(model, digest)):
+            self._unavailable_until[(model, digest)] = now + self._retry_seconds
+            return None
+        token = uuid.uuid4().hex
+        lock_key = LOCK_KEY.format(model, digest)
+        if not redis.set(lock_key, token, nx=True, ex=self._lock_seconds):
+            # Another process is creating or refreshing it: use it while it lasts, or go inline meanwhile
+            return shared.name if shared and shared.expires_at > now else None
+        try:
+            # It may have been created or refreshed before the lock was taken
+            shared = self._read(redis, key, digest, now)
+            if shared and shared.expires_at - now > self._refresh_margin_seconds:
+                self._entries[model] = shared
+                return shared.name
+            if shared and self._refresh(shared.name):
+                name = shared.name
+            else:
+                name = self._create(model, text, digest, tools, now)
+            if name is None:
+                redis.set(UNAVAILABLE_KEY.format(model, digest), 1, ex=self._retry_seconds)
+                return self._remember(model, None, digest, now)
+            expires_at = now + self._ttl_seconds
+            pipe = redis.pipeline()
+            pipe.hset(key, mapping={"name": name, "expires_at": expires_at})
+            pipe.expireat(key, int(expires_at))
+            pipe.execute()
+            return self._remember(model, name, digest, now)
+        finally:
+            redis.register_script(_RELEASE_LOCK)(keys=[lock_key], args=[token])
+
+    @staticmethod
+    def _read(redis: Redis, key: str, digest: str, now: float) -> Optional[_CachedContent]:
+        shared = redis.hgetall(key)
+        if not shared:
+            return None
+        return _CachedContent(name=shared[b"name"].decode(), digest=digest,
+                              expires_at=float(shared[b"expires_at"]), checked_at=now)
+
+    def _remember(self, model: str, name: Optional[str], digest: str, now: float) -> Optional[str]:
+        if name is None:
+            self._entries.pop(model, None)
+            return None
+        self._entries[model] = _CachedContent(name=name, digest=digest, expires_at=now + self._ttl_seconds,
+                                              checked_at=now)
+        return name
+
+    def _refresh(self, name: str) -> bool:
+        try:
+            self._client.caches.update(
+                name=name,
+                config=types.UpdateCachedContentConfig(ttl=f"{self._ttl_seconds}s"),
+            )
+        except Exception as e:
+            log.warning(f"Failed to refresh cached content {name}: {e}")
+            return False
+        return True
+
+    def _create(self, model: str, text: str, digest: str, tools: Optional[List[types.Tool]],
+                now: float) -> Optional[str]:
+        try:
+            cached = self._client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    display_name=f"tabletop-trainer-{digest[:12]}",
+                    system_instruction=text,
+                    tools=tools,
+                    ttl=f"{self._ttl_seconds}s",
+                ),
+            )
+        except Exception as e:
+            log.warning(f"Context caching unavailable for {model}, sending instructions inline: {e}")
+            self._unavailable_until[(model, digest)] = now + self._retry_seconds
+            return None
+        log.info(f"Created cached content {cached.name} for {model}")
+        return cached.name
@@ -0,0 +1,40 @@
+from typing import Callable, Optional
+
+from redis import Redis
+
+from backend.src.app import app
+
+# Celery keeps job results this long (result_expires in celery_worker.py), the owner is no longer needed after
+OWNER_TTL_SECONDS = 3600
+
+
+class JobOwners:
+    """
+    The user each generation job queued with 'Prefer: respond-async' belongs to, recorded in Redis when it is
+    queued so the job status endpoint can check ownership whatever state the job is in.
+    Redis errors are not caught: without Redis no job can be queued or looked up either.
+    """
+
+    def __init__(self, get_redis: Callable[[], Redis], ttl_seconds: int):
+        self._get_redis = get_redis
+        self._ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def key(job_id) -> str:
+        return f"job:{job_id}:owner"
+
+    def record(self, job_id, user_id):
+        self._get_redis().set(self.key(job_id), str(user_id), ex=self._ttl_seconds)
+
+    def owner(self, job_id) -> Optional[str]:
+        """
+        Returns the id of the user who queued the job, None for unknown (or expired) jobs.
+        """
+        owner = self._get_redis().get(self.key(job_id))
+        return owner.decode() if owner else None
+
+    def is_owner(self, job_id, user_id) -> bool:
+        return user_id is not None and self.owner(job_id) == str(user_id)
+
+
+job_owners = JobOwners(lambda: app.redis, OWNER_TTL_SECONDS)
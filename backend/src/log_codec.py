@@ -0,0 +1,45 @@
+import gzip
+import json
+from typing import Dict, Tuple
+
+from .parameters import ARCHIVE_ZSTD_LEVEL, GZIP_LEVEL
+
+try:
+    import zstandard
+except ImportError: # Optional, archives are gzip compressed without it
+    zstandard = None
+
+ZSTD = "zstd"
+GZIP = "gzip"
+
+
+def encode_log(battle_log: Dict[str, Dict]) -> Tuple[str, bytes, int]:
+    """
+    Compresses a battle log (message number -> entry) as JSON lines, one message per line in message order.
+    Returns the codec, the compressed bytes and the uncompressed size.
+    """
+    lines = [json.dumps({"seq": int(seq), **entry}, separators=(",", ":"))
+             for seq, entry in sorted(battle_log.items(), key=lambda item: int(item[0]))]
+    raw = "\n".join(lines).encode("utf-8")
+    if zstandard is not None:
+        return ZSTD, zstandard.ZstdCompressor(level=ARCHIVE_ZSTD_LEVEL).compress(raw), len(raw)
+    return GZIP, gzip.compress(raw, compresslevel=GZIP_LEVEL), len(raw)
+
+
+def decode_log(codec: str, payload: bytes) -> Dict[str, Dict]:
+    """
+    The battle log of an encode_log payload.
+    """
+    if codec == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Battle log archived with zstd, install the 'zstandard' package to read it")
+        raw = zstandard.ZstdDecompressor().decompress(payload)
+    elif codec == GZIP:
+        raw = gzip.decompress(payload)
+    else:
+        raise ValueError(f"Unknown battle log codec: {codec}")
+    battle_log = {}
+    for line in raw.decode("utf-8").splitlines():
+        entry = json.loads(line)
+        battle_log[str(entry.pop("seq"))] = entry
+    return battle_log
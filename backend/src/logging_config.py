@@ -0,0 +1,160 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Dict, List, Optional
+
+from .parameters import (LOG_BACKUP_COUNT, LOG_FILE, LOG_FORMAT, LOG_LEVEL, LOG_MAX_BYTES, LOG_PAYLOAD_MAX_CHARS,
+                         LOG_PAYLOAD_SAMPLE_RATE, LOG_PAYLOAD_SAMPLE_RATES, LOG_PAYLOADS)
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+
+# Attributes every LogRecord has, anything else on a record was passed with extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger, message, the record's extra fields and the traceback.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Like QueueHandler.prepare, but leaves formatting to the listener's handlers and keeps the
+        # traceback out of the message, so JsonFormatter can put it in its own field
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def build_handlers(log_format: str = LOG_FORMAT, filename: Optional[str] = LOG_FILE,
+                   max_bytes: int = LOG_MAX_BYTES, backup_count: int = LOG_BACKUP_COUNT) -> List[logging.Handler]:
+    """
+    The handlers that do the writing, on the listener thread: stderr and, if set, a size rotated file.
+    """
+    formatter = JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if filename:
+        handlers.append(RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count,
+                                            encoding="utf-8", delay=True))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def configure_logging(level: str = LOG_LEVEL, handlers: Optional[List[logging.Handler]] = None) -> QueueListener:
+    """
+    Routes every logger through the root logger into a queue, which a background thread drains into
+    `handlers` (see build_handlers). Logging calls then only pay for building the record, file and
+    console writes happen off the request thread. Safe to call more than once, later calls are no-ops.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return _listener
+    log_queue = queue.SimpleQueue()
+    _queue_handler = _QueueHandler(log_queue)
+    root = logging.getLogger()
+    # Handlers installed by an earlier logging.basicConfig would write every line a second time
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    _listener = QueueListener(log_queue, *(handlers if handlers is not None else build_handlers()),
+                              respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """
+    Writes out the queued records and stops the listener thread, records logged afterwards are dropped.
+    """
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener = None
+
+
+def _restart_after_fork():
+    # Forked children (Celery pool, preloaded Gunicorn workers) don't inherit the listener thread,
+    # and the parent's queue may have been locked mid-operation. Start over with a fresh queue.
+    global _listener
+    if _listener is None:
+        return
+    handlers = _listener.handlers
+    _queue_handler.queue = queue.SimpleQueue()
+    _listener = QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """
+    'create_battle=0.1,generate=0' -> {'create_battle': 0.1, 'generate': 0.0}
+    """
+    rates = {}
+    for item in spec.split(","):
+        route, _, rate = item.partition("=")
+        if route.strip() and rate.strip():
+            rates[route.strip()] = float(rate)
+    return rates
+
+
+_SAMPLE_RATES = parse_sample_rates(LOG_PAYLOAD_SAMPLE_RATES)
+
+
+def payload_sample_rate(route: str) -> float:
+    return 1.0 if LOG_PAYLOADS else _SAMPLE_RATES.get(route, LOG_PAYLOAD_SAMPLE_RATE)
+
+
+def log_payload(logger: logging.Logger, route: str, label: str, payload: Any):
+    """
+    Logs a request body or model response of `route`: every one with LOG_PAYLOADS, otherwise a sample
+    (see LOG_PAYLOAD_SAMPLE_RATE) cut to LOG_PAYLOAD_MAX_CHARS. The payload is only serialized when logged.
+    """
+    rate = payload_sample_rate(route)
+    if rate <= 0 or (rate < 1 and random.random() >= rate) or not logger.isEnabledFor(logging.INFO):
+        return
+    text = payload if isinstance(payload, str) else json.dumps(payload, default=str, ensure_ascii=False)
+    size = len(text)
+    if not LOG_PAYLOADS and size > LOG_PAYLOAD_MAX_CHARS:
+        text = f"{text[:LOG_PAYLOAD_MAX_CHARS]}... ({size - LOG_PAYLOAD_MAX_CHARS} more characters)"
+    logger.info(f"{label}: {text}", extra={"route": route, "payload_chars": size})
@@ -0,0 +1,222 @@
+import bisect
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from flask import g, has_request_context
+from flask.json.provider import DefaultJSONProvider
+
+# Seconds, tuned for API routes whose slowest path is a multi-second model call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] += amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.labelnames), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # key -> ([count per bucket], sum, count)
+        self._values: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (bucket_counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class GaugeCollector:
+    """
+    Gauges read at scrape time from a callback returning {name: value}, e.g. pool statistics.
+    """
+
+    def __init__(self, prefix: str, documentation: str, collect: Callable[[], Dict[str, float]]):
+        self.prefix = prefix
+        self.documentation = documentation
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        try:
+            values = self.collect()
+        except Exception as e:
+            return [f"# {self.prefix} unavailable: {_escape(e)}"]
+        lines = []
+        for name, value in sorted(values.items()):
+            metric = f"{self.prefix}_{name}"
+            lines += [f"# HELP {metric} {self.documentation}", f"# TYPE {metric} gauge", f"{metric} {_format_value(value)}"]
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Time to produce the response (time to first byte for streams)",
+    ("method", "route", "status")))
+REQUEST_DB_TIME = REGISTRY.register(Histogram(
+    "http_request_db_seconds", "Time spent in database queries per request", ("route",)))
+REQUEST_LLM_TIME = REGISTRY.register(Histogram(
+    "http_request_llm_seconds", "Time spent waiting on Gemini per request", ("route",)))
+REQUEST_SERIALIZATION_TIME = REGISTRY.register(Histogram(
+    "http_request_serialization_seconds", "Time spent encoding JSON per request", ("route",)))
+LLM_LATENCY = REGISTRY.register(Histogram(
+    "llm_request_duration_seconds", "Duration of Gemini calls", ("operation",)))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "llm_tokens_total", "Tokens reported by Gemini usage metadata", ("operation", "kind")))
+
+
+# Per-request time breakdown of the ASGI app, which has no flask request context
+REQUEST_TIMINGS: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def add_request_time(kind: str, seconds: float):
+    """
+    Adds to the per-request time breakdown ('db', 'llm', 'serialization') when inside a request.
+    """
+    if has_request_context():
+        timings = g.setdefault("timings", defaultdict(float))
+    else:
+        timings = REQUEST_TIMINGS.get()
+        if timings is None:
+            return
+    timings[kind] += seconds
+
+
+def record_llm_call(operation: str, seconds: float, usage_metadata=None):
+    LLM_LATENCY.observe(seconds, operation=operation)
+    add_request_time("llm", seconds)
+    if usage_metadata is None:
+        return
+    for kind, attribute in (("prompt", "prompt_token_count"), ("candidates", "candidates_token_count"),
+                            ("cached", "cached_content_token_count"), ("total", "total_token_count")):
+        count = getattr(usage_metadata, attribute, None)
+        if count:
+            LLM_TOKENS.inc(count, operation=operation, kind=kind)
+
+
+def observe_request(method: str, route: str, status: int, seconds: float, timings: Optional[Dict[str, float]]):
+    REQUEST_LATENCY.observe(seconds, method=method, route=route, status=status)
+    timings = timings or {}
+    REQUEST_DB_TIME.observe(timings.get("db", 0.0), route=route)
+    REQUEST_SERIALIZATION_TIME.observe(timings.get("serialization", 0.0), route=route)
+    if "llm" in timings:
+        REQUEST_LLM_TIME.observe(timings["llm"], route=route)
+
+
+def instrument_engine_events(engine_class):
+    """
+    Times every cursor execution of the given Engine (or the Engine class) into the request breakdown,
+    failed ones included. The start time is kept on the execution context, which lives as long as the statement.
+    """
+    from sqlalchemy import event
+
+    def record_query_time(context):
+        start = getattr(context, "_query_start", None)
+        if start is not None:
+            context._query_start = None
+            add_request_time("db", time.perf_counter() - start)
+
+    @event.listens_for(engine_class, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_start = time.perf_counter()
+
+    @event.listens_for(engine_class, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        record_query_time(context)
+
+    @event.listens_for(engine_class, "handle_error")
+    def _handle_error(exception_context):
+        # after_cursor_execute does not run for a statement that fails
+        record_query_time(exception_context.execution_context)
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that adds encoding time to the request breakdown.
+    """
+
+    def dumps(self, obj, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            add_request_time("serialization", time.perf_counter() - start)
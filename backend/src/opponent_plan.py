@@ -0,0 +1,90 @@
+import json
+import logging
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from redis import Redis, RedisError
+
+from backend.src.app import app
+from backend.src.metrics import REGISTRY, Counter
+from backend.src.parameters import PREFETCH_PLAN_TTL
+
+log = logging.getLogger(__name__)
+
+OPPONENT_PLAN_REQUESTS = REGISTRY.register(Counter(
+    "opponent_plan_requests_total", "Prefetched opponent plan lookups by result (hit, pending, miss, error)", ("result",)))
+
+PENDING = b"pending"
+# A prefetch that crashed without releasing its claim blocks a new one for at most this long
+PENDING_TTL_SECONDS = 300
+
+
+class PlanCache:
+    """
+    Redis cache of the opponent plans generated in the background during the player's turn, one per
+    battle and round. Starting the generation claims the key with a 'pending' marker (SET NX), so
+    repeated turn updates queue a single task.
+    Redis errors are logged, a battle then simply plays without a prefetched plan.
+    """
+
+    def __init__(self, get_redis: Callable[[], Redis], ttl_seconds: int):
+        self._get_redis = get_redis
+        self._ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def key(battle_id, battle_round) -> str:
+        return f"battle:{battle_id}:plan:{battle_round}"
+
+    def claim(self, battle_id, battle_round) -> bool:
+        """
+        Marks the plan as being generated. False if it already is, or is done.
+        """
+        try:
+            return bool(self._get_redis().set(self.key(battle_id, battle_round), PENDING, nx=True, ex=PENDING_TTL_SECONDS))
+        except RedisError as e:
+            log.warning(f"Opponent plan cache unavailable: {e}")
+            return False
+
+    def release(self, battle_id, battle_round):
+        """
+        Drops the claim of a generation that failed, so the next turn update can retry.
+        """
+        try:
+            redis = self._get_redis()
+            key = self.key(battle_id, battle_round)
+            if redis.get(key) == PENDING:
+                redis.delete(key)
+        except RedisError as e:
+            log.warning(f"Failed to release opponent plan claim: {e}")
+
+    def put(self, battle_id, battle_round, plan: str, message_seq: int):
+        """
+        Stores a generated plan. `message_seq` is the battle's message count when it was made.
+        """
+        value = json.dumps({"plan": plan, "message_seq": message_seq, "created_at": datetime.now().isoformat()})
+        try:
+            self._get_redis().set(self.key(battle_id, battle_round), value, ex=self._ttl_seconds)
+        except RedisError as e:
+            log.warning(f"Failed to cache opponent plan: {e}")
+
+    def get(self, battle_id, battle_round) -> Optional[Dict]:
+        """
+        Returns {'status': 'ready', 'plan': ..., ...}, {'status': 'pending'} or None if no plan was started.
+        """
+        try:
+            raw = self._get_redis().get(self.key(battle_id, battle_round))
+        except RedisError as e:
+            log.warning(f"Opponent plan cache unavailable: {e}")
+            OPPONENT_PLAN_REQUESTS.inc(result="error")
+            return None
+        if raw is None:
+            OPPONENT_PLAN_REQUESTS.inc(result="miss")
+            return None
+        if raw == PENDING:
+            OPPONENT_PLAN_REQUESTS.inc(result="pending")
+            return {"status": "pending"}
+        OPPONENT_PLAN_REQUESTS.inc(result="hit")
+        return {"status": "ready", **json.loads(raw)}
+
+
+plan_cache = PlanCache(lambda: app.redis, PREFETCH_PLAN_TTL)
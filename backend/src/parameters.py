@@ -3,4 +3,136 @@ import os
 
 JWT_SECRET = os.environ.get("JWT_SECRET")  # Set this in your env!
 GOOGLEAI_API_KEY = os.environ.get("GOOGLEAI_API_KEY")  # Set this in your env!
-JWT_ALGORITHM = "HS256"
\ No newline at end of file
+JWT_ALGORITHM = "HS256"
+LOG_PAYLOADS = os.environ.get("LOG_PAYLOADS", "false").lower() == "true" # Log request bodies and model responses (debugging only)
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN") # If set, /api/metrics requires 'Authorization: Bearer <METRICS_TOKEN>'
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0") # Celery broker/backend and app caches
+
+# Battle listing pagination
+DEFAULT_BATTLE_PAGE_SIZE = int(os.environ.get("DEFAULT_BATTLE_PAGE_SIZE", 50))
+MAX_BATTLE_PAGE_SIZE = int(os.environ.get("MAX_BATTLE_PAGE_SIZE", 200))
+
+# Gemini context caching of the static instructions (rules + orchestrator)
+CONTEXT_CACHE_ENABLED = os.environ.get("CONTEXT_CACHE_ENABLED", "true").lower() == "true"
+CONTEXT_CACHE_TTL_SECONDS = int(os.environ.get("CONTEXT_CACHE_TTL_SECONDS", 3600))
+
+# Opt-in Redis cache of answers to stateless questions (rules lookups), see response_cache.py
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", 7 * 24 * 3600)) # Seconds
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 10000))
+RESPONSE_CACHE_CLASSIFIER = os.environ.get("RESPONSE_CACHE_CLASSIFIER") # 'module:function' taking the message, returning bool
+
+# Conversation context sent to the model: the most recent messages within a token budget,
+# older messages are folded into a rolling summary once enough of them fall out of the window
+# (they are still sent until the summary covers them)
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 8000))
+CONTEXT_MAX_MESSAGES = int(os.environ.get("CONTEXT_MAX_MESSAGES", 40))
+SUMMARY_MIN_MESSAGES = int(os.environ.get("SUMMARY_MIN_MESSAGES", 20))
+
+# Model calls: 'inline' generates in the web worker, 'celery' hands generation to the worker and
+# returns a job id to poll (clients can also opt in per request with 'Prefer: respond-async')
+GENERATION_MODE = os.environ.get("GENERATION_MODE", "inline")
+GENERATION_CONCURRENCY = int(os.environ.get("GENERATION_CONCURRENCY", 4)) # Per web worker process
+GENERATION_QUEUE_TIMEOUT = float(os.environ.get("GENERATION_QUEUE_TIMEOUT", 10))
+ASYNC_GENERATION_CONCURRENCY = int(os.environ.get("ASYNC_GENERATION_CONCURRENCY", 256)) # Per ASGI worker process, see asgi.py
+
+# Admission control of chat turns across all processes, see admission.py: a token bucket per user (429 when empty)
+# and a deployment wide cap on model calls, turns waiting for one are served fairly across users (503 after
+# GENERATION_QUEUE_TIMEOUT or when ADMISSION_MAX_QUEUE turns are already waiting)
+ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_RATE = float(os.environ.get("ADMISSION_RATE", 0.2)) # Chat turns per second per user, refilled continuously
+ADMISSION_BURST = int(os.environ.get("ADMISSION_BURST", 10)) # Turns a user can send at once
+ADMISSION_CONCURRENCY = int(os.environ.get("ADMISSION_CONCURRENCY", 32)) # Model calls at once across all processes
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", 256))
+ADMISSION_LEASE_SECONDS = int(os.environ.get("ADMISSION_LEASE_SECONDS", 300)) # Frees the slot of a crashed worker
+
+# Response compression, only bodies of at least COMPRESSION_MIN_BYTES are compressed (brotli if installed, else gzip)
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", 1024)) # 0 compresses everything
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", 5)) # 11 is too slow for per-request compression
+
+# Redis cache of battle state (armies, summary and messages) read by chat turns and the battle endpoint
+BATTLE_CACHE_ENABLED = os.environ.get("BATTLE_CACHE_ENABLED", "true").lower() == "true"
+BATTLE_CACHE_TTL = int(os.environ.get("BATTLE_CACHE_TTL", 3600)) # Seconds
+# Newest messages a cached battle keeps, at least what a chat turn may send (the context window and the messages
+# awaiting a summary); responses with the whole log read the older ones from battle_messages
+BATTLE_CACHE_MESSAGES = int(os.environ.get("BATTLE_CACHE_MESSAGES", CONTEXT_MAX_MESSAGES + 2 * SUMMARY_MIN_MESSAGES))
+
+# Speculative opponent planning: when the player's turn starts a Celery task pre-generates the opponent's
+# plan for its next turn, used as context (and returned) once the player ends their turn, see opponent_plan.py
+PREFETCH_ENABLED = os.environ.get("PREFETCH_ENABLED", "false").lower() == "true"
+PREFETCH_PLAN_TTL = int(os.environ.get("PREFETCH_PLAN_TTL", 7200)) # Seconds
+
+# Chat turns sent with an 'Idempotency-Key' header: retries wait for or replay the first response, see idempotency.py
+IDEMPOTENCY_TTL = int(os.environ.get("IDEMPOTENCY_TTL", 3600)) # Seconds a completed response is replayed
+IDEMPOTENCY_PENDING_TTL = int(os.environ.get("IDEMPOTENCY_PENDING_TTL", 300)) # Longest a crashed request blocks its key
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get("IDEMPOTENCY_WAIT_SECONDS", 55)) # Retries wait this long, then get 409
+
+# Cold storage: the messages of archived battles and of battles inactive for ARCHIVE_INACTIVE_DAYS are compressed
+# into battle_archives by a periodic task (or `flask archive-battles`) and restored when the battle is next loaded
+ARCHIVE_INACTIVE_DAYS = int(os.environ.get("ARCHIVE_INACTIVE_DAYS", 30)) # Also how long a restored battle stays hot
+ARCHIVE_INTERVAL = float(os.environ.get("ARCHIVE_INTERVAL", 3600)) # Seconds between archival runs
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", 200)) # Battles per run
+ARCHIVE_ZSTD_LEVEL = int(os.environ.get("ARCHIVE_ZSTD_LEVEL", 10)) # If zstandard is installed, gzip (GZIP_LEVEL) otherwise
+
+# Board photo uploads: streamed to UPLOAD_DIR, deduplicated by content hash and analyzed by a Celery task, see image_store.py
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "/tmp/tabletop_trainer/uploads") # Shared by the web and worker processes
+MAX_IMAGE_BYTES = int(os.environ.get("MAX_IMAGE_BYTES", 20 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 64 * 1024))
+IMAGE_MAX_DIMENSION = int(os.environ.get("IMAGE_MAX_DIMENSION", 1536)) # Longest side sent to the model, in pixels (needs Pillow)
+IMAGE_JPEG_QUALITY = int(os.environ.get("IMAGE_JPEG_QUALITY", 85))
+
+# Application logs: records are handed to a background thread through a queue, see logging_config.py
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower() # 'json' (one object per line) or 'text'
+# Empty to log to stderr only. Several processes appending to one file rotate it independently, so give each
+# its own LOG_FILE or rely on stderr when running more than one worker.
+LOG_FILE = os.environ.get("LOG_FILE", "app.log")
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", 20 * 1024 * 1024)) # Size at which LOG_FILE is rotated
+LOG_BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", 5))
+# Request bodies and model responses: all of them with LOG_PAYLOADS, otherwise this fraction of them,
+# overridable per route, e.g. 'create_battle=0.1,generate=0'. Each is cut to LOG_PAYLOAD_MAX_CHARS.
+LOG_PAYLOAD_SAMPLE_RATE = float(os.environ.get("LOG_PAYLOAD_SAMPLE_RATE", 0))
+LOG_PAYLOAD_SAMPLE_RATES = os.environ.get("LOG_PAYLOAD_SAMPLE_RATES", "")
+LOG_PAYLOAD_MAX_CHARS = int(os.environ.get("LOG_PAYLOAD_MAX_CHARS", 2000))
+
+# Combat engine: the model calls it through function calling for hit/wound/save/damage odds, see combat.py
+COMBAT_TOOL_ENABLED = os.environ.get("COMBAT_TOOL_ENABLED", "true").lower() == "true"
+COMBAT_TOOL_MAX_ROUNDS = int(os.environ.get("COMBAT_TOOL_MAX_ROUNDS", 3)) # Model calls answered with results per reply
+COMBAT_SIMULATION_TRIALS = int(os.environ.get("COMBAT_SIMULATION_TRIALS", 100000)) # When the model asks for a simulation
+COMBAT_MAX_TRIALS = int(os.environ.get("COMBAT_MAX_TRIALS", 1000000)) # ~1s of CPU for a 20 attack profile
+
+# Interaction logging: rows are buffered in Redis and bulk inserted by the Celery worker
+INTERACTION_FLUSH_SIZE = int(os.environ.get("INTERACTION_FLUSH_SIZE", 500)) # Rows per INSERT, also triggers an early flush
+INTERACTION_FLUSH_INTERVAL = float(os.environ.get("INTERACTION_FLUSH_INTERVAL", 5)) # Seconds between periodic flushes
+INTERACTION_FLUSH_RETRIES = int(os.environ.get("INTERACTION_FLUSH_RETRIES", 3))
+
+# Per-process cache of verified JWTs
+JWT_CACHE_SIZE = int(os.environ.get("JWT_CACHE_SIZE", 10000))
+JWT_CACHE_MAX_TTL = float(os.environ.get("JWT_CACHE_MAX_TTL", 3600)) # Seconds, tokens are also evicted at their exp
+JWT_NEGATIVE_CACHE_TTL = float(os.environ.get("JWT_NEGATIVE_CACHE_TTL", 60))
+JWT_ERROR_LOG_INTERVAL = float(os.environ.get("JWT_ERROR_LOG_INTERVAL", 10)) # At most one JWT error log line per interval
+
+# Outgoing HTTP (Google OAuth token exchange and signing certificates), one keep-alive session per process
+GOOGLE_TOKEN_URL = os.environ.get("GOOGLE_TOKEN_URL", "https://oauth2.googleapis.com/token") # Point tests at a local stand-in
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 3.05))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", 10))
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 10)) # Kept-alive connections per host
+
+# Database connection pool, per process role ('web' for Flask/Gunicorn, 'worker' for Celery).
+# Every setting can be overridden for one role with a WEB_ or WORKER_ prefix, e.g. WORKER_DB_POOL_SIZE=2
+PROCESS_ROLE = os.environ.get("PROCESS_ROLE", "web")
+
+
+def _role_env(name: str, default):
+    return os.environ.get(f"{PROCESS_ROLE.upper()}_{name}", os.environ.get(name, default))
+
+
+DB_POOL_SIZE = int(_role_env("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(_role_env("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(_role_env("DB_POOL_TIMEOUT", 10)) # Seconds to wait for a free connection
+DB_POOL_RECYCLE = int(_role_env("DB_POOL_RECYCLE", 1800)) # Seconds before a connection is replaced
+DB_POOL_PRE_PING = _role_env("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_TIMEOUT_MS = int(_role_env("DB_STATEMENT_TIMEOUT_MS", 30000)) # 0 disables
+# Behind PgBouncer: no client side pool (NullPool), PgBouncer does the pooling
+DB_PGBOUNCER = _role_env("DB_PGBOUNCER", "false").lower() == "true"
@@ -0,0 +1,132 @@
+import hashlib
+import importlib
+import json
+import logging
+import re
+import time
+from typing import Callable, Optional
+
+from redis import Redis, RedisError
+
+from .metrics import REGISTRY, Counter
+
+log = logging.getLogger(__name__)
+
+RESPONSE_CACHE_REQUESTS = REGISTRY.register(Counter(
+    "response_cache_requests_total", "Prompt-response cache lookups by result (hit, miss, bypass, error)", ("result",)))
+
+# Sorted set of cached keys scored by last access time, used for LRU eviction
+LRU_KEY = "response_cache:lru"
+
+_QUESTION_START = re.compile(r"^(what|how|does|do|can|is|are|when|which|explain|define|describe)\b")
+_RULES_TERMS = re.compile(
+    r"\b(rule|rules|stratagem|stratagems|ability|abilities|keyword|keywords|cover|phase|datasheet|"
+    r"detachment|enhancement|leader|transport|aura|mortal wounds?|invulnerable|feel no pain|"
+    r"deep strike|overwatch|battle-?shock|objective control|line of sight|engagement range)\b")
+# References to the game in progress make the answer depend on the battle history
+_STATEFUL_TERMS = re.compile(
+    r"\b(i|i'm|i've|my|mine|me|we|our|us|you|your|yours|this turn|last turn|next turn|now|"
+    r"roll|rolled|move|moved|moving|charge|charged|shoot|shot|deploy|deployed|score|scored)\b")
+
+
+def normalize_prompt(text: str) -> str:
+    """
+    Lowercases and collapses whitespace and trailing punctuation, so trivially different
+    phrasings of the same question share a cache entry.
+    """
+    return re.sub(r"\s+", " ", text).strip().rstrip("?!. ").lower()
+
+
+def is_rules_question(message: str) -> bool:
+    """
+    Default classifier: a question about the rules that does not refer to the game in progress.
+    """
+    prompt = normalize_prompt(message)
+    if not prompt or len(prompt) > 300:
+        return False
+    return bool(_QUESTION_START.match(prompt) and _RULES_TERMS.search(prompt) and not _STATEFUL_TERMS.search(prompt))
+
+
+def load_classifier(path: str) -> Callable[[str], bool]:
+    """
+    Imports a classifier given as 'package.module:function'.
+    """
+    module_name, _, attribute = path.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def faction(army) -> str:
+    """
+    The part of an army that matters for rules answers, the faction if the army details have one.
+    """
+    if isinstance(army, str):
+        try:
+            army = json.loads(army)
+        except ValueError:
+            return army.strip().lower()
+    if isinstance(army, dict) and army.get("faction"):
+        return str(army["faction"]).strip().lower()
+    return json.dumps(army, sort_keys=True)
+
+
+class ResponseCache:
+    """
+    Redis cache of model answers to stateless questions (e.g. rules lookups), keyed by the
+    normalized prompt, the faction pair, the model and the digest of the static instructions, so
+    a rules or model change never serves an old answer. Entries expire after the TTL and the least
+    recently used ones are evicted past max_entries. Redis is shared with Celery, so eviction is
+    done here instead of relying on a maxmemory policy.
+    Which messages are cacheable is decided by the classifier, every other message bypasses the cache.
+    """
+
+    def __init__(self, get_redis: Callable[[], Redis], ttl_seconds: int, max_entries: int,
+                 classifier: Callable[[str], bool] = is_rules_question):
+        self._get_redis = get_redis
+        self._ttl_seconds = ttl_seconds
+        self._max_entries = max_entries
+        self.classifier = classifier
+
+    def key(self, message: str, player_army, opponent_army, model: str, instructions_digest: str) -> Optional[str]:
+        """
+        Returns the cache key of a message, or None when the classifier says it is not cacheable.
+        """
+        try:
+            cacheable = self.classifier(message)
+        except Exception as e:
+            log.warning(f"Response cache classifier failed, bypassing the cache: {e}")
+            cacheable = False
+        if not cacheable:
+            RESPONSE_CACHE_REQUESTS.inc(result="bypass")
+            return None
+        parts = [normalize_prompt(message), faction(player_army), faction(opponent_army), model, instructions_digest]
+        return "response_cache:" + hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        redis = self._get_redis()
+        try:
+            cached = redis.get(key)
+            if cached is not None:
+                redis.zadd(LRU_KEY, {key: time.time()})
+        except RedisError as e:
+            log.warning(f"Response cache unavailable: {e}")
+            RESPONSE_CACHE_REQUESTS.inc(result="error")
+            return None
+        RESPONSE_CACHE_REQUESTS.inc(result="hit" if cached is not None else "miss")
+        return cached.decode("utf-8") if cached is not None else None
+
+    def put(self, key: str, response: str):
+        if not response:
+            return
+        redis = self._get_redis()
+        try:
+            pipe = redis.pipeline(transaction=False)
+            pipe.set(key, response, ex=self._ttl_seconds)
+            pipe.zadd(LRU_KEY, {key: time.time()})
+            pipe.zcard(LRU_KEY)
+            size = pipe.execute()[-1]
+            if size > self._max_entries:
+                evicted = [member for member, _ in redis.zpopmin(LRU_KEY, size - self._max_entries)]
+                if evicted:
+                    redis.delete(*evicted)
+        except RedisError as e:
+            log.warning(f"Failed to cache response: {e}")
@@ -0,0 +1,204 @@
+import json
+import re
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+
+PLAYER = "player"
+OPPONENT = "opponent"
+
+_POINTS_LINE = re.compile(r"^(.*?)\s*\((\d+)\s*(?:points|pts)\)$", re.IGNORECASE)
+_SECTION_HEADER = re.compile(r"^[A-Z\s]+$")
+_COUNTED = re.compile(r"^(\d+)\s*x\s+(.+)$")
+_ENHANCEMENT = re.compile(r"^enhancements?:\s*(.+)$", re.IGNORECASE)
+# Bullets of the official app export, '•' for models (or wargear of single model units), '◦' for their wargear
+_MODEL_BULLET = "•"
+_WARGEAR_BULLET = "◦"
+_BULLETS = "•◦-*"
+
+# Keyword implied by the section a unit is listed under
+SECTION_KEYWORDS = {
+    "CHARACTERS": "Character",
+    "CHARACTER": "Character",
+    "EPIC HERO": "Epic Hero",
+    "EPIC HEROES": "Epic Hero",
+    "BATTLELINE": "Battleline",
+    "DEDICATED TRANSPORTS": "Dedicated Transport",
+    "ALLIED UNITS": "Allied",
+    "FORTIFICATIONS": "Fortification",
+}
+
+
+@dataclass
+class ParsedUnit:
+    name: str
+    points: Optional[int] = None
+    models: int = 1
+    wargear: List[str] = field(default_factory=list)
+    keywords: List[str] = field(default_factory=list)
+    enhancement: Optional[str] = None
+
+
+@dataclass
+class ParsedRoster:
+    army_name: Optional[str] = None
+    points: Optional[int] = None
+    faction: Optional[str] = None
+    detachment: Optional[str] = None
+    units: List[ParsedUnit] = field(default_factory=list)
+    # Free-form details that did not parse, kept so nothing the player entered is lost from the prompt
+    notes: Optional[str] = None
+
+
+def _int(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _strip_bullet(line: str) -> str:
+    return line.lstrip(_BULLETS).strip()
+
+
+def _add_wargear(wargear: "OrderedDict[str, int]", line: str):
+    counted = _COUNTED.match(line)
+    count, name = (int(counted.group(1)), counted.group(2).strip()) if counted else (1, line)
+    wargear[name] = wargear.get(name, 0) + count
+
+
+def parse_unit(block: str, section: Optional[str] = None) -> Optional[ParsedUnit]:
+    """
+    Parses one unit block of an army list export, e.g.
+        Intercessor Squad (80 points)
+        • 1x Intercessor Sergeant
+        ◦ 1x Bolt rifle
+        • 4x Intercessor
+        ◦ 4x Bolt rifle
+    A '•' entry followed by '◦' entries is a model line, otherwise it is wargear (characters list it directly).
+    """
+    lines = [line.strip() for line in block.strip().splitlines() if line.strip()]
+    if not lines:
+        return None
+    header = _POINTS_LINE.match(lines[0])
+    unit = ParsedUnit(name=header.group(1).strip() if header else lines[0],
+                      points=int(header.group(2)) if header else None)
+    keyword = SECTION_KEYWORDS.get((section or "").strip().upper())
+    if keyword:
+        unit.keywords.append(keyword)
+    wargear = OrderedDict()
+    model_count = 0
+    for index, line in enumerate(lines[1:], start=1):
+        text = _strip_bullet(line)
+        enhancement = _ENHANCEMENT.match(text)
+        if enhancement:
+            unit.enhancement = enhancement.group(1).strip()
+        elif text.lower() == "warlord":
+            unit.keywords.append("Warlord")
+        elif line.startswith(_MODEL_BULLET) and index + 1 < len(lines) and lines[index + 1].startswith(_WARGEAR_BULLET):
+            counted = _COUNTED.match(text)
+            model_count += int(counted.group(1)) if counted else 1
+        elif text:
+            _add_wargear(wargear, text)
+    unit.models = model_count or 1
+    unit.wargear = [f"{count}x {name}" if count > 1 else name for name, count in wargear.items()]
+    return unit
+
+
+def parse_army_text(text: str) -> Optional[ParsedRoster]:
+    """
+    Parses an army list exported from the official app, the same format as frontend/src/modules/army-list-parser.ts:
+    army name and points, faction, game size, detachment, then units under section headers.
+    Returns None when the text is not in that format.
+    """
+    lines = [line.strip() for line in text.strip().splitlines() if line.strip()]
+    if len(lines) < 3:
+        return None
+    header = _POINTS_LINE.match(lines[0])
+    if not header:
+        return None
+    roster = ParsedRoster(army_name=header.group(1).strip(), points=int(header.group(2)))
+    game_size = next((index for index in range(1, len(lines)) if _POINTS_LINE.match(lines[index])), None)
+    if game_size is None:
+        return None
+    roster.faction = lines[game_size - 1] if game_size > 1 else None
+    start = game_size + 1
+    if start < len(lines) and not _SECTION_HEADER.match(lines[start]) and not lines[start].startswith("Exported with"):
+        roster.detachment = lines[start]
+        start += 1
+
+    section, block = None, []
+    for line in lines[start:] + [None]:
+        if line is None or line.startswith("Exported with") or _SECTION_HEADER.match(line) or _POINTS_LINE.match(line):
+            unit = parse_unit("\n".join(block), section) if block else None
+            if unit:
+                roster.units.append(unit)
+            block = []
+            if line is None or line.startswith("Exported with"):
+                break
+            if _SECTION_HEADER.match(line):
+                section = line
+                continue
+        if section is not None:
+            block.append(line)
+    return roster
+
+
+def parse_army(army: Any) -> ParsedRoster:
+    """
+    Normalizes an army as sent by clients: the frontend's ArmyDetails object (or it JSON encoded),
+    an army list export, or just a faction name.
+    """
+    if isinstance(army, str):
+        try:
+            army = json.loads(army)
+        except ValueError:
+            pass
+    if isinstance(army, str):
+        text = army.strip()
+        return parse_army_text(text) or ParsedRoster(faction=text or None)
+    if not isinstance(army, dict):
+        return ParsedRoster(notes=json.dumps(army) if army is not None else None)
+    roster = ParsedRoster(army_name=army.get("armyName") or None,
+                          points=_int(army.get("armySizePoints")) or None,
+                          faction=army.get("faction") or None,
+                          detachment=army.get("detachment") or None)
+    for block in army.get("characters") or []:
+        unit = parse_unit(block, "CHARACTERS")
+        if unit:
+            roster.units.append(unit)
+    for block in army.get("otherDatasheets") or []:
+        unit = parse_unit(block)
+        if unit:
+            roster.units.append(unit)
+    known = {"id", "armyName", "armySizePoints", "faction", "detachment", "characters", "otherDatasheets"}
+    extra = {key: value for key, value in army.items() if key not in known and value not in (None, "", [], {})}
+    if extra:
+        roster.notes = json.dumps(extra)
+    return roster
+
+
+def render_unit(unit: ParsedUnit) -> str:
+    name = f"{unit.models}x {unit.name}" if unit.models > 1 else unit.name
+    details = [", ".join(unit.keywords)] if unit.keywords else []
+    if unit.points is not None:
+        details.append(f"{unit.points} pts")
+    text = f"{name} ({'; '.join(details)})" if details else name
+    equipment = unit.wargear + ([f"Enhancement: {unit.enhancement}"] if unit.enhancement else [])
+    return f"{text}: {', '.join(equipment)}" if equipment else text
+
+
+def render_prompt(roster: ParsedRoster) -> str:
+    """
+    Compact text of a roster for the system instructions, one line per unit.
+    """
+    title = [part for part in (roster.faction, roster.detachment) if part]
+    header = " - ".join(title) or "Unknown army"
+    if roster.points:
+        header += f", {roster.points} pts"
+    if roster.army_name:
+        header += f" ('{roster.army_name}')"
+    lines = [header] + [f"- {render_unit(unit)}" for unit in roster.units]
+    if roster.notes:
+        lines.append(f"Notes: {roster.notes}")
+    return "\n".join(lines)
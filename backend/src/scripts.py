@@ -1,5 +1,21 @@
+import click
+from sqlalchemy import select, text
+
 from backend.src.app import app
 
+# Read-only view of battle_messages in the legacy battle_log JSONB shape, for ad-hoc SQL and reporting
+BATTLE_LOG_VIEW = """
+CREATE OR REPLACE VIEW battle_log_view AS
+SELECT battle_id,
+       jsonb_object_agg(
+           seq::text,
+           jsonb_build_object('creator', creator, 'message', message, 'timestamp', timestamp, 'partial', partial)
+           ORDER BY seq
+       ) AS battle_log
+FROM battle_messages
+GROUP BY battle_id
+"""
+
 
 @app.flask.cli.command("init-db")
 def init_db_command():
@@ -7,9 +23,105 @@ def init_db_command():
     from backend.models.User import User
     from backend.models.Interaction import Interaction
     from backend.models.Battle import Battle
+    from backend.models.BattleMessage import BattleMessage
+    from backend.models.BattleArchive import BattleArchive
+    from backend.models.Roster import Roster
+    from backend.models.RosterUnit import RosterUnit
+    from backend.models.ImageUpload import ImageUpload
 
     with app.flask.app_context():
+        app.db.session.execute(text("DROP VIEW IF EXISTS battle_log_view"))
+        app.db.session.commit()
         app.db.drop_all()
         print("Run create all")
         app.db.create_all()
-    print("Initialized the database.")
\ No newline at end of file
+    print("Initialized the database.")
+
+
+@app.flask.cli.command("upgrade-db")
+def upgrade_db_command():
+    """Create missing tables and indexes without dropping existing data."""
+    from backend.models.User import User
+    from backend.models.Interaction import Interaction
+    from backend.models.Battle import Battle
+    from backend.models.BattleMessage import BattleMessage
+    from backend.models.BattleArchive import BattleArchive
+    from backend.models.Roster import Roster
+    from backend.models.RosterUnit import RosterUnit
+    from backend.models.ImageUpload import ImageUpload
+    from backend.src.battle_queries import new_roster
+    from backend.src.battle_state import migrate_legacy_battle_log
+    from backend.src.roster import OPPONENT, PLAYER
+
+    with app.flask.app_context():
+        db = app.db
+        # create_all skips tables that already exist, so columns and indexes added to existing tables are created here
+        db.create_all()
+        db.session.execute(text("ALTER TABLE battles ADD COLUMN IF NOT EXISTS message_seq INTEGER NOT NULL DEFAULT 0"))
+        db.session.execute(text("ALTER TABLE battles ADD COLUMN IF NOT EXISTS log_summary TEXT"))
+        db.session.execute(text("ALTER TABLE battles ADD COLUMN IF NOT EXISTS summary_seq INTEGER NOT NULL DEFAULT 0"))
+        db.session.execute(text("ALTER TABLE battles ADD COLUMN IF NOT EXISTS log_archived BOOLEAN NOT NULL DEFAULT false"))
+        db.session.execute(text("ALTER TABLE battles ADD COLUMN IF NOT EXISTS log_restored_at TIMESTAMP"))
+        db.session.commit()
+        for model in (User, Interaction, Battle, BattleMessage, BattleArchive, Roster, RosterUnit, ImageUpload):
+            for index in model.__table__.indexes:
+                index.create(bind=db.engine, checkfirst=True)
+        db.session.execute(text(BATTLE_LOG_VIEW))
+        db.session.commit()
+
+        # Move legacy battle_log blobs into battle_messages, one battle per transaction
+        legacy_ids = db.session.execute(
+            select(Battle.id).where(Battle.message_seq == 0, Battle.battle_log.isnot(None))
+        ).scalars().all()
+        migrated_battles = 0
+        for battle_id in legacy_ids:
+            battle = db.session.execute(select(Battle).where(Battle.id == battle_id).with_for_update()).scalar_one()
+            migrated = migrate_legacy_battle_log(battle.id, battle.battle_log)
+            battle.message_seq = migrated
+            db.session.commit()
+            migrated_battles += 1 if migrated else 0
+        print(f"Migrated the battle log of {migrated_battles} battles.")
+
+        # Parse the armies of battles created before the roster store
+        unparsed = db.session.execute(
+            select(Battle.id, Battle.player_army, Battle.opponent_army).where(~Battle.rosters.any())
+        ).all()
+        for battle_id, player_army, opponent_army in unparsed:
+            for side, army in ((PLAYER, player_army), (OPPONENT, opponent_army)):
+                roster = new_roster(side, army)
+                roster.battle_id = battle_id
+                db.session.add(roster)
+            db.session.commit()
+        print(f"Parsed the rosters of {len(unparsed)} battles.")
+    print("Upgraded the database.")
+
+
+@app.flask.cli.command("requeue-interactions")
+def requeue_interactions_command():
+    """Move dead-lettered interaction rows back into the flush buffer."""
+    from backend.tasks.interaction_buffer import BUFFER_KEY, DEAD_LETTER_KEY
+
+    moved = 0
+    while app.redis.lmove(DEAD_LETTER_KEY, BUFFER_KEY, "LEFT", "RIGHT") is not None:
+        moved += 1
+    print(f"Requeued {moved} interaction rows.")
+
+
+@app.flask.cli.command("archive-battles")
+@click.option("--limit", default=1000, show_default=True, help="Most battles to archive.")
+@click.option("--inactive-days", type=int, default=None, help="Overrides ARCHIVE_INACTIVE_DAYS.")
+@click.option("--restore", "restore_id", type=click.UUID, default=None, help="Restore the archived messages of this battle instead.")
+def archive_battles_command(limit, inactive_days, restore_id):
+    """Move the messages of archived and inactive battles to cold storage."""
+    from backend.src.archive import archive_battles, archive_stats, restore_battle_log
+    from backend.src.parameters import ARCHIVE_INACTIVE_DAYS
+
+    with app.flask.app_context():
+        if restore_id:
+            print(f"Restored {restore_battle_log(restore_id)} messages.")
+            return
+        archived = archive_battles(limit, ARCHIVE_INACTIVE_DAYS if inactive_days is None else inactive_days)
+        stats = archive_stats()
+    print(f"Archived {archived} battles.")
+    print(f"Cold storage: {stats['battles']} battles, {stats['messages']} messages, "
+          f"{stats['raw_bytes']} bytes compressed to {stats['stored_bytes']}.")
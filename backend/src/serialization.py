@@ -0,0 +1,116 @@
+import gzip
+import json
+import time
+from typing import Dict, Iterable, Optional, Set
+
+from flask import Response, request
+from flask.json.provider import DefaultJSONProvider
+
+from .metrics import TimedJSONProvider, add_request_time
+from .parameters import BROTLI_QUALITY, COMPRESSION_MIN_BYTES, GZIP_LEVEL
+
+try:
+    import orjson
+except ImportError: # Optional, falls back to the standard library encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError: # Optional, gzip only
+    brotli = None
+
+# Encodes UUIDs, datetimes and dataclasses natively, dict keys may be ints (battle log message numbers)
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if orjson else 0
+
+
+class OrjsonProvider(TimedJSONProvider):
+    """
+    Flask JSON provider backed by orjson. Responses are encoded straight to bytes; calls asking for
+    stdlib-only options (sort_keys, indent, ...) go through the default encoder.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._encode(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs) -> Response:
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._encode(obj) + b"\n", mimetype=self.mimetype)
+
+    def _encode(self, obj) -> bytes:
+        start = time.perf_counter()
+        try:
+            return orjson.dumps(obj, default=self.default, option=ORJSON_OPTIONS)
+        finally:
+            add_request_time("serialization", time.perf_counter() - start)
+
+
+def encode_json(obj) -> bytes:
+    """
+    Encodes a response body outside of Flask (the ASGI app) like the Flask JSON provider does.
+    """
+    start = time.perf_counter()
+    try:
+        if orjson:
+            return orjson.dumps(obj, default=DefaultJSONProvider.default, option=ORJSON_OPTIONS)
+        return json.dumps(obj, default=DefaultJSONProvider.default, separators=(",", ":")).encode("utf-8")
+    finally:
+        add_request_time("serialization", time.perf_counter() - start)
+
+
+def json_provider_class():
+    return OrjsonProvider if orjson else TimedJSONProvider
+
+
+def requested_fields(allowed: Iterable[str]) -> Optional[Set[str]]:
+    """
+    Parses the '?fields=a,b' query parameter. Returns None when absent (all fields),
+    raises ValueError for fields the endpoint does not have.
+    """
+    return parse_fields(request.args.get('fields'), allowed)
+
+
+def parse_fields(raw: Optional[str], allowed: Iterable[str]) -> Optional[Set[str]]:
+    if not raw:
+        return None
+    fields = set(filter(None, (field.strip() for field in raw.split(','))))
+    unknown = fields - set(allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return fields
+
+
+def select_fields(data: Dict, fields: Optional[Set[str]]) -> Dict:
+    if fields is None:
+        return data
+    return {key: value for key, value in data.items() if key in fields}
+
+
+def compress_response(response: Response) -> Response:
+    """
+    Compresses buffered responses above COMPRESSION_MIN_BYTES with brotli (when installed and
+    accepted) or gzip. Streamed responses (SSE) are left alone so chunks are flushed immediately.
+    """
+    if (response.is_streamed or response.direct_passthrough or response.status_code < 200
+            or response.status_code in (204, 304) or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < COMPRESSION_MIN_BYTES:
+        return response
+    accepted = request.accept_encodings
+    if brotli and accepted['br']:
+        encoding, compressed = 'br', brotli.compress(body, quality=BROTLI_QUALITY)
+    elif accepted['gzip']:
+        encoding, compressed = 'gzip', gzip.compress(body, compresslevel=GZIP_LEVEL)
+    else:
+        return response
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
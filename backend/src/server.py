@@ -1,49 +1,95 @@
 import sys
 import os
-import requests
 import jwt
+import json
+import time
 import uuid
 
 from datetime import datetime, timedelta
-from typing import Any, Dict, Optional
-from psycopg2 import IntegrityError
-from sqlalchemy import or_
-
-from flask import request, jsonify
-from google.oauth2 import id_token
-from google.auth.transport import requests as grequests
-
-from backend.src.battle_state import BattleState
-from backend.tasks.tasks import log_interaction_task
-from .helpers import jwt_required
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+
+from flask import Blueprint, Response, current_app, g, request, jsonify, stream_with_context
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from backend.src.battle_state import BattleState, BattleNotFound, get_battle_snapshot
+from backend.src.battle_cache import battle_cache, battle_snapshot
+from backend.src.battle_queries import battle_page_statement, new_battle, parse_turn
+from backend.src.admission import admission, RateLimited
+from backend.src.concurrency import generation_limiter, GenerationBusy
+from backend.src.idempotency import IdempotentRequest, idempotency_store, request_fingerprint
+from backend.src.image_store import (DONE as IMAGE_DONE, FAILED as IMAGE_FAILED, MAX_UPLOAD_REQUEST_BYTES, UnsupportedImage,
+                                    UploadTooLarge, register_upload, save_upload)
+from backend.src.job_owners import job_owners
+from backend.src.metrics import REGISTRY, GaugeCollector, observe_request
+from backend.src.serialization import compress_response, requested_fields, select_fields
+from backend.tasks.interaction_buffer import flush_stats
+from .logging_config import log_payload
+from .helpers import jwt_required, current_user_id, token_cache, parse_bool_arg, encode_cursor, decode_cursor
 from backend.models.User import User
 from backend.models.Interaction import Interaction
 from backend.models.Battle import Battle
+from backend.models.ImageUpload import ImageUpload
 from backend.src.app import app as source
 
-from .parameters import JWT_SECRET, JWT_ALGORITHM
+from .parameters import (JWT_SECRET, JWT_ALGORITHM, DEFAULT_BATTLE_PAGE_SIZE, MAX_BATTLE_PAGE_SIZE, GENERATION_MODE, LOG_PAYLOADS,
+                         METRICS_TOKEN, GOOGLE_TOKEN_URL, MAX_IMAGE_BYTES)
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 
-flask = source.flask
+# The API routes, registered on the app by create_app (see factory.py)
+api = Blueprint("api", __name__)
 log = source.log
 db = source.db
-client = source.gen_client
 
 
-@flask.after_request
+@api.before_app_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@api.after_app_request
 def handle_options_and_cors(response):
     # Set CORS headers for all responses
     response.headers["Access-Control-Allow-Origin"] = "*"
     response.headers["Access-Control-Allow-Methods"] = "GET,POST,PUT,DELETE,OPTIONS"
-    response.headers["Access-Control-Allow-Headers"] = "Authorization,Content-Type"
+    response.headers["Access-Control-Allow-Headers"] = "Authorization,Content-Type,Prefer,Idempotency-Key"
+    response.headers["Access-Control-Expose-Headers"] = "X-Next-Cursor,Location,Retry-After,Idempotent-Replayed"
     if request.method == "OPTIONS":
         response.status_code = 204
         response.data = b""
+    response = compress_response(response)
+    if 'request_start' in g:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        observe_request(request.method, route, response.status_code,
+                        time.perf_counter() - g.request_start, g.get('timings'))
     return response
 
 
-@flask.route('/api/authorization', methods=['POST', 'OPTIONS'])
+REGISTRY.register(GaugeCollector("db_pool", "Database connection pool of this process", source.pool_metrics))
+REGISTRY.register(GaugeCollector("generation", "Model calls of this process",
+                                 lambda: {"in_flight": generation_limiter.in_flight, "limit": generation_limiter.limit}))
+REGISTRY.register(GaugeCollector("jwt_cache", "Verified token cache of this process",
+                                 lambda: {"hits": token_cache.hits, "misses": token_cache.misses}))
+REGISTRY.register(GaugeCollector("interaction_log", "Buffered interaction logging (shared across processes)",
+                                 lambda: flush_stats(source.redis)))
+REGISTRY.register(GaugeCollector("admission", "Model calls and chat turns waiting for one (shared across processes)",
+                                 admission.stats))
+
+
+@api.route('/api/metrics', methods=['GET'])
+def metrics():
+    """
+    Prometheus text exposition of this worker process's metrics.
+    Each Gunicorn worker keeps its own counters, so scrape every worker (or run one per container).
+    """
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"error": "Unauthorized"}), 401
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+@api.route('/api/authorization', methods=['POST', 'OPTIONS'])
 def google_authorization():
     if request.method == 'OPTIONS':
         return '', 204
@@ -53,8 +99,13 @@ def google_authorization():
     redirect_uri = data.get('redirect_uri')
     if not code or not client_id or not redirect_uri:
         return jsonify({'error': 'Missing required parameters'}), 400
-    # Exchange code for tokens
-    token_url = "https://oauth2.googleapis.com/token"
+    # google-auth and requests are only needed here, imported on the first sign-in
+    import requests
+    from google.auth.exceptions import TransportError
+    from google.oauth2 import id_token
+    from .http_client import HTTP_TIMEOUT, google_request, http_session
+
+    # Exchange code for tokens, on a kept-alive connection
     token_data = {
         'code': code,
         'client_id': client_id,
@@ -62,7 +113,11 @@ def google_authorization():
         'redirect_uri': redirect_uri,
         'grant_type': 'authorization_code'
     }
-    token_resp = requests.post(token_url, data=token_data)
+    try:
+        token_resp = http_session.post(GOOGLE_TOKEN_URL, data=token_data, timeout=HTTP_TIMEOUT)
+    except requests.RequestException as e:
+        log.error(f"Token exchange failed: {e}")
+        return jsonify({'error': 'Failed to exchange code', 'details': str(e)}), 502
     if not token_resp.ok:
         log.error(f"Token exchange failed: {token_resp.text}")
         return jsonify({'error': 'Failed to exchange code', 'details': token_resp.text}), 400
@@ -73,10 +128,11 @@ def google_authorization():
         log.error("No id_token in response")
         return jsonify({'error': 'No id_token in response'}), 400
 
-    # Verify and decode the id_token
+    # Verify and decode the id_token, Google's signing certificates are cached per process
     try:
-        idinfo = id_token.verify_oauth2_token(id_token_jwt, grequests.Request(), client_id)
-        log.info(f"ID Token verified: {idinfo}") # Debugging log
+        idinfo = id_token.verify_oauth2_token(id_token_jwt, google_request, client_id)
+        if LOG_PAYLOADS:
+            log.info(f"ID Token verified: {idinfo}") # Debugging log
 
         email = idinfo.get('email')
         username = idinfo.get('name')
@@ -111,18 +167,25 @@ def google_authorization():
         }), 200
     except ValueError as e:
         return jsonify({'error': 'Invalid id_token', 'details': str(e)}), 401
+    except TransportError as e:
+        log.error(f"Fetching Google's signing certificates failed: {e}")
+        return jsonify({'error': 'Failed to verify id_token', 'details': str(e)}), 502
 
 
-@flask.route('/api/users/<uuid:email>', methods=['GET']) # Get user by email
+@api.route('/api/users/<uuid:email>', methods=['GET']) # Get user by email
 @jwt_required
-def get_user(email: str):
+def get_user(_context: Optional[Any] = None, email: str = None):
+    try:
+        fields = requested_fields(User.FIELDS)
+    except ValueError as e:
+        return jsonify({"error": "Invalid query parameter", "details": str(e)}), 400
     user = User.query.filter_by(email=email).first()
     if user is None:
         return jsonify({"error": "Users not found"}), 404
-    return jsonify(user.to_dict()), 200
+    return jsonify(select_fields(user.to_dict(), fields)), 200
 
 
-@flask.route('/api/users', methods=['PUT'])
+@api.route('/api/users', methods=['PUT'])
 @jwt_required
 def update_user(_context: Optional[Any] = None) -> Dict:
     data = request.get_json()
@@ -130,6 +193,10 @@ def update_user(_context: Optional[Any] = None) -> Dict:
     if not user_id:
         return jsonify({"error": "Missing user_id"}), 400
 
+    try:
+        user_id = uuid.UUID(user_id)
+    except ValueError:
+        return jsonify({"error": "Invalid user_id format"}), 400
     user = db.session.get(User, user_id)
     if user is None:
         return jsonify({"error": "User not found"}), 404
@@ -151,27 +218,53 @@ def update_user(_context: Optional[Any] = None) -> Dict:
         return jsonify({"error": "Failed to update user", "details": str(e)}), 500
 
 
-@flask.route('/api/battles', methods=['GET'])
+@api.route('/api/battles', methods=['GET'])
 @jwt_required
 def fetch_battles(_context: Optional[Any] = None) -> Dict:
-    log.info(f"--- FETCH BATTLE ENDPOINT CALLED ---") # Debugging log
+    """
+    1: Get Battles Endpoint
+    Lists a user's battles, newest first, using keyset pagination.
+    Query parameters:
+        user_id (required), archived ('true'/'false'), limit (default 50, max 200),
+        cursor (the X-Next-Cursor header of the previous page), include ('battle_log' to return the log),
+        fields (comma separated subset of the battle fields, e.g. 'id,battle_name,timestamp')
+    """
+    log.debug(f"--- FETCH BATTLE ENDPOINT CALLED ---") # Debugging log
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({"error": "Missing user_id parameter"}), 400
     try:
-        log.info(f'Fetching battles for user: {user_id}') # Debugging log
-        battles = Battle.query.all()
-        battles_list = [battle.to_dict() for battle in battles]
-        users_battle = [b for b in battles_list if b['user_id'] == user_id]
-        import json
-        log.info(json.dumps(users_battle)) 
-        return jsonify(users_battle), 200
+        user_id = uuid.UUID(user_id)
+        archived = parse_bool_arg(request.args.get('archived'))
+        limit = int(request.args.get('limit', DEFAULT_BATTLE_PAGE_SIZE))
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor) if cursor else None
+        fields = requested_fields(Battle.SUMMARY_COLUMNS + ('battle_log',))
+    except ValueError as e:
+        return jsonify({"error": "Invalid query parameter", "details": str(e)}), 400
+    if user_id != current_user_id():
+        return jsonify({"error": "user_id does not match the authenticated user"}), 403
+    limit = max(1, min(limit, MAX_BATTLE_PAGE_SIZE))
+    include = set(filter(None, request.args.get('include', '').split(',')))
+    if fields is None:
+        fields = Battle.SUMMARY_COLUMNS + (('battle_log',) if 'battle_log' in include else ())
+
+    try:
+        log.debug(f'Fetching battles for user: {user_id}') # Debugging log
+        # Fetch one extra row to know whether another page exists
+        battles = db.session.execute(battle_page_statement(user_id, fields, limit, archived, after)).scalars().all()
+        page = battles[:limit]
+        response = jsonify([battle.to_dict(fields=fields) for battle in page])
+        if len(battles) > limit:
+            response.headers['X-Next-Cursor'] = encode_cursor(page[-1].timestamp, page[-1].id)
+        log.info(f"Fetched {len(page)} battles for user: {user_id}")
+        return response, 200
     except Exception as e:
         log.info(f"Error fetching battles: {e}")
         return jsonify({"error": "Failed to fetch battles"}), 500
 
 
-@flask.route('/api/battles', methods=['POST'])
+@api.route('/api/battles', methods=['POST'])
 @jwt_required
 def create_battle(_context: Optional[Any] = None) -> Dict:
     """
@@ -179,43 +272,26 @@ def create_battle(_context: Optional[Any] = None) -> Dict:
     Creates a new Battles entity in the database.
     Expects JSON data like {'playArea': {'width': 44, 'height': 60}, 'playerArmy': 'Black Templars', 'opponentArmy': 'Tau'}
     """
-    log.info(f"--- CREATE BATTLE ENDPOINT CALLED ---") # Debugging log
+    log.debug(f"--- CREATE BATTLE ENDPOINT CALLED ---") # Debugging log
     if not request.is_json:
         return jsonify({"error": "Request must be JSON"}), 400
 
     data = request.get_json()
-    log.info(f"Create battle endpoint called {data=}")
-    playArea = data.get('playArea')
-    width = playArea.get('width')
-    height = playArea.get('height')
-    user_id = data.get('userId')
-    player_army = data.get('playerArmy')
-    opponent_army = data.get('opponentArmy')
-    battle_name = data.get('battleName')
-
+    log_payload(log, "create_battle", "Create battle request body", data)
     if not data:
         return jsonify({"error": "Missing data in request body"}), 400
+    try:
+        user_id = uuid.UUID(data.get('userId'))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid userId format"}), 400
 
-    new_battle = Battle(user_id=user_id,
-                        id=uuid.uuid4(),
-                        battle_name=battle_name,
-                        width=width,
-                        height=height,
-                        player_army=player_army,
-                        opponent_army=opponent_army,
-                        battle_round="0",
-                        army_turn="0",
-                        player_score="0",
-                        opponent_score="0",
-                        timestamp=datetime.now(),
-                        battle_log = {},
-                        archived=False
-                      )
+    battle = new_battle(user_id, data)
     try:
-        db.session.add(new_battle)
+        db.session.add(battle)
         db.session.commit()
-        log.info(f"Battle created: {new_battle}") # Server log
-        return jsonify(new_battle.to_dict()), 201 # 201 Created status code
+        battle_cache.put(battle.id, battle_snapshot(battle))
+        log.info(f"Battle created: {battle}") # Server log
+        return jsonify(battle.to_dict()), 201 # 201 Created status code
     except IntegrityError as e:
         db.session.rollback() # Important: Rollback session on error
         log.info(f"Database Integrity Error: {e}")
@@ -230,16 +306,100 @@ def create_battle(_context: Optional[Any] = None) -> Dict:
         return jsonify({"error": "An unexpected error occurred"}), 500
 
 
-@flask.route('/api/interactions/text/stream', methods=['POST'])
+@api.route('/api/battles/<uuid:battle_id>', methods=['GET'])
+@jwt_required
+def get_battle(_context: Optional[Any] = None, battle_id: uuid.UUID = None) -> Dict:
+    """
+    Returns a single battle including its battle log, served from the battle state cache.
+    Supports the same 'fields' query parameter as the battle listing.
+    """
+    try:
+        fields = requested_fields(Battle.SUMMARY_COLUMNS + ('battle_log',))
+    except ValueError as e:
+        return jsonify({"error": "Invalid query parameter", "details": str(e)}), 400
+    snapshot = get_battle_snapshot(battle_id)
+    if snapshot is None or snapshot["user_id"] != str(current_user_id()):
+        return jsonify({"error": "Battle not found"}), 404
+    battle_state = BattleState.from_snapshot(battle_id, snapshot)
+    # The battle log older than the cached snapshot is only read when it is returned
+    battle = battle_state.battle if fields is None or 'battle_log' in fields else battle_state.details
+    return jsonify(select_fields(battle, fields)), 200
+
+
+@api.route('/api/battles/<uuid:battle_id>/archive', methods=['PUT'])
+@jwt_required
+def archive_battle(_context: Optional[Any] = None, battle_id: uuid.UUID = None) -> Dict:
+    """
+    Archives a battle, or restores it with {'archived': false}.
+    """
+    data = request.get_json(silent=True) or {}
+    archived = data.get('archived', True) if isinstance(data, dict) else None
+    if not isinstance(archived, bool):
+        return jsonify({"error": "archived must be true or false"}), 400
+    snapshot = get_battle_snapshot(battle_id)
+    if snapshot is None or snapshot["user_id"] != str(current_user_id()):
+        return jsonify({"error": "Battle not found"}), 404
+    try:
+        db.session.execute(update(Battle).where(Battle.id == battle_id).values(archived=archived))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        log.info(f"Error archiving battle: {e}")
+        return jsonify({"error": "Failed to archive battle"}), 500
+    snapshot["archived"] = archived
+    battle_cache.put(battle_id, snapshot)
+    return jsonify(BattleState.from_snapshot(battle_id, snapshot).battle), 200
+
+
+@api.route('/api/battles/<uuid:battle_id>/turn', methods=['PUT'])
+@jwt_required
+def update_turn(_context: Optional[Any] = None, battle_id: uuid.UUID = None) -> Dict:
+    """
+    Moves a battle to another round or turn, expects {'battle_round': 2, 'army_turn': '1'}.
+    The start of the player's turn queues the opponent's plan for its next turn (PREFETCH_ENABLED),
+    the start of the opponent's turn returns it as 'opponent_plan' ({'status': 'ready', 'plan': ...},
+    {'status': 'pending'} or null).
+    """
+    try:
+        turn = parse_turn(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({"error": "Invalid turn", "details": str(e)}), 400
+    snapshot = get_battle_snapshot(battle_id)
+    if snapshot is None or snapshot["user_id"] != str(current_user_id()):
+        return jsonify({"error": "Battle not found"}), 404
+    try:
+        db.session.execute(update(Battle).where(Battle.id == battle_id).values(**turn))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        log.info(f"Error updating battle turn: {e}")
+        return jsonify({"error": "Failed to update battle turn"}), 500
+    snapshot.update(turn)
+    battle_cache.put(battle_id, snapshot)
+    battle_state = BattleState.from_snapshot(battle_id, snapshot)
+    body = battle_state.battle
+    if battle_state.army_turn == Battle.PLAYER_TURN:
+        battle_state.schedule_opponent_plan()
+    else:
+        body["opponent_plan"] = battle_state.opponent_plan_status()
+    return jsonify(body), 200
+
+
+@api.route('/api/interactions/text/stream', methods=['POST'])
 @jwt_required
 def post_text_interaction_stream(_context=None) -> Dict:
     """
     4: Post Text Interaction Endpoint
     Handles text input, calls LLM (Gemini), logs interaction.
     Expects JSON like {'user_id': 'some_uuid', 'text': 'Users message'}
+    Clients sending 'Accept: text/event-stream' receive the response as Server-Sent Events,
+    otherwise the full battle log is returned as JSON once generation completes.
+    Retries sent with the same 'Idempotency-Key' header get the first request's response
+    instead of a second generation, see idempotency.py.
     """
-    log.info(f"--- POST TEXT INTERACTION STREAM ENDPOINT CALLED --- {request.get_json()}") # Debugging log
     data = request.get_json()
+    log.debug(f"--- POST TEXT INTERACTION STREAM ENDPOINT CALLED ---") # Debugging log
+    log_payload(log, "chat_turn", "Chat turn request body", data)
     user_id_str = data.get('user_id')
     battle_id_str = data.get('battle_id')
     user_message = data.get('text')
@@ -253,32 +413,234 @@ def post_text_interaction_stream(_context=None) -> Dict:
     except ValueError:
         return jsonify({"error": "Invalid user_id format"}), 400
 
-    user = db.session.get(User, user_id)
-    if user is None:
-        return jsonify({"error": "Users not found"}), 404
+    # The verified token identifies the user, no need to load the User row
+    if user_id != current_user_id():
+        return jsonify({"error": "user_id does not match the authenticated user"}), 403
+
+    try:
+        battle_state = BattleState(battle_id_str)
+    except BattleNotFound:
+        return jsonify({"error": "Battle not found"}), 404
+    if battle_state.user_id != str(user_id):
+        return jsonify({"error": "Battle not found"}), 404
+
+    idempotent = None
+    if request.headers.get('Idempotency-Key'):
+        idempotent = idempotency_store.claim(user_id, request.headers['Idempotency-Key'],
+                                             request_fingerprint(battle_state.battle_id, user_message))
+        if not idempotent.leader:
+            return idempotent_replay(idempotent)
 
-    battle_state = BattleState(battle_id_str)
     try:
-        response = client.generate(content=user_message, battle_state=battle_state)
-        log.info(f"--- LLM Response: {response} ---")
+        admission.take_token(user_id)
+    except RateLimited as e:
+        if idempotent:
+            idempotent.release()
+        return generation_busy_response(e)
+
+    # Celery is imported on the first request that queues a task, not when the app loads
+    from backend.tasks.tasks import generate_reply_task, log_interaction_task
+
+    if wants_async_generation():
+        job = generate_reply_task.delay(battle_id_str, str(user_id), user_message)
+        job_owners.record(job.id, user_id)
+        status_url = f"/api/interactions/jobs/{job.id}"
+        body = {"job_id": job.id, "status_url": status_url}
+        if idempotent:
+            idempotent.complete(202, body, {"Location": status_url})
+        return jsonify(body), 202, {"Location": status_url}
+
+    if wants_event_stream():
+        try:
+            release_slot = acquire_generation_slot(user_id)
+        except GenerationBusy as e:
+            if idempotent:
+                idempotent.release()
+            return generation_busy_response(e)
+        stream = Response(
+            stream_with_context(stream_text_interaction(battle_state, user_id, user_message, idempotent)),
+            mimetype='text/event-stream',
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+        # Runs once the stream is finished or the client went away, even if it never started
+        stream.call_on_close(release_slot)
+        return stream
+
+    try:
+        with admission.slot(user_id), generation_limiter.slot():
+            response = source.gen_client.generate(content=user_message, battle_state=battle_state)
         updated_battle_log = battle_state.update_battle_log(user_message=user_message, ai_response=response)
+    except GenerationBusy as e:
+        if idempotent:
+            idempotent.release()
+        return generation_busy_response(e)
     except Exception as e:
+        if idempotent:
+            idempotent.release()
         log.error(f"Error calling Gemini API: {e}")
         return jsonify({"error": "Failed to call Gemini API", "details": str(e)}), 500
 
     log_interaction_task.delay(str(user_id), user_message, response, "text")
     if not updated_battle_log:
+        if idempotent:
+            idempotent.release()
         return jsonify({"error": "Failed to update battle log"}), 500
     # Return the updated battle log
-    return jsonify({
+    body = {
         "message": "Text interaction processed successfully",
         "battle_log": updated_battle_log
-    }), 200
+    }
+    if idempotent:
+        idempotent.complete(200, body, reply=response)
+    return jsonify(body), 200
 
 
-@flask.route('/api/interactions/text', methods=['POST'])
+def idempotent_replay(idempotent: IdempotentRequest):
+    """
+    Answers a chat turn whose Idempotency-Key was already used: waits for the first request if it
+    is still generating, then replays its response (as events if the client asked for a stream).
+    """
+    if idempotent.pending and not idempotent.conflict:
+        idempotency_store.wait(idempotent)
+    if idempotent.conflict:
+        return jsonify({"error": "Idempotency-Key was already used for a different request"}), 422
+    if idempotent.pending:
+        return (jsonify({"error": "A request with this Idempotency-Key is in progress, retry shortly"}), 409,
+                {"Retry-After": "1"})
+    record = idempotent.record
+    headers = {**record["headers"], "Idempotent-Replayed": "true"}
+    if wants_event_stream() and record["reply"] is not None:
+        events = [format_sse('chunk', {"text": record["reply"]}), format_sse('done', record["body"])]
+        return Response(events, mimetype='text/event-stream', headers={**headers, "Cache-Control": "no-cache"})
+    return jsonify(record["body"]), record["status_code"], headers
+
+
+def wants_async_generation() -> bool:
+    """
+    True when generation should run in the Celery worker and the client polls for the result.
+    """
+    prefer = request.headers.get('Prefer', '')
+    return GENERATION_MODE == 'celery' or 'respond-async' in prefer
+
+
+def acquire_generation_slot(user_id: uuid.UUID) -> Callable[[], None]:
+    """
+    Takes a deployment wide generation slot (see admission.py), then one of this process's.
+    Returns the function releasing both, raises GenerationBusy if either is not free in time.
+    """
+    ticket = admission.acquire(user_id)
+    try:
+        generation_limiter.acquire()
+    except GenerationBusy:
+        admission.release(ticket)
+        raise
+
+    def release():
+        generation_limiter.release()
+        admission.release(ticket)
+    return release
+
+
+def generation_busy_response(error: GenerationBusy):
+    log.info(f"Rejecting chat turn: {error}")
+    headers = {"Retry-After": str(error.retry_after)}
+    if isinstance(error, RateLimited):
+        return jsonify({"error": "Too many messages, wait before sending another"}), 429, headers
+    return jsonify({"error": "Too many concurrent requests, try again shortly"}), 503, headers
+
+
+def wants_event_stream() -> bool:
+    """
+    True when the client asked for Server-Sent Events instead of a single JSON response.
+    """
+    best = request.accept_mimetypes.best_match(['application/json', 'text/event-stream'])
+    return best == 'text/event-stream'
+
+
+def format_sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {current_app.json.dumps(data)}\n\n"
+
+
+def stream_text_interaction(battle_state: BattleState, user_id: uuid.UUID, user_message: str,
+                            idempotent: Optional[IdempotentRequest] = None) -> Iterator[str]:
+    """
+    Streams the model response as 'chunk' events and finishes with a 'done' event carrying the battle log.
+    The assembled message is persisted once the stream completes; if the client disconnects
+    mid-stream, whatever was received so far is saved as a partial message.
+    Only a complete reply is stored for Idempotency-Key retries, they regenerate after a partial one.
+    """
+    chunks = []
+    try:
+        for chunk in source.gen_client.generate_stream(content=user_message, battle_state=battle_state):
+            chunks.append(chunk)
+            yield format_sse('chunk', {"text": chunk})
+    except GeneratorExit:
+        log.info(f"Client disconnected from stream for battle {battle_state.battle_id}")
+        save_streamed_response(battle_state, user_id, user_message, chunks, partial=True)
+        if idempotent:
+            idempotent.release()
+        raise
+    except Exception as e:
+        log.error(f"Error streaming from Gemini API: {e}")
+        save_streamed_response(battle_state, user_id, user_message, chunks, partial=True)
+        if idempotent:
+            idempotent.release()
+        yield format_sse('error', {"error": "Failed to call Gemini API", "details": str(e)})
+        return
+
+    updated_battle_log = save_streamed_response(battle_state, user_id, user_message, chunks, partial=False)
+    body = {
+        "message": "Text interaction processed successfully",
+        "battle_log": updated_battle_log
+    }
+    if idempotent:
+        if updated_battle_log:
+            idempotent.complete(200, body, reply="".join(chunks))
+        else:
+            idempotent.release()
+    yield format_sse('done', body)
+
+
+def save_streamed_response(battle_state: BattleState, user_id: uuid.UUID, user_message: str, chunks: List[str], partial: bool):
+    if partial and not chunks:
+        return None
+    response = "".join(chunks)
+    try:
+        updated_battle_log = battle_state.update_battle_log(user_message=user_message, ai_response=response, partial=partial)
+    except Exception as e:
+        db.session.rollback()
+        log.error(f"Error saving streamed response: {e}")
+        return None
+    from backend.tasks.tasks import log_interaction_task
+    log_interaction_task.delay(str(user_id), user_message, response, "text")
+    return updated_battle_log
+
+
+@api.route('/api/interactions/jobs/<job_id>', methods=['GET'])
 @jwt_required
-def post_text_interaction():
+def get_interaction_job(_context: Optional[Any] = None, job_id: str = None) -> Dict:
+    """
+    Returns the status of a chat turn queued with 'Prefer: respond-async'.
+    202 while the reply is being generated, 200 with the battle log once done.
+    Jobs of other users are not found, whatever their state.
+    """
+    from backend.tasks.tasks import generate_reply_task
+
+    if not job_owners.is_owner(job_id, current_user_id()):
+        return jsonify({"error": "Job not found"}), 404
+    job = generate_reply_task.AsyncResult(job_id)
+    if job.state in ('PENDING', 'RECEIVED', 'STARTED', 'RETRY'):
+        return jsonify({"job_id": job_id, "status": job.state.lower()}), 202, {"Retry-After": "1"}
+    if job.state == 'FAILURE':
+        log.error(f"Generation job {job_id} failed: {job.result}")
+        return jsonify({"job_id": job_id, "status": "failed", "error": "Failed to call Gemini API"}), 500
+    result = job.result or {}
+    return jsonify({"job_id": job_id, "status": "done", **result}), 200
+
+
+@api.route('/api/interactions/text', methods=['POST'])
+@jwt_required
+def post_text_interaction(_context: Optional[Any] = None):
     """
     4: Post Text Interaction Endpoint
     Handles text input, calls LLM (placeholder), logs interaction.
@@ -299,10 +661,8 @@ def post_text_interaction():
     except ValueError:
         return jsonify({"error": "Invalid user_id format"}), 400
 
-    # Verify user exists
-    user = db.session.get(User, user_id)
-    if user is None:
-        return jsonify({"error": "Users not found"}), 404
+    if user_id != current_user_id():
+        return jsonify({"error": "user_id does not match the authenticated user"}), 403
 
     # --- Placeholder for your LLM Logic ---
     # 1. Retrieve relevant conversation history for user_id from Interaction table
@@ -311,7 +671,7 @@ def post_text_interaction():
     # 3. Get the LLM's response
     # ---------------------------------------
     # Example response (replace with actual LLM output)
-    llm_response_text = f"LLM processed text from {user.username}: '{user_text}'."
+    llm_response_text = f"LLM processed text from {user_id}: '{user_text}'."
 
     # Create Interaction log entry
     new_interaction = Interaction(
@@ -336,18 +696,26 @@ def post_text_interaction():
         return jsonify({"error": "An unexpected error occurred logging interaction"}), 500
 
 
-@flask.route('/api/interactions/image', methods=['POST'])
+@api.route('/api/interactions/image', methods=['POST'])
 @jwt_required
-def post_image_interaction():
+def post_image_interaction(_context: Optional[Any] = None):
     """
     5: Post Image Interaction Endpoint
-    Handles image input, calls processing/LLM (placeholder), logs interaction.
+    Stores a photo of the board and queues its analysis by the multimodal model.
     Expects multipart/form-data with 'image' file and 'user_id' field.
+    Returns 202 with the upload's job id and status_url, or 200 with the analysis if the photo was analyzed before.
     """
-    if 'image' not in request.files:
+    if request.content_length is not None and request.content_length > MAX_UPLOAD_REQUEST_BYTES:
+        return jsonify({"error": f"Images are limited to {MAX_IMAGE_BYTES} bytes"}), 413
+    # Werkzeug spools the multipart body to a temporary file past 500KB, this bounds chunked uploads too
+    request.max_content_length = MAX_UPLOAD_REQUEST_BYTES
+    try:
+        file = request.files.get('image')
+    except RequestEntityTooLarge:
+        return jsonify({"error": f"Images are limited to {MAX_IMAGE_BYTES} bytes"}), 413
+    if file is None:
         return jsonify({"error": "No 'image' file part in the request"}), 400
 
-    file = request.files['image']
     user_id_str = request.form.get('user_id') # Get user_id from form data
 
     if not user_id_str:
@@ -361,57 +729,49 @@ def post_image_interaction():
     except ValueError:
         return jsonify({"error": "Invalid user_id format"}), 400
 
-    # Verify user exists
-    user = db.session.get(User, user_id)
-    if user is None:
-        return jsonify({"error": "Users not found"}), 404
-
-    # Securely handle the filename and save the file (implement proper saving)
-    # from werkzeug.utils import secure_filename
-    # filename = secure_filename(file.filename)
-    # upload_path = os.path.join('path_to_your_uploads', filename) # Configure this path
-    # try:
-    #     file.save(upload_path)
-    # except Exception as e:
-    #     app.logger.info(f"Error saving file: {e}")
-    #     return jsonify({"error": "Could not save uploaded file"}), 500
-    filename = file.filename # Using original filename for simplicity here
-    log.info(f"Received image file: {filename}") # Server log - ADD ACTUAL SAVING LOGIC
-
-    # --- Placeholder for your Image Processing/LLM Logic ---
-    # 1. Process the saved image (e.g., analysis, description generation)
-    # 2. Potentially send image data/URL to a multimodal LLM
-    # 3. Get a response based on the image
-    # ------------------------------------------------------
-    # Example response
-    llm_response_text = f"LLM processed image '{filename}' from {user.username}."
+    if user_id != current_user_id():
+        return jsonify({"error": "user_id does not match the authenticated user"}), 403
 
-    # Create Interaction log entry
-    new_interaction = Interaction(
-        user_id=user_id,
-        type='image',
-        user_input=filename, # Store filename as user input reference
-        llm_output=llm_response_text # Replace with actual response
-    )
+    try:
+        stored = save_upload(file.stream)
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except UnsupportedImage as e:
+        return jsonify({"error": str(e)}), 415
+    except OSError as e:
+        log.error(f"Error saving image upload: {e}")
+        return jsonify({"error": "Could not save uploaded file"}), 500
 
     try:
-        db.session.add(new_interaction)
-        db.session.commit()
-        log.info(f"Image interaction for user {user_id} logged.") # Server log
-        return jsonify({
-            "message": "Image interaction processed successfully",
-            "filename": filename,
-            "llm_response": llm_response_text,
-            "interaction_id": str(new_interaction.id)
-        }), 200
+        upload, needs_processing = register_upload(db.session, user_id, stored, file.filename)
     except Exception as e:
         db.session.rollback()
-        log.info(f"Error logging image interaction: {e}")
-        return jsonify({"error": "An unexpected error occurred logging interaction"}), 500
-
+        log.error(f"Error registering image upload: {e}")
+        return jsonify({"error": "An unexpected error occurred registering the upload"}), 500
+    if needs_processing:
+        from backend.tasks.tasks import process_image_task
+        process_image_task.delay(str(upload.id))
+    log.info(f"Image upload {upload.id} for user {user_id}: {upload.status}")
 
-if __name__ == '__main__':
-    flask.run(debug=True, host='0.0.0.0', port=5000) # Set debug=False for production
+    status_url = f"/api/interactions/image/{upload.id}"
+    body = {**upload.to_dict(), "status_url": status_url}
+    if upload.status == IMAGE_DONE:
+        return jsonify(body), 200, {"Location": status_url}
+    return jsonify(body), 202, {"Location": status_url}
 
 
-app = flask
\ No newline at end of file
+@api.route('/api/interactions/image/<uuid:upload_id>', methods=['GET'])
+@jwt_required
+def get_image_interaction(_context: Optional[Any] = None, upload_id: uuid.UUID = None):
+    """
+    Returns the status of an image upload: 202 while it is analyzed, 200 with the analysis once done.
+    """
+    upload = db.session.get(ImageUpload, upload_id)
+    if upload is None or upload.user_id != current_user_id():
+        return jsonify({"error": "Upload not found"}), 404
+    if upload.status == IMAGE_FAILED:
+        log.error(f"Image upload {upload_id} failed: {upload.error}")
+        return jsonify({**upload.to_dict(), "error": "Failed to analyze the image"}), 500
+    if upload.status != IMAGE_DONE:
+        return jsonify(upload.to_dict()), 202, {"Retry-After": "2"}
+    return jsonify(upload.to_dict()), 200
@@ -0,0 +1,86 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+# Sentinel stored for tokens that failed verification
+INVALID = object()
+
+
+class TokenCache:
+    """
+    Bounded, thread-safe LRU of verified JWT payloads keyed by the SHA-256 of the token.
+    Valid payloads are kept until their 'exp' claim, invalid tokens for a short negative TTL,
+    so clients polling with the same bearer token skip the decode and HMAC check.
+    """
+
+    def __init__(self, max_size: int, negative_ttl: float, max_ttl: float):
+        self.max_size = max_size
+        self.negative_ttl = negative_ttl
+        self.max_ttl = max_ttl
+        self._entries: "OrderedDict[str, Tuple[object, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str):
+        """
+        Returns the cached payload, INVALID for a negatively cached token, or None on a miss.
+        """
+        key = self.key(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token: str, payload: Dict):
+        now = time.time()
+        expires_at = min(float(payload.get("exp", now + self.max_ttl)), now + self.max_ttl)
+        self._store(token, payload, expires_at)
+
+    def put_invalid(self, token: str):
+        self._store(token, INVALID, time.time() + self.negative_ttl)
+
+    def _store(self, token: str, value: object, expires_at: float):
+        key = self.key(token)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class RateLimitedLog:
+    """
+    Emits at most one log line per `interval` seconds and reports how many were suppressed.
+    """
+
+    def __init__(self, log_fn, interval: float):
+        self._log_fn = log_fn
+        self.interval = interval
+        self._last: Optional[float] = None
+        self._suppressed = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, message: str):
+        now = time.time()
+        with self._lock:
+            if self._last is not None and now - self._last < self.interval:
+                self._suppressed += 1
+                return
+            suppressed, self._suppressed, self._last = self._suppressed, 0, now
+        if suppressed:
+            message = f"{message} ({suppressed} similar messages suppressed)"
+        self._log_fn(message)
@@ -1,8 +1,48 @@
+import os
+
 from celery import Celery
+from celery.signals import setup_logging
+
+from backend.src.logging_config import configure_logging
+from backend.src.parameters import REDIS_URL, ARCHIVE_INTERVAL, INTERACTION_FLUSH_INTERVAL
 
 celery = Celery(
     "battle_command_ai",
-    broker="redis://localhost:6379/0",
-    backend="redis://localhost:6379/0",
+    broker=REDIS_URL,
+    backend=REDIS_URL,
     include=["backend.tasks.tasks"]
-)
\ No newline at end of file
+)
+
+celery.conf.update(
+    # Model calls are long, hand them out one at a time and only ack once done
+    task_acks_late=True,
+    worker_prefetch_multiplier=1,
+    task_track_started=True,
+    result_expires=3600,
+    # Keep generation on its own queue so slow model calls don't hold up logging tasks
+    task_routes={
+        "backend.tasks.tasks.generate_reply_task": {"queue": "generation"},
+        "backend.tasks.tasks.process_image_task": {"queue": "generation"},
+        "backend.tasks.tasks.prefetch_opponent_plan_task": {"queue": "generation"},
+        "backend.tasks.tasks.summarize_battle_task": {"queue": "generation"},
+    },
+    worker_concurrency=int(os.environ.get("CELERY_CONCURRENCY", 8)),
+    beat_schedule={
+        "flush-interactions": {
+            "task": "backend.tasks.tasks.flush_interactions_task",
+            "schedule": INTERACTION_FLUSH_INTERVAL,
+        },
+        "archive-battles": {
+            "task": "backend.tasks.tasks.archive_battles_task",
+            "schedule": ARCHIVE_INTERVAL,
+        },
+    },
+)
+
+
+@setup_logging.connect
+def setup_worker_logging(**_):
+    """
+    Workers log like the web app (JSON lines through a background thread) instead of Celery's own setup.
+    """
+    configure_logging()
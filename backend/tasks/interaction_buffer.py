@@ -0,0 +1,178 @@
+import json
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from redis import Redis
+from sqlalchemy import insert
+
+from backend.models.Interaction import Interaction
+
+log = logging.getLogger(__name__)
+
+BUFFER_KEY = "interactions:buffer"
+DEAD_LETTER_KEY = "interactions:dead_letter"
+STATS_KEY = "interactions:stats"
+FLUSH_LOCK_KEY = "interactions:flush_lock"
+# Extended before every batch, so only a flusher that stopped making progress loses the lock
+FLUSH_LOCK_SECONDS = 300
+
+# KEYS[1] lock, ARGV[1] token of the holder. Deletes the lock only if it is still held with that token.
+_RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# KEYS[1] lock, ARGV token, seconds. Extends the lock if it is still held with that token, returns 0 if not.
+_EXTEND_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def buffer_interaction(redis: Redis, user_id: str, user_message: str, response: str, interaction_type: str) -> int:
+    """
+    Queues an interaction row for the next bulk insert. Returns the number of buffered rows.
+    """
+    row = {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "type": interaction_type,
+        "user_input": user_message,
+        "llm_output": response,
+        "timestamp": datetime.now().isoformat(),
+    }
+    return redis.rpush(BUFFER_KEY, json.dumps(row))
+
+
+def _to_row(raw: bytes) -> Dict:
+    row = json.loads(raw)
+    row["id"] = uuid.UUID(row["id"])
+    row["user_id"] = uuid.UUID(row["user_id"])
+    row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+    return row
+
+
+def _parse_rows(raw_rows: List[bytes]) -> Tuple[List[Tuple[bytes, Dict]], List[bytes]]:
+    """
+    Returns the (raw, row) pairs of the rows that parse and the raw rows that do not.
+    """
+    parsed, malformed = [], []
+    for raw in raw_rows:
+        try:
+            parsed.append((raw, _to_row(raw)))
+        except (ValueError, KeyError, TypeError) as e:
+            log.error(f"Malformed interaction row {raw[:200]!r}: {e}")
+            malformed.append(raw)
+    return parsed, malformed
+
+
+def _insert_with_retry(db, rows: List[Dict], retries: int):
+    for attempt in range(retries + 1):
+        try:
+            # A single multi-row INSERT (SQLAlchemy batches executemany into VALUES lists)
+            db.session.execute(insert(Interaction), rows)
+            db.session.commit()
+            return
+        except Exception as e:
+            db.session.rollback()
+            if attempt == retries:
+                raise
+            delay = 0.5 * 2 ** attempt
+            log.warning(f"Interaction flush failed ({e}), retrying in {delay}s")
+            time.sleep(delay)
+
+
+def _insert_one_by_one(db, parsed: List[Tuple[bytes, Dict]]) -> List[bytes]:
+    """
+    Inserts the rows of a failed batch one at a time. Returns the raw rows that still fail.
+    """
+    failed = []
+    for raw, row in parsed:
+        try:
+            db.session.execute(insert(Interaction), [row])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            log.error(f"Failed to insert interaction row {row['id']}: {e}")
+            failed.append(raw)
+    return failed
+
+
+def flush_interactions(redis: Redis, db, batch_size: int, retries: int) -> int:
+    """
+    Drains the buffer into the interactions table in batches of `batch_size` rows.
+    Rows are only trimmed from the buffer once their batch is committed (or dead-lettered),
+    so a crashed flush leaves them in place for the next one. A batch that still fails after `retries`
+    is inserted row by row, only the rows that fail on their own (or do not parse) are dead-lettered.
+    Returns the number of rows inserted.
+    """
+    # One flusher at a time, otherwise two workers would insert the same rows. The lock holds a token so
+    # a flusher only extends or releases its own lock, never one taken by another flusher after it expired.
+    token = uuid.uuid4().hex
+    if not redis.set(FLUSH_LOCK_KEY, token, nx=True, ex=FLUSH_LOCK_SECONDS):
+        return 0
+    extend_lock = redis.register_script(_EXTEND_LOCK)
+    inserted = 0
+    try:
+        while True:
+            if not extend_lock(keys=[FLUSH_LOCK_KEY], args=[token, FLUSH_LOCK_SECONDS]):
+                log.warning("Interaction flush lock expired, leaving the remaining rows to the next flush")
+                break
+            raw_rows = redis.lrange(BUFFER_KEY, 0, batch_size - 1)
+            if not raw_rows:
+                break
+            start = time.perf_counter()
+            parsed, dead = _parse_rows(raw_rows)
+            try:
+                if parsed:
+                    _insert_with_retry(db, [row for _, row in parsed], retries)
+            except Exception as e:
+                log.error(f"Inserting {len(parsed)} interaction rows failed after {retries} retries ({e}), "
+                          f"inserting them one at a time")
+                dead.extend(_insert_one_by_one(db, parsed))
+            rows = len(raw_rows) - len(dead)
+            if dead:
+                log.error(f"Dead-lettering {len(dead)} interaction rows")
+                redis.rpush(DEAD_LETTER_KEY, *dead)
+                redis.hincrby(STATS_KEY, "rows_dead_lettered", len(dead))
+            if rows:
+                inserted += rows
+                record_flush(redis, rows, time.perf_counter() - start)
+            redis.ltrim(BUFFER_KEY, len(raw_rows), -1)
+            if len(raw_rows) < batch_size:
+                break
+    finally:
+        redis.register_script(_RELEASE_LOCK)(keys=[FLUSH_LOCK_KEY], args=[token])
+    return inserted
+
+
+def record_flush(redis: Redis, rows: int, elapsed: float):
+    rows_per_second = rows / elapsed if elapsed else float(rows)
+    pipe = redis.pipeline()
+    pipe.hincrby(STATS_KEY, "flushes", 1)
+    pipe.hincrby(STATS_KEY, "rows_flushed", rows)
+    pipe.hincrbyfloat(STATS_KEY, "flush_seconds_total", elapsed)
+    pipe.hset(STATS_KEY, mapping={
+        "last_flush_rows": rows,
+        "last_flush_ms": round(elapsed * 1000, 3),
+        "last_rows_per_second": round(rows_per_second, 1),
+    })
+    pipe.execute()
+    log.info(f"Flushed {rows} interactions in {elapsed * 1000:.1f}ms ({rows_per_second:.0f} rows/s)")
+
+
+def flush_stats(redis: Redis) -> Dict[str, float]:
+    """
+    Throughput counters of the interaction flush plus the current buffer and dead-letter sizes.
+    """
+    stats = {key.decode(): float(value) for key, value in redis.hgetall(STATS_KEY).items()}
+    stats["buffered_rows"] = redis.llen(BUFFER_KEY)
+    stats["dead_lettered_rows"] = redis.llen(DEAD_LETTER_KEY)
+    return stats
@@ -1,19 +1,178 @@
+from celery.signals import worker_process_init
+from sqlalchemy import select, update
+
+from backend.src.admission import admission
 from backend.src.app import app as source
-from backend.models.Interaction import Interaction
+from backend.models.Battle import Battle
+from backend.models.BattleMessage import BattleMessage
+from backend.src.battle_cache import battle_cache
+from backend.src.concurrency import GenerationBusy
+from backend.src.opponent_plan import plan_cache
+from backend.src.parameters import ARCHIVE_BATCH_SIZE, INTERACTION_FLUSH_SIZE, INTERACTION_FLUSH_RETRIES
 from backend.tasks.celery_worker import celery
+from backend.tasks.interaction_buffer import buffer_interaction, flush_interactions
+
+@worker_process_init.connect
+def reset_db_pool(**_):
+    """
+    Pool connections must not be shared with the parent process after the fork.
+    """
+    source.after_fork()
+
 
 @celery.task
 def log_interaction_task(user_id, user_message, response, interaction_type="text"):
+    """
+    Buffers the interaction row in Redis, flush_interactions_task writes buffered rows in bulk.
+    """
+    buffered = buffer_interaction(source.redis, user_id, user_message, response, interaction_type)
+    if buffered % INTERACTION_FLUSH_SIZE == 0:
+        # A full batch is waiting, don't wait for the periodic flush
+        flush_interactions_task.delay()
+
+
+@celery.task
+def flush_interactions_task():
+    """
+    Bulk inserts the buffered interaction rows, runs periodically (see beat_schedule) and on full batches.
+    """
+    with source.flask.app_context():
+        return flush_interactions(source.redis, source.db, INTERACTION_FLUSH_SIZE, INTERACTION_FLUSH_RETRIES)
+
+
+@celery.task
+def archive_battles_task():
+    """
+    Moves the messages of archived and inactive battles to cold storage, runs periodically (see beat_schedule).
+    """
+    from backend.src.archive import archive_battles
+
+    with source.flask.app_context():
+        return archive_battles(ARCHIVE_BATCH_SIZE)
+
+
+@celery.task
+def summarize_battle_task(battle_id, through_seq):
+    """
+    Folds the messages in [battle.summary_seq, through_seq) into the battle's rolling summary.
+    """
+    with source.flask.app_context():
+        db = source.db
+        battle = db.session.get(Battle, battle_id)
+        if battle is None or battle.summary_seq >= through_seq:
+            return
+        base_seq = battle.summary_seq
+        messages = db.session.execute(
+            select(BattleMessage.creator, BattleMessage.message)
+            .where(BattleMessage.battle_id == battle.id, BattleMessage.seq >= base_seq, BattleMessage.seq < through_seq)
+            .order_by(BattleMessage.seq)
+        ).all()
+        if not messages:
+            return
+        summary = source.gen_client.summarize(battle.log_summary, [(creator, message) for creator, message in messages])
+        # Only apply if no other summary landed in the meantime
+        applied = db.session.execute(
+            update(Battle)
+            .where(Battle.id == battle.id, Battle.summary_seq == base_seq)
+            .values(log_summary=summary, summary_seq=through_seq)
+        ).rowcount
+        db.session.commit()
+        if applied:
+            battle_cache.invalidate(battle.id)
+        source.log.info(f"Summarized {len(messages)} messages of battle {battle_id}")
+
+
+@celery.task
+def prefetch_opponent_plan_task(battle_id, battle_round):
+    """
+    Generates the opponent's plan for its next turn while the player is still playing theirs.
+    The claim taken by BattleState.schedule_opponent_plan is released if generation fails.
+    The plan is speculative: it only takes a generation slot that is free right away (see admission.py),
+    and is skipped rather than queued or retried when chat turns have them all.
+    """
+    from backend.src.battle_state import BattleState, BattleNotFound
+
+    with source.flask.app_context():
+        try:
+            battle_state = BattleState(battle_id)
+            if battle_state.battle_round != battle_round:
+                # The game moved on to another round before the task ran
+                plan_cache.release(battle_id, battle_round)
+                return
+            with admission.slot(battle_state.user_id, timeout=0):
+                plan = source.gen_client.plan_opponent_turn(battle_state)
+        except BattleNotFound:
+            plan_cache.release(battle_id, battle_round)
+            return
+        except GenerationBusy as e:
+            plan_cache.release(battle_id, battle_round)
+            source.log.info(f"Skipped the opponent plan of battle {battle_id}, round {battle_round}: {e}")
+            return
+        except Exception:
+            plan_cache.release(battle_id, battle_round)
+            raise
+    plan_cache.put(battle_id, battle_round, plan, battle_state.message_seq)
+    source.log.info(f"Prefetched the opponent plan of battle {battle_id}, round {battle_round}")
+
+
+@celery.task
+def process_image_task(upload_id):
+    """
+    Downscales an uploaded photo and has the multimodal model describe it. An analysis of the same
+    photo that finished since the upload was registered is reused instead.
+    """
+    from datetime import datetime
+    from backend.models.ImageUpload import ImageUpload
+    from backend.src import image_store
+
     with source.flask.app_context():
         db = source.db
-        new_interaction = Interaction(
-            user_id=user_id,
-            type=interaction_type,
-            user_input=user_message,
-            llm_output=response
-        )
+        upload = db.session.get(ImageUpload, upload_id)
+        if upload is None or upload.status == image_store.DONE:
+            return
+        upload.status = image_store.PROCESSING
+        db.session.commit()
         try:
-            db.session.add(new_interaction)
-            db.session.commit()
+            analysis = db.session.execute(
+                select(ImageUpload.analysis)
+                .where(ImageUpload.sha256 == upload.sha256, ImageUpload.status == image_store.DONE).limit(1)
+            ).scalar()
+            if analysis is None:
+                image_bytes, mime_type = image_store.prepare_for_model(upload.sha256, upload.content_type)
+                analysis = source.gen_client.analyze_image(image_bytes, mime_type)
         except Exception as e:
             db.session.rollback()
+            upload.status, upload.error, upload.processed_at = image_store.FAILED, str(e), datetime.now()
+            db.session.commit()
+            raise
+        upload.status, upload.analysis, upload.processed_at = image_store.DONE, analysis, datetime.now()
+        db.session.commit()
+        user_id, filename = str(upload.user_id), upload.filename or upload.sha256
+    log_interaction_task.delay(user_id, filename, analysis, "image")
+    source.log.info(f"Analyzed image upload {upload_id}")
+
+
+@celery.task(bind=True)
+def generate_reply_task(self, battle_id, user_id, user_message):
+    """
+    Generates the opponent's reply outside the web worker, used when generation runs in 'celery' mode.
+    The returned dict is what the job status endpoint hands back to the client.
+    Waits for a deployment wide generation slot like inline turns do, see admission.py; if none frees up
+    the task is retried once the queue should have drained.
+    """
+    from backend.src.battle_state import BattleState
+
+    with source.flask.app_context():
+        battle_state = BattleState(battle_id)
+        try:
+            with admission.slot(user_id):
+                response = source.gen_client.generate(content=user_message, battle_state=battle_state)
+        except GenerationBusy as e:
+            raise self.retry(countdown=e.retry_after, exc=e)
+        updated_battle_log = battle_state.update_battle_log(user_message=user_message, ai_response=response)
+    log_interaction_task.delay(user_id, user_message, response, "text")
+    return {
+        "user_id": user_id,
+        "message": "Text interaction processed successfully",
+        "battle_log": updated_battle_log
+    }
@@ -0,0 +1,133 @@
+"""
+Shared fixtures. Tests going through the API need a database: they run against TEST_DATABASE_URL (tables are
+created if missing, each test adds its own user and battles) and are skipped when it is not set, e.g.
+
+    TEST_DATABASE_URL=postgresql+psycopg2://postgres:@localhost/tabletop_test python -m pytest backend/tests
+
+Redis is used when it is reachable at REDIS_URL, the app falls back to the database without it.
+The model is replaced by StubGenClient.
+"""
+import datetime
+import os
+import uuid
+from typing import Dict, Iterator, List
+
+import jwt
+import pytest
+
+os.environ.setdefault("JWT_SECRET", "test-secret-of-at-least-32-bytes!")
+os.environ.setdefault("GOOGLEAI_API_KEY", "test-key")
+os.environ.setdefault("CONTEXT_CACHE_ENABLED", "false")
+os.environ.setdefault("LOG_FILE", "")
+# The models need a DATABASE_URL to be imported, tests not going through the API never connect
+os.environ["DATABASE_URL"] = os.environ.get("TEST_DATABASE_URL", "sqlite://")
+
+
+class StubGenClient:
+    """
+    Answers chat turns without calling Gemini: 'reply to <message>', streamed as STREAM_CHUNKS.
+    """
+    STREAM_CHUNKS = ["Advancing ", "on the ", "objective."]
+
+    def __init__(self):
+        self.calls: List[str] = []
+
+    def generate(self, content: str, battle_state, **kwargs) -> str:
+        self.calls.append(content)
+        return f"reply to {content}"
+
+    def generate_stream(self, content: str, battle_state, **kwargs) -> Iterator[str]:
+        self.calls.append(content)
+        yield from self.STREAM_CHUNKS
+
+    def summarize(self, previous_summary, messages) -> str:
+        return f"{len(messages)} messages"
+
+
+@pytest.fixture(scope="session")
+def app():
+    if not os.environ.get("TEST_DATABASE_URL"):
+        pytest.skip("TEST_DATABASE_URL is not set")
+    from backend.src.app import app as source
+    from backend.src.factory import create_app
+
+    flask = create_app()
+    with flask.app_context():
+        source.db.create_all()
+    return flask
+
+
+@pytest.fixture
+def redis(app):
+    from redis import RedisError
+    from backend.src.app import app as source
+
+    try:
+        source.redis.ping()
+    except RedisError as e:
+        pytest.skip(f"Redis is not reachable: {e}")
+    return source.redis
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def gen_client(monkeypatch) -> StubGenClient:
+    from backend.src.app import app as source
+
+    stub = StubGenClient()
+    monkeypatch.setattr(source, "_gen_client", stub)
+    return stub
+
+
+@pytest.fixture
+def logged_interactions(monkeypatch) -> List[tuple]:
+    """
+    Interactions the routes hand to Celery, recorded instead of queued.
+    """
+    from backend.tasks.tasks import log_interaction_task
+
+    logged = []
+    monkeypatch.setattr(log_interaction_task, "delay", lambda *args: logged.append(args))
+    return logged
+
+
+def make_user(app) -> str:
+    from backend.models.User import User
+    from backend.src.app import app as source
+
+    with app.app_context():
+        name = f"player-{uuid.uuid4().hex[:12]}"
+        user = User(id=uuid.uuid4(), username=name, email=f"{name}@example.com", created_at=datetime.datetime.now())
+        source.db.session.add(user)
+        source.db.session.commit()
+        return str(user.id)
+
+
+def auth_headers(user_id: str) -> Dict[str, str]:
+    token = jwt.encode({"user_id": user_id,
+                        "exp": datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)},
+                       os.environ["JWT_SECRET"], algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def user_id(app) -> str:
+    return make_user(app)
+
+
+@pytest.fixture
+def headers(user_id) -> Dict[str, str]:
+    return auth_headers(user_id)
+
+
+@pytest.fixture
+def battle_id(client, user_id, headers) -> str:
+    response = client.post("/api/battles", headers=headers, json={
+        "playArea": {"width": 44, "height": 60}, "userId": user_id,
+        "playerArmy": "Tau", "opponentArmy": "Orks", "battleName": "Test battle"})
+    assert response.status_code == 201, response.get_data(as_text=True)
+    return response.get_json()["id"]
@@ -0,0 +1,76 @@
+import pytest
+
+from backend.src.battle_cache import BattleCache, battle_cache
+
+
+def entry(seq: int) -> dict:
+    return {"creator": "user" if seq % 2 == 0 else "ai", "message": f"message {seq}", "timestamp": "2025-01-01T00:00:00"}
+
+
+@pytest.fixture
+def tail_size(monkeypatch) -> int:
+    monkeypatch.setattr("backend.src.battle_cache.BATTLE_CACHE_MESSAGES", 4)
+    return 4
+
+
+def test_append_messages_keeps_bounded_tail(tail_size):
+    snapshot = {"message_seq": 4, "summary_seq": 0, "log_start_seq": 0, "messages": [[seq, entry(seq)] for seq in range(4)]}
+
+    assert BattleCache.append_messages(snapshot, 4, [entry(4), entry(5)])
+
+    assert snapshot["message_seq"] == 6
+    assert snapshot["log_start_seq"] == 2
+    assert [seq for seq, _ in snapshot["messages"]] == [2, 3, 4, 5]
+
+
+def test_append_messages_drops_summarized_messages(tail_size):
+    snapshot = {"message_seq": 2, "summary_seq": 2, "log_start_seq": 0, "messages": [[0, entry(0)], [1, entry(1)]]}
+
+    assert BattleCache.append_messages(snapshot, 2, [entry(2), entry(3)])
+
+    assert snapshot["log_start_seq"] == 2
+    assert [seq for seq, _ in snapshot["messages"]] == [2, 3]
+
+
+def test_append_messages_after_another_turn():
+    snapshot = {"message_seq": 2, "summary_seq": 0, "messages": [[0, entry(0)], [1, entry(1)]]}
+
+    assert not BattleCache.append_messages(snapshot, 4, [entry(4), entry(5)])
+
+
+def post_turns(client, user_id, battle_id, headers, count: int) -> dict:
+    battle_log = None
+    for turn in range(count):
+        response = client.post("/api/interactions/text/stream", headers=headers,
+                               json={"user_id": user_id, "battle_id": battle_id, "text": f"turn {turn}"})
+        assert response.status_code == 200
+        battle_log = response.get_json()["battle_log"]
+    return battle_log
+
+
+def test_cached_battle_keeps_tail_and_serves_whole_log(redis, tail_size, client, gen_client, logged_interactions,
+                                                       user_id, headers, battle_id):
+    battle_log = post_turns(client, user_id, battle_id, headers, 5)
+
+    snapshot, _ = battle_cache.lookup(battle_id)
+    assert snapshot["log_start_seq"] == 6
+    assert [seq for seq, _ in snapshot["messages"]] == [6, 7, 8, 9]
+    assert list(battle_log) == [str(seq) for seq in range(10)]
+    response = client.get(f"/api/battles/{battle_id}", headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()["battle_log"] == battle_log
+    assert [entry["message"] for entry in battle_log.values()][:2] == ["turn 0", "reply to turn 0"]
+
+
+def test_whole_log_after_cache_miss(redis, tail_size, client, gen_client, logged_interactions, user_id, headers,
+                                    battle_id):
+    battle_log = post_turns(client, user_id, battle_id, headers, 3)
+    battle_cache.invalidate(battle_id)
+
+    response = client.get(f"/api/battles/{battle_id}", headers=headers)
+    snapshot, _ = battle_cache.lookup(battle_id)
+
+    assert response.get_json()["battle_log"] == battle_log
+    assert [seq for seq, _ in snapshot["messages"]] == [2, 3, 4, 5]
+    fields_only = client.get(f"/api/battles/{battle_id}?fields=id,battle_name", headers=headers)
+    assert fields_only.get_json() == {"id": battle_id, "battle_name": "Test battle"}
@@ -0,0 +1,36 @@
+from backend.tests.conftest import auth_headers, make_user
+
+
+def test_list_own_battles(client, user_id, headers, battle_id):
+    response = client.get(f"/api/battles?user_id={user_id}&include=battle_log", headers=headers)
+
+    assert response.status_code == 200
+    assert [battle["id"] for battle in response.get_json()] == [battle_id]
+
+
+def test_list_battles_of_another_user(app, client, user_id, battle_id):
+    other_headers = auth_headers(make_user(app))
+
+    response = client.get(f"/api/battles?user_id={user_id}&include=battle_log", headers=other_headers)
+
+    assert response.status_code == 403
+    assert "battle_log" not in response.get_data(as_text=True)
+
+
+def test_archive_and_restore_battle(client, headers, battle_id):
+    archived = client.put(f"/api/battles/{battle_id}/archive", headers=headers)
+    restored = client.put(f"/api/battles/{battle_id}/archive", headers=headers, json={"archived": False})
+
+    assert archived.status_code == 200
+    assert archived.get_json()["archived"] is True
+    assert restored.status_code == 200
+    assert restored.get_json()["archived"] is False
+
+
+def test_archive_rejects_non_boolean(client, headers, battle_id):
+    for value in ["false", "0", None, 1]:
+        response = client.put(f"/api/battles/{battle_id}/archive", headers=headers, json={"archived": value})
+
+        assert response.status_code == 400
+    battle = client.get(f"/api/battles/{battle_id}?fields=archived", headers=headers).get_json()
+    assert battle["archived"] is False
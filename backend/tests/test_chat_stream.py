@@ -0,0 +1,49 @@
+import json
+import uuid
+from typing import List, Tuple
+
+from backend.tests.conftest import StubGenClient
+
+SSE_HEADERS = {"Accept": "text/event-stream"}
+
+
+def parse_events(body: str) -> List[Tuple[str, dict]]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def post_turn(client, user_id, battle_id, headers, text="Move the Crisis suits up"):
+    response = client.post("/api/interactions/text/stream", headers={**headers, **SSE_HEADERS},
+                           json={"user_id": user_id, "battle_id": battle_id, "text": text})
+    body = response.get_data(as_text=True)
+    response.close()
+    return response, parse_events(body)
+
+
+def test_streamed_turn(client, gen_client, logged_interactions, user_id, headers, battle_id):
+    response, events = post_turn(client, user_id, battle_id, headers)
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    assert [name for name, _ in events] == ["chunk"] * len(StubGenClient.STREAM_CHUNKS) + ["done"]
+    assert [data["text"] for _, data in events[:-1]] == StubGenClient.STREAM_CHUNKS
+    battle_log = events[-1][1]["battle_log"]
+    assert [(entry["creator"], entry["message"]) for entry in battle_log.values()] == [
+        ("user", "Move the Crisis suits up"), ("ai", "".join(StubGenClient.STREAM_CHUNKS))]
+    assert len(logged_interactions) == 1
+
+
+def test_streamed_turn_replayed_for_idempotency_key(redis, client, gen_client, logged_interactions, user_id, headers,
+                                                    battle_id):
+    headers = {**headers, "Idempotency-Key": uuid.uuid4().hex}
+    first, first_events = post_turn(client, user_id, battle_id, headers)
+    retry, retry_events = post_turn(client, user_id, battle_id, headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.headers.get("Idempotent-Replayed") == "true"
+    assert retry_events[0] == ("chunk", {"text": "".join(StubGenClient.STREAM_CHUNKS)})
+    assert retry_events[-1] == first_events[-1]
+    assert len(gen_client.calls) == 1
@@ -0,0 +1,153 @@
+from typing import Dict, List
+
+import pytest
+
+from backend.src.battle_state import BattleState
+from backend.src.context_builder import ContextBuilder, LogEntry
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+def make_history(count: int, words: int = 10, start: int = 0) -> List[LogEntry]:
+    """
+    Alternating user and ai messages of `words` words each.
+    """
+    return [(seq, {"creator": "user" if seq % 2 == 0 else "ai", "message": " ".join([f"m{seq}"] * words)})
+            for seq in range(start, start + count)]
+
+
+def turns(window) -> List[tuple]:
+    return [(content.role, [part.text for part in content.parts]) for content in window.contents]
+
+
+def test_token_budget_keeps_newest_messages():
+    builder = ContextBuilder(token_budget=45, max_messages=40, count_tokens=count_words)
+
+    window = builder.build(make_history(10), "charge")
+
+    # 4 messages of 10 words and the new one fit, the oldest of them is a user message
+    assert window.first_seq == window.budget_start_seq == 6
+    assert window.tokens == 41
+    assert [role for role, _ in turns(window)] == ["user", "model", "user", "model", "user"]
+    assert turns(window)[-1] == ("user", ["charge"])
+
+
+def test_max_messages_limits_window():
+    builder = ContextBuilder(token_budget=10000, max_messages=3, count_tokens=count_words)
+
+    window = builder.build(make_history(10), "charge")
+
+    # The newest 3 are ai, user, ai: the leading ai message is dropped so the conversation starts with the player
+    assert window.budget_start_seq == 8
+    assert [role for role, _ in turns(window)] == ["user", "model", "user"]
+
+
+def test_no_history_fits():
+    builder = ContextBuilder(token_budget=5, max_messages=40, count_tokens=count_words)
+
+    window = builder.build(make_history(4), "charge")
+
+    assert window.first_seq is None
+    assert window.budget_start_seq == 4
+    assert turns(window) == [("user", ["charge"])]
+
+
+def test_combat_results_are_sent_as_user_turns():
+    builder = ContextBuilder(token_budget=10000, max_messages=40, count_tokens=count_words)
+    history = [
+        (0, {"creator": "user", "message": "Shoot the Boyz"}),
+        (1, {"creator": "combat", "message": "[Combat engine] 3.2 models slain on average"}),
+        (2, {"creator": "ai", "message": "Four Boyz fall"}),
+        (3, {"creator": "combat", "message": "[Combat engine] 1.1 models slain on average"}),
+    ]
+
+    window = builder.build(history, "Now the Crisis suits", preamble="Battle instructions")
+
+    assert turns(window) == [
+        ("user", ["Battle instructions", "Shoot the Boyz", "[Combat engine] 3.2 models slain on average"]),
+        ("model", ["Four Boyz fall"]),
+        ("user", ["[Combat engine] 1.1 models slain on average", "Now the Crisis suits"]),
+    ]
+
+
+def test_unsummarized_messages_stay_in_window():
+    builder = ContextBuilder(token_budget=45, max_messages=40, count_tokens=count_words, max_unsummarized=10)
+
+    window = builder.build(make_history(10), "charge")
+
+    # Messages 0-5 are beyond the budget, but no summary covers them yet
+    assert window.budget_start_seq == 6
+    assert window.first_seq == 0
+    assert window.tokens == 101
+    assert builder.history_limit == 50
+
+
+def test_unsummarized_messages_are_capped():
+    builder = ContextBuilder(token_budget=45, max_messages=40, count_tokens=count_words, max_unsummarized=3)
+
+    window = builder.build(make_history(10), "charge")
+
+    # The 3 newest of messages 0-5 start with an ai message, which is dropped
+    assert window.budget_start_seq == 6
+    assert window.first_seq == 4
+
+
+class SummaryTask:
+    def __init__(self):
+        self.scheduled = []
+
+    def delay(self, battle_id, through_seq):
+        self.scheduled.append(through_seq)
+
+
+@pytest.fixture
+def summary_task(monkeypatch) -> SummaryTask:
+    import backend.tasks.tasks as tasks
+
+    task = SummaryTask()
+    monkeypatch.setattr(tasks, "summarize_battle_task", task)
+    return task
+
+
+def battle_state(messages: List[LogEntry], summary_seq: int = 0) -> BattleState:
+    snapshot: Dict = {"messages": [[seq, entry] for seq, entry in messages], "summary_seq": summary_seq,
+                      "log_summary": None, "message_seq": len(messages)}
+    return BattleState.from_snapshot("00000000-0000-0000-0000-000000000001", snapshot)
+
+
+def test_summary_scheduled_through_budget_start(monkeypatch, summary_task):
+    monkeypatch.setattr("backend.src.battle_state.SUMMARY_MIN_MESSAGES", 6)
+    builder = ContextBuilder(token_budget=45, max_messages=40, count_tokens=count_words, max_unsummarized=8)
+
+    # 4 messages beyond the budget, they stay in the window
+    state = battle_state(make_history(8))
+    state.context_start_seq = builder.build(state.recent_messages(builder.history_limit), "charge").budget_start_seq
+    state.schedule_summary()
+    assert summary_task.scheduled == []
+
+    state = battle_state(make_history(10))
+    state.context_start_seq = builder.build(state.recent_messages(builder.history_limit), "charge").budget_start_seq
+    state.schedule_summary()
+    assert summary_task.scheduled == [6]
+
+
+def test_every_message_is_summarized_or_sent(monkeypatch, summary_task):
+    """
+    Turn after turn, each message is either covered by the summary or sent to the model.
+    """
+    monkeypatch.setattr("backend.src.battle_state.SUMMARY_MIN_MESSAGES", 6)
+    builder = ContextBuilder(token_budget=45, max_messages=40, count_tokens=count_words, max_unsummarized=12)
+    summary_seq = 0
+    for count in range(2, 60, 2):
+        state = battle_state(make_history(count), summary_seq)
+        window = builder.build(state.recent_messages(builder.history_limit), "charge")
+        # The oldest message the summary does not cover is the first one sent
+        assert window.first_seq == summary_seq
+        state.context_start_seq = window.budget_start_seq
+        state.schedule_summary()
+        if summary_task.scheduled:
+            # The summary lands before the next turn
+            summary_seq = summary_task.scheduled.pop()
+    assert summary_seq > 0
@@ -0,0 +1,104 @@
+import time
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from backend.src.instructions import CACHE_KEY, LOCK_KEY, ContextCache
+
+
+class Caches:
+    """
+    Stands in for the Gemini cached-content API, counting the calls.
+    """
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.created, self.updated = [], []
+
+    def create(self, model, config):
+        self.created.append(config.display_name)
+        if self.fail:
+            raise ValueError("Cached content is too small")
+        return SimpleNamespace(name=f"cachedContents/{len(self.created)}")
+
+    def update(self, name, config):
+        self.updated.append(name)
+
+
+@pytest.fixture
+def model(redis) -> str:
+    """
+    A model name of its own, so tests don't share cached content entries.
+    """
+    name = f"model-{uuid.uuid4().hex[:8]}"
+    yield name
+    redis.delete(*redis.keys(f"context_cache:{name}:*"))
+
+
+def make_cache(redis, caches: Caches, **kwargs) -> ContextCache:
+    return ContextCache(SimpleNamespace(caches=caches), ttl_seconds=3600, get_redis=lambda: redis, **kwargs)
+
+
+def test_processes_share_cached_content(redis, model):
+    caches = Caches()
+    # Two processes, each with its own ContextCache
+    first, second = make_cache(redis, caches), make_cache(redis, caches)
+
+    assert first.get(model, "rules", "digest") == "cachedContents/1"
+    assert second.get(model, "rules", "digest") == "cachedContents/1"
+
+    assert len(caches.created) == 1
+
+
+def test_changed_instructions_get_new_cached_content(redis, model):
+    caches = Caches()
+    cache = make_cache(redis, caches)
+
+    assert cache.get(model, "rules", "digest") == "cachedContents/1"
+    assert cache.get(model, "new rules", "new digest") == "cachedContents/2"
+
+
+def test_one_process_refreshes_expiring_content(redis, model):
+    caches = Caches()
+    first, second = make_cache(redis, caches, local_seconds=0), make_cache(redis, caches, local_seconds=0)
+    first.get(model, "rules", "digest")
+    redis.hset(CACHE_KEY.format(model, "digest"), "expires_at", time.time() + 60)
+
+    assert first.get(model, "rules", "digest") == "cachedContents/1"
+    assert second.get(model, "rules", "digest") == "cachedContents/1"
+
+    assert caches.updated == ["cachedContents/1"]
+    assert float(redis.hget(CACHE_KEY.format(model, "digest"), "expires_at")) > time.time() + 3000
+
+
+def test_inline_while_another_process_creates(redis, model):
+    caches = Caches()
+    redis.set(LOCK_KEY.format(model, "digest"), "another process", ex=60)
+
+    assert make_cache(redis, caches).get(model, "rules", "digest") is None
+
+    assert caches.created == []
+
+
+def test_unavailable_cache_is_not_retried_by_other_processes(redis, model):
+    caches = Caches(fail=True)
+
+    assert make_cache(redis, caches).get(model, "rules", "digest") is None
+    assert make_cache(redis, caches).get(model, "rules", "digest") is None
+
+    assert not redis.exists(LOCK_KEY.format(model, "digest"))
+    assert len(caches.created) == 1
+
+
+def test_each_process_caches_without_redis():
+    from redis import Redis
+
+    caches = Caches()
+    unreachable = Redis.from_url("redis://127.0.0.1:1")
+    cache = make_cache(unreachable, caches)
+
+    assert cache.get("model", "rules", "digest") == "cachedContents/1"
+    assert cache.get("model", "rules", "digest") == "cachedContents/1"
+
+    assert len(caches.created) == 1
@@ -0,0 +1,130 @@
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import pytest
+from google.genai import types
+
+from backend.src import combat
+from backend.src.gen_client import GenClient, EmptyReply
+from backend.src.instructions import static_instructions
+from backend.src.parameters import COMBAT_TOOL_MAX_ROUNDS
+
+CACHED_CONFIG = types.GenerateContentConfig(cached_content="cachedContents/instructions")
+
+
+def text_response(text: str) -> types.GenerateContentResponse:
+    return types.GenerateContentResponse(candidates=[types.Candidate(
+        content=types.Content(role="model", parts=[types.Part(text=text)]), finish_reason="STOP")])
+
+
+def call_response() -> types.GenerateContentResponse:
+    call = types.FunctionCall(name=combat.TOOL_NAME, args={})
+    return types.GenerateContentResponse(candidates=[types.Candidate(
+        content=types.Content(role="model", parts=[types.Part(function_call=call)]), finish_reason="STOP")])
+
+
+def blocked_response() -> types.GenerateContentResponse:
+    return types.GenerateContentResponse(candidates=[types.Candidate(finish_reason="SAFETY")])
+
+
+class ToolLoopingModels:
+    """
+    Stands in for the Gemini models API with a model that calls the combat engine whenever it is allowed to,
+    and only replies with text once function calling is disabled.
+    """
+
+    def __init__(self, reply: Optional[types.GenerateContentResponse] = None):
+        self.reply = reply or text_response("Done")
+        self.requests: List[tuple] = []
+
+    def generate_content(self, model, contents, config):
+        self.requests.append((contents, config))
+        if config.tool_config and config.tool_config.function_calling_config.mode == types.FunctionCallingConfigMode.NONE:
+            return self.reply
+        return call_response()
+
+    def generate_content_stream(self, model, contents, config):
+        return iter([self.generate_content(model, contents, config)])
+
+
+class ResponseCache:
+    def __init__(self):
+        self.entries: Dict[str, str] = {}
+
+    def key(self, *args) -> str:
+        return "question"
+
+    def get(self, key) -> Optional[str]:
+        return self.entries.get(key)
+
+    def put(self, key, text):
+        self.entries[key] = text
+
+
+def make_client(monkeypatch, models: ToolLoopingModels, config: Optional[types.GenerateContentConfig] = None):
+    """
+    A GenClient on `models`. Requests using cached content lead with the battle instructions, like build_request's.
+    """
+    cache = ResponseCache()
+    client = GenClient(response_cache=cache)
+    config = config or types.GenerateContentConfig()
+
+    def build_request(content, battle_state, stateless=False):
+        parts = [types.Part(text="Battle instructions")] if config.cached_content else []
+        return [types.Content(role="user", parts=[*parts, types.Part(text=content)])], config
+    monkeypatch.setattr(client, "_client", SimpleNamespace(models=models))
+    monkeypatch.setattr(client, "build_request", build_request)
+    return client, cache
+
+
+@pytest.fixture
+def battle_state():
+    return SimpleNamespace(combat_results=(), player_army="Tau", opponent_army="Orks")
+
+
+def test_last_round_disables_function_calls(monkeypatch, battle_state):
+    models = ToolLoopingModels()
+    client, cache = make_client(monkeypatch, models)
+
+    assert client.generate("How many Boyz die?", battle_state) == "Done"
+
+    assert len(models.requests) == COMBAT_TOOL_MAX_ROUNDS + 1
+    assert [config.tool_config for _, config in models.requests[:-1]] == [None] * COMBAT_TOOL_MAX_ROUNDS
+    assert cache.entries == {"question": "Done"}
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_last_round_with_cached_content_goes_inline(monkeypatch, battle_state, stream):
+    models = ToolLoopingModels()
+    client, cache = make_client(monkeypatch, models, CACHED_CONFIG)
+
+    if stream:
+        assert "".join(client.generate_stream("How many Boyz die?", battle_state)) == "Done"
+    else:
+        assert client.generate("How many Boyz die?", battle_state) == "Done"
+
+    assert all(config.cached_content == CACHED_CONFIG.cached_content for _, config in models.requests[:-1])
+    contents, config = models.requests[-1]
+    assert config.cached_content is None
+    assert config.system_instruction == "\n".join([static_instructions(), "Battle instructions"])
+    assert config.tools
+    assert [part.text for part in contents[0].parts] == ["How many Boyz die?"]
+    assert cache.entries == {"question": "Done"}
+
+
+def test_reply_without_text_is_not_cached(monkeypatch, battle_state):
+    client, cache = make_client(monkeypatch, ToolLoopingModels(blocked_response()))
+
+    with pytest.raises(EmptyReply):
+        client.generate("How many Boyz die?", battle_state)
+
+    assert cache.entries == {}
+
+
+def test_stream_without_text_is_not_cached(monkeypatch, battle_state):
+    client, cache = make_client(monkeypatch, ToolLoopingModels(blocked_response()))
+
+    with pytest.raises(EmptyReply):
+        list(client.generate_stream("How many Boyz die?", battle_state))
+
+    assert cache.entries == {}
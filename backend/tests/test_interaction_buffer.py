@@ -0,0 +1,92 @@
+import json
+import uuid
+
+import pytest
+
+from backend.tasks.interaction_buffer import (BUFFER_KEY, DEAD_LETTER_KEY, FLUSH_LOCK_KEY, STATS_KEY,
+                                              buffer_interaction, flush_interactions)
+
+
+@pytest.fixture
+def buffer(redis):
+    """
+    An empty interaction buffer, dead-letter list and flush lock.
+    """
+    keys = [BUFFER_KEY, DEAD_LETTER_KEY, FLUSH_LOCK_KEY, STATS_KEY]
+    redis.delete(*keys)
+    yield redis
+    redis.delete(*keys)
+
+
+@pytest.fixture
+def db(app):
+    from backend.src.app import app as source
+
+    with app.app_context():
+        yield source.db
+
+
+def logged_inputs(db, user_id) -> list:
+    from backend.models.Interaction import Interaction
+
+    rows = db.session.query(Interaction).filter_by(user_id=uuid.UUID(user_id)).order_by(Interaction.timestamp)
+    return [row.user_input for row in rows]
+
+
+def test_flush_inserts_buffered_rows(buffer, db, user_id):
+    for turn in range(3):
+        buffer_interaction(buffer, user_id, f"turn {turn}", "reply", "text")
+
+    assert flush_interactions(buffer, db, batch_size=2, retries=0) == 3
+
+    assert logged_inputs(db, user_id) == ["turn 0", "turn 1", "turn 2"]
+    assert buffer.llen(BUFFER_KEY) == 0
+    assert not buffer.exists(FLUSH_LOCK_KEY)
+
+
+def test_only_bad_rows_are_dead_lettered(buffer, db, user_id):
+    buffer_interaction(buffer, user_id, "turn 0", "reply", "text")
+    # No such user: the foreign key fails the whole batch, then only this row
+    buffer_interaction(buffer, str(uuid.uuid4()), "orphan", "reply", "text")
+    buffer.rpush(BUFFER_KEY, "not json")
+    buffer_interaction(buffer, user_id, "turn 1", "reply", "text")
+
+    assert flush_interactions(buffer, db, batch_size=10, retries=0) == 2
+
+    assert logged_inputs(db, user_id) == ["turn 0", "turn 1"]
+    dead = buffer.lrange(DEAD_LETTER_KEY, 0, -1)
+    assert dead[0] == b"not json"
+    assert json.loads(dead[1])["user_input"] == "orphan"
+    assert int(buffer.hget(STATS_KEY, "rows_dead_lettered")) == 2
+    assert buffer.llen(BUFFER_KEY) == 0
+
+
+def test_flush_skipped_while_locked(buffer, db, user_id):
+    buffer.set(FLUSH_LOCK_KEY, "another flusher", ex=60)
+    buffer_interaction(buffer, user_id, "turn 0", "reply", "text")
+
+    assert flush_interactions(buffer, db, batch_size=10, retries=0) == 0
+
+    assert buffer.llen(BUFFER_KEY) == 1
+    assert buffer.get(FLUSH_LOCK_KEY) == b"another flusher"
+
+
+def test_flush_keeps_lock_taken_after_expiry(buffer, db, user_id, monkeypatch):
+    """
+    A flusher whose lock expired mid-flush neither deletes the lock another flusher took since, nor goes on.
+    """
+    import backend.tasks.interaction_buffer as interaction_buffer
+
+    for turn in range(2):
+        buffer_interaction(buffer, user_id, f"turn {turn}", "reply", "text")
+    insert_with_retry = interaction_buffer._insert_with_retry
+
+    def slow_insert(db, rows, retries):
+        insert_with_retry(db, rows, retries)
+        buffer.set(FLUSH_LOCK_KEY, "another flusher", ex=60)
+    monkeypatch.setattr(interaction_buffer, "_insert_with_retry", slow_insert)
+
+    assert flush_interactions(buffer, db, batch_size=1, retries=0) == 1
+
+    assert buffer.get(FLUSH_LOCK_KEY) == b"another flusher"
+    assert buffer.llen(BUFFER_KEY) == 1
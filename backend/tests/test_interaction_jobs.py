@@ -0,0 +1,54 @@
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from backend.tests.conftest import auth_headers, make_user
+
+
+@pytest.fixture
+def queued_jobs(monkeypatch):
+    """
+    Jobs queued by the chat route, left pending instead of sent to the Celery broker.
+    """
+    from backend.tasks.tasks import generate_reply_task
+
+    jobs = []
+
+    def delay(*args):
+        jobs.append(args)
+        return SimpleNamespace(id=str(uuid.uuid4()))
+    monkeypatch.setattr(generate_reply_task, "delay", delay)
+    return jobs
+
+
+def queue_turn(client, user_id, battle_id, headers) -> str:
+    response = client.post("/api/interactions/text/stream", headers={**headers, "Prefer": "respond-async"},
+                           json={"user_id": user_id, "battle_id": battle_id, "text": "Deep strike the Ghostkeel"})
+    assert response.status_code == 202
+    return response.get_json()["status_url"]
+
+
+def test_owner_polls_pending_job(redis, client, queued_jobs, user_id, headers, battle_id):
+    status_url = queue_turn(client, user_id, battle_id, headers)
+
+    response = client.get(status_url, headers=headers)
+
+    assert response.status_code == 202
+    assert response.get_json()["status"] == "pending"
+    assert len(queued_jobs) == 1
+
+
+def test_job_of_another_user_is_not_found(redis, app, client, queued_jobs, user_id, headers, battle_id):
+    status_url = queue_turn(client, user_id, battle_id, headers)
+
+    response = client.get(status_url, headers=auth_headers(make_user(app)))
+
+    assert response.status_code == 404
+    assert "status" not in response.get_json()
+
+
+def test_unknown_job_is_not_found(redis, client, headers):
+    response = client.get(f"/api/interactions/jobs/{uuid.uuid4()}", headers=headers)
+
+    assert response.status_code == 404
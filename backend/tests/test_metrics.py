@@ -0,0 +1,34 @@
+from collections import defaultdict
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from backend.src.metrics import REQUEST_TIMINGS, instrument_engine_events
+
+
+@pytest.fixture
+def timings():
+    """
+    The time breakdown of a request in progress, outside Flask.
+    """
+    timings = defaultdict(float)
+    token = REQUEST_TIMINGS.set(timings)
+    yield timings
+    REQUEST_TIMINGS.reset(token)
+
+
+def test_failed_queries_leave_nothing_on_the_connection(timings):
+    engine = create_engine("sqlite://")
+    instrument_engine_events(engine)
+
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute(text("SELECT * FROM missing"))
+        failed = timings["db"]
+        conn.execute(text("SELECT 1"))
+
+        assert "query_start" not in conn.info
+    assert failed > 0
+    assert timings["db"] > failed
@@ -0,0 +1,50 @@
+import pytest
+
+from backend.src.opponent_plan import plan_cache
+
+
+@pytest.fixture
+def planner(monkeypatch, gen_client):
+    """
+    Battles whose opponent plan was asked for, the plan is 'plan of round <n>'.
+    """
+    planned = []
+
+    def plan_opponent_turn(battle_state):
+        planned.append(battle_state.battle_id)
+        return f"plan of round {battle_state.battle_round}"
+    monkeypatch.setattr(gen_client, "plan_opponent_turn", plan_opponent_turn, raising=False)
+    return planned
+
+
+def prefetch(battle_id):
+    from backend.src.battle_state import BattleState
+    from backend.src.app import app as source
+    from backend.tasks.tasks import prefetch_opponent_plan_task
+
+    with source.flask.app_context():
+        battle_round = BattleState(battle_id).battle_round
+    assert plan_cache.claim(battle_id, battle_round)
+    prefetch_opponent_plan_task(battle_id, battle_round)
+    return battle_round
+
+
+def test_plan_prefetched_on_free_slot(redis, planner, battle_id):
+    battle_round = prefetch(battle_id)
+
+    assert planner == [battle_id]
+    assert plan_cache.get(battle_id, battle_round)["plan"] == f"plan of round {battle_round}"
+
+
+def test_plan_skipped_without_free_slot(redis, monkeypatch, planner, battle_id):
+    from backend.src.admission import admission
+
+    monkeypatch.setattr(admission, "enabled", True)
+    # Every slot is taken by chat turns
+    monkeypatch.setattr(admission, "limit", 0)
+
+    battle_round = prefetch(battle_id)
+
+    assert planner == []
+    # The claim is released, the plan can be scheduled again
+    assert plan_cache.claim(battle_id, battle_round)
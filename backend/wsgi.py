@@ -0,0 +1,11 @@
+# backend/wsgi.py
+# WSGI entry point, from the repository root:
+#   gunicorn -c backend/gunicorn.conf.py backend.wsgi:app
+#   flask --app backend.wsgi run
+from backend.src.factory import create_app
+
+app = create_app()
+
+
+if __name__ == '__main__':
+    app.run(debug=True, host='0.0.0.0', port=5000) # Set debug=False for production
@@ -37,7 +37,7 @@ export async function createBattle(gameSettings: Battle){
 
 export async function getBattleByUserId() {
     console.log("Fetching battle data for user:", user.id);
-    const url = `${API_HOST}/api/battles?user_id=${user.id}`;
+    const url = `${API_HOST}/api/battles?user_id=${user.id}&archived=false&limit=1&include=battle_log`;
     console.log("Fetching battle from url:", url);
     try {
         const response = await fetch(url, {
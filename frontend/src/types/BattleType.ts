@@ -27,7 +27,7 @@ export function defaultArmyDetails(): ArmyDetails {
 export interface BattleLog { // The history of combat messages will be of the form { 1: { "message": "text", "creator": "user"}, 2: { "message": "text", "creator": "ai"}}
   [key: number]: {
     message: string;
-    creator: "user" | "ai";
+    creator: "user" | "ai" | "combat"; // "combat": results of the combat engine the AI called during its reply
   };
 }
 
@@ -57,9 +57,11 @@ export interface Battle {
 
 // Function to convert API battle object to Battle type
 export function fromApiBattle(apiBattle: any): Battle {
+  // Nested fields are sent as JSON objects, older responses sent them as JSON encoded strings
   function safeParse(val: any, fallback: any) {
     try {
       if (!val || val === "undefined") return fallback;
+      if (typeof val === "object") return val;
       return JSON.parse(val);
     } catch {
       return fallback;